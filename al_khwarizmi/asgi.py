@@ -3,6 +3,10 @@ ASGI config for al_khwarizmi project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Production runs it under gunicorn with uvicorn workers (see Procfile), so the
+async views in problems.views_gemini keep Gemini calls in flight on the event
+loop instead of blocking a worker thread per request.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -119,6 +119,25 @@ else:
         }
     }
 
+# Cache
+# Общий кеш (Redis) нужен, чтобы версии индексов и счетчики были видны всем
+# gunicorn-воркерам. Без REDIS_URL используем локальный кеш процесса.
+REDIS_URL = config('REDIS_URL', default=None)
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -6,6 +6,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
+from core.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -15,6 +16,7 @@ urlpatterns = [
     path('api/user/', include('users.urls')),
     path('api/problems/', include('problems.urls')),
     path('api/arena/', include('arena.urls')),
+    path('api/metrics/', metrics_view, name='metrics'),
     
     # Frontend - serve index.html for all other routes
     path('', TemplateView.as_view(template_name='index.html'), name='home'),
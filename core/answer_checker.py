@@ -0,0 +1,357 @@
+"""
+Локальная проверка ответов без обращения к Gemini
+Уровни: точное совпадение после нормализации, затем эквивалентность через SymPy.
+Если локально решить нельзя (текстовый или символьный ответ) - возвращается None,
+и проверка передается Gemini.
+"""
+
+import ast
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .math_validator import get_math_validator
+
+# Уровни проверки для ai_analysis['check_tier']
+TIER_EXACT = 'exact'
+TIER_SYMPY = 'sympy'
+TIER_GEMINI = 'gemini'
+TIER_CACHE = 'cache'
+
+# Ответы длиннее не разбираем SymPy
+MAX_ANSWER_LENGTH = 100
+
+# Разделители нескольких ответов: "2; 3", "2, 3", "2 и 3"
+_SEPARATORS_RE = re.compile(r';|,\s+|\s+(?:и|или|or|and)\s+', re.IGNORECASE)
+
+# Префиксы вида "x =", "x1 =", "x_2=" (буква - имя переменной)
+_VARIABLE_PREFIX_RE = re.compile(r'^([a-zа-я])_?\d*\s*=\s*', re.IGNORECASE)
+
+# Десятичная запятая: "0,5" -> "0.5". Без других разделителей в ответе запятая
+# неоднозначна: "-2,3" - это и -2.3, и корни -2 и 3 (так ответ читает validate_problem_payload)
+_DECIMAL_COMMA_RE = re.compile(r'(?<=\d),(?=\d)')
+
+# Имена, которые можно передать в sympify (остальной ввод пользователя не исполняется)
+_ALLOWED_NAMES = {
+    'sqrt', 'pi', 'e', 'E', 'I', 'i', 'log', 'ln', 'exp',
+    'sin', 'cos', 'tan', 'cot', 'oo',
+}
+_SAFE_EXPRESSION_RE = re.compile(r'^[0-9a-zA-Z+\-*/^().\s]+$')
+_NAME_RE = re.compile(r'[a-zA-Z]+')
+
+_DECIMAL_RE = re.compile(r'^-?\d+\.(\d+)$')
+
+# Наибольший числовой показатель степени: 9**9**9 SymPy вычисляет минутами
+MAX_EXPONENT = 100
+
+
+def split_labelled_answers(answer: str, decimal_comma: bool = True) -> List[Tuple[str, str]]:
+    """
+    Разбивает ответ на отдельные значения с именами переменных
+
+    Args:
+        answer: Ответ, например "x = 3, y = 2"
+        decimal_comma: Запятая между цифрами - десятичная ("0,5" = 0.5), иначе разделитель
+
+    Returns:
+        Список (переменная или '', нормализованное значение), например [('x', '3'), ('y', '2')]
+    """
+    text = _DECIMAL_COMMA_RE.sub('.' if decimal_comma else '; ', answer.strip())
+    parts = []
+    for part in _SEPARATORS_RE.split(text):
+        part = part.strip().strip('{}[]')
+        match = _VARIABLE_PREFIX_RE.match(part)
+        label = match.group(1).lower() if match else ''
+        part = part[match.end():] if match else part
+        part = part.replace('−', '-').replace('×', '*').replace('·', '*').replace(':', '/')
+        part = part.replace('√', 'sqrt').replace('π', 'pi').replace('^', '**')
+        part = part.replace(' ', '').lower()
+        if part:
+            parts.append((label, part))
+    return parts
+
+
+def split_answers(answer: str) -> List[str]:
+    """
+    Разбивает ответ на отдельные значения и нормализует каждое
+
+    Args:
+        answer: Ответ, например "x1 = 2; x2 = 0,5"
+
+    Returns:
+        Список нормализованных значений, например ['2', '0.5']
+    """
+    return [value for _, value in split_labelled_answers(answer)]
+
+
+def _is_ambiguous_comma(answer: str) -> bool:
+    """Запятая между цифрами без других разделителей: "-2,3" - это и -2.3, и корни -2 и 3"""
+    return bool(_DECIMAL_COMMA_RE.search(answer)) and not _SEPARATORS_RE.search(answer)
+
+
+def _is_system(parts: List[Tuple[str, str]]) -> bool:
+    """Ответ системы: значения разных переменных ("x = 3, y = 2"), а не корни одной"""
+    return len({label for label, _ in parts if label}) > 1
+
+
+def _is_small_exponent(node: ast.AST) -> bool:
+    """Показатель - число не больше MAX_EXPONENT, простая дробь или переменная"""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        return _is_small_exponent(node.operand)
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, (int, float)) and abs(node.value) <= MAX_EXPONENT
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
+        return all(
+            isinstance(side, ast.Constant) and _is_small_exponent(side)
+            for side in (node.left, node.right)
+        )
+    return isinstance(node, ast.Name)
+
+
+def _is_growth(node: ast.AST) -> bool:
+    """Степень или экспонента - узлы, значение которых растет быстрее аргумента"""
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+        return True
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'exp'
+
+
+def _has_bounded_powers(expression: str) -> bool:
+    """
+    Степени и экспоненты без башен (9**9**9, exp(exp(exp(100)))) и без больших
+    показателей: sympify вычисляет их сразу
+    """
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            base, exponent = node.left, node.right
+        elif _is_growth(node):
+            if len(node.args) != 1 or node.keywords:
+                return False
+            base, exponent = None, node.args[0]
+        else:
+            continue
+        nested = base is not None and any(_is_growth(inner) for inner in ast.walk(base))
+        if nested or not _is_small_exponent(exponent):
+            return False
+    return True
+
+
+def _is_safe_expression(expression: str) -> bool:
+    """Выражение состоит только из чисел, операторов и разрешенных имен, степени ограничены"""
+    if len(expression) > MAX_ANSWER_LENGTH or not _SAFE_EXPRESSION_RE.match(expression):
+        return False
+    if not all(
+        name in _ALLOWED_NAMES or len(name) == 1
+        for name in _NAME_RE.findall(expression)
+    ):
+        return False
+    return _has_bounded_powers(expression)
+
+
+def canonical_answer(answer: str) -> str:
+    """
+    Каноническая форма ответа для ключа кеша вердиктов:
+    "x=5", "5.0" и "5" дают одну строку, порядок корней не важен.
+    Ответ системы сохраняет имена переменных: "x=3, y=2" и "x=2, y=3" различаются
+
+    Args:
+        answer: Ответ пользователя
+
+    Returns:
+        Значения в канонической форме, разделенные ';': корни отсортированы,
+        значения системы - "x=...;y=..." по именам (без имен - в исходном порядке)
+    """
+    from sympy import Rational, sympify
+
+    parts = split_labelled_answers(answer or '')
+    canonical = []
+    for label, part in parts:
+        if _is_safe_expression(part):
+            try:
+                # Десятичную дробь - в точную, иначе - стандартная запись SymPy
+                value = Rational(part) if _DECIMAL_RE.match(part) else sympify(part)
+                part = str(value).replace(' ', '')
+            except Exception:
+                pass
+        canonical.append((label, part))
+
+    if not _is_system(parts):
+        return ';'.join(sorted(part for _, part in canonical))
+    if all(label for label, _ in canonical):
+        canonical.sort()
+    return ';'.join(f'{label}={part}' if label else part for label, part in canonical)
+
+
+def problem_fingerprint(problem_data: Dict[str, Any]) -> str:
+    """Хеш содержимого задачи: одинаковые задачи дают одинаковый хеш при любом ID"""
+    payload = '\x1f'.join(
+        str(problem_data.get(field) or '')
+        for field in ('title', 'equation_to_solve', 'description', 'correct_answer')
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _compare_sympy(user_parts: List[str], correct_parts: List[str]) -> Optional[bool]:
+    """
+    Сопоставляет значения пользователя с правильными через SymPy
+
+    Returns:
+        True/False или None, если хотя бы одно сравнение не решено
+    """
+    if not all(_is_safe_expression(part) for part in user_parts + correct_parts):
+        return None
+
+    validator = get_math_validator()
+    remaining = list(correct_parts)
+    undecided = False
+
+    for user_part in user_parts:
+        matched = None
+        for correct_part in remaining:
+            verdict = validator.compare_answers(user_part, correct_part, rounded=True)
+            if verdict:
+                matched = correct_part
+                break
+            if verdict is None:
+                undecided = True
+        if matched is None:
+            return None if undecided else False
+        remaining.remove(matched)
+
+    if remaining:
+        return None if undecided else False
+    return True
+
+
+def _ordered_pairs(
+    user_parts: List[Tuple[str, str]],
+    correct_parts: List[Tuple[str, str]]
+) -> Optional[List[Tuple[str, str]]]:
+    """
+    Сопоставляет значения ответа системы: по именам переменных, если они
+    указаны с обеих сторон, иначе по порядку
+
+    Returns:
+        Пары (значение пользователя, правильное значение) или None, если
+        переменные или число значений не совпадают
+    """
+    if len(user_parts) != len(correct_parts):
+        return None
+    user_labels = [label for label, _ in user_parts]
+    correct_labels = [label for label, _ in correct_parts]
+    if all(user_labels) and all(correct_labels):
+        if len(set(user_labels)) != len(user_labels) or sorted(user_labels) != sorted(correct_labels):
+            return None
+        correct_by_label = dict(correct_parts)
+        return [(value, correct_by_label[label]) for label, value in user_parts]
+    return [(user_value, correct_value) for (_, user_value), (_, correct_value) in zip(user_parts, correct_parts)]
+
+
+def _compare_pairs(pairs: List[Tuple[str, str]]) -> Optional[bool]:
+    """
+    Сравнивает значения системы попарно через SymPy
+
+    Returns:
+        False, если хотя бы одно значение неверно; None, если сравнение не решено
+    """
+    if not all(_is_safe_expression(part) for pair in pairs for part in pair):
+        return None
+
+    validator = get_math_validator()
+    verdicts = [
+        validator.compare_answers(user_value, correct_value, rounded=True)
+        for user_value, correct_value in pairs
+    ]
+    if False in verdicts:
+        return False
+    if None in verdicts:
+        return None
+    return True
+
+
+def check_answer_locally(user_answer: str, correct_answer: str) -> Optional[Dict[str, Any]]:
+    """
+    Проверяет ответ пользователя без ИИ
+
+    Args:
+        user_answer: Ответ пользователя
+        correct_answer: Правильный ответ задачи
+
+    Returns:
+        Результат в формате GeminiService.check_solution с полем 'tier'
+        или None, если нужна проверка через Gemini
+    """
+    user_answer = user_answer or ''
+    correct_answer = correct_answer or ''
+
+    # Запятая между цифрами - десятичная, если правильный ответ - одно число ("0.5").
+    # Иначе "-2,3" - и -2.3, и два корня (как в validate_problem_payload): вердикт
+    # выносится, только если оба прочтения согласны
+    single = len(split_labelled_answers(correct_answer)) == 1 and not _is_ambiguous_comma(correct_answer)
+    if single or not (_is_ambiguous_comma(correct_answer) or _is_ambiguous_comma(user_answer)):
+        return _check_labelled(split_labelled_answers(user_answer), split_labelled_answers(correct_answer))
+
+    results = [
+        _check_labelled(
+            split_labelled_answers(user_answer, decimal_comma=decimal_comma),
+            split_labelled_answers(correct_answer, decimal_comma=decimal_comma)
+        )
+        for decimal_comma in (True, False)
+    ]
+    if None in results or results[0]['is_correct'] != results[1]['is_correct']:
+        return None
+    return results[0]
+
+
+def _check_labelled(
+    user_labelled: List[Tuple[str, str]],
+    correct_labelled: List[Tuple[str, str]]
+) -> Optional[Dict[str, Any]]:
+    """Проверка разобранных ответов: точное совпадение, затем SymPy (см. check_answer_locally)"""
+    if not user_labelled or not correct_labelled:
+        return None
+
+    # Ответ системы ("x = 3, y = 2") сравнивается по переменным, корни - как множество
+    pairs = None
+    if _is_system(user_labelled) or _is_system(correct_labelled):
+        pairs = _ordered_pairs(user_labelled, correct_labelled)
+        if pairs is None:
+            return None
+        exact = all(user_value == correct_value for user_value, correct_value in pairs)
+    else:
+        user_parts = [value for _, value in user_labelled]
+        correct_parts = [value for _, value in correct_labelled]
+        exact = sorted(user_parts) == sorted(correct_parts)
+
+    # Уровень 1: точное совпадение (порядок корней не важен)
+    if exact:
+        return {
+            'is_correct': True,
+            'feedback': 'Верно! Ответ совпадает с правильным.',
+            'confidence': 1.0,
+            'explanation': 'Точное совпадение с правильным ответом',
+            'tier': TIER_EXACT,
+        }
+
+    # Уровень 2: эквивалентность через SymPy (0.5 и 1/2, 2*sqrt(2) и sqrt(8))
+    if pairs is not None:
+        verdict = _compare_pairs(pairs)
+    else:
+        verdict = _compare_sympy(user_parts, correct_parts)
+    if verdict is None:
+        return None
+
+    if verdict:
+        feedback = 'Верно! Ответ эквивалентен правильному.'
+    else:
+        feedback = 'Неверно. Проверьте вычисления.'
+    return {
+        'is_correct': verdict,
+        'feedback': feedback,
+        'confidence': 0.99,
+        'explanation': 'Проверено через SymPy',
+        'tier': TIER_SYMPY,
+    }
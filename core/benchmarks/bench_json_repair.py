@@ -0,0 +1,132 @@
+"""
+Бенчмарк разбора JSON из ответов LLM на корпусе типичных дефектов
+Сравнивает parse_llm_json с прежними парсерами GeminiService._parse_gemini_json
+(до шести полных json.loads) и BookImporter._parse_gemini_response
+(регулярные выражения и json.loads по объектам)
+
+Запуск: python -m core.benchmarks.bench_json_repair [--number 200] [--book-size 300]
+"""
+
+import argparse
+import json
+import re
+import timeit
+
+from core.json_repair import parse_llm_json
+
+
+# Прежние реализации для сравнения
+
+def _legacy_problem_json(response_text):
+    attempts = [
+        lambda t: t,
+        lambda t: t.replace('\\\\', '\\'),
+        lambda t: t.replace('\\cdot', '*').replace('\\div', '/').replace('\\times', '*'),
+        lambda t: re.sub(r'\\text\{([^}]*)\}', r'\1', t),
+        lambda t: re.sub(r'\\(?![nt"])', '', t),
+        lambda t: t.replace('\\', '').replace('\n', ' '),
+    ]
+    for clean_func in attempts:
+        try:
+            return json.loads(clean_func(response_text))
+        except json.JSONDecodeError:
+            continue
+    raise ValueError('Все попытки парсинга JSON провалились')
+
+
+def _legacy_book_json(response_text):
+    json_match = re.search(r'```json\s*([\s\S]*?)\s*```', response_text, re.DOTALL)
+    if json_match:
+        json_str = json_match.group(1).strip()
+    else:
+        json_match = re.search(r'\[\s*\{[\s\S]*\}\s*\]', response_text, re.DOTALL)
+        json_str = json_match.group(0) if json_match else response_text.strip()
+    try:
+        problems = json.loads(json_str)
+    except json.JSONDecodeError:
+        problems = []
+        for obj_str in re.findall(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', json_str, re.DOTALL):
+            try:
+                problems.append(json.loads(obj_str))
+            except json.JSONDecodeError:
+                continue
+    return problems if isinstance(problems, list) else [problems]
+
+
+def _new_book_json(response_text):
+    problems, _ = parse_llm_json(response_text)
+    return problems if isinstance(problems, list) else [problems]
+
+
+# Корпус: ответы с типичными дефектами
+
+def _problem(index):
+    return {
+        'title': f'Задача {index}',
+        'problem_text': f'Решите уравнение $\\frac{{x}}{{2}} + {index} = {index + 3}$',
+        'equation_to_solve': f'\\frac{{x}}{{2}} + {index} = {index + 3}',
+        'correct_answer': '6',
+        'solution_steps': ['\\frac{x}{2} = 3', 'x = 3 \\times 2', 'x = 6'],
+        'hints': ['Умножьте обе части на 2'],
+        'difficulty': 800 + index,
+    }
+
+
+def _raw_latex(text):
+    """Как пишет модель: одиночные обратные слэши LaTeX"""
+    return text.replace('\\\\', '\\')
+
+
+def build_corpus(book_size):
+    problem = json.dumps(_problem(1), ensure_ascii=False)
+    book = json.dumps([_problem(i) for i in range(book_size)], ensure_ascii=False)
+    return [
+        ('задача: корректный JSON', problem, 'problem'),
+        ('задача: LaTeX без экранирования', _raw_latex(problem), 'problem'),
+        ('задача: ```json и висячая запятая', f'```json\n{problem[:-1]},}}\n```', 'problem'),
+        ('книга: корректный JSON', f'```json\n{book}\n```', 'book'),
+        ('книга: LaTeX без экранирования', _raw_latex(book), 'book'),
+        ('книга: ответ оборван', _raw_latex(book)[:len(book) * 9 // 10], 'book'),
+    ]
+
+
+def _run(func, text):
+    try:
+        return func(text)
+    except ValueError:
+        return None
+
+
+def _describe(result, kind):
+    if result is None:
+        return 'ошибка'
+    if kind == 'book':
+        intact = sum(1 for item in result if '\\frac' in item.get('equation_to_solve', ''))
+        return f'{len(result)} задач, LaTeX цел: {intact}'
+    return 'LaTeX цел' if '\\frac' in result.get('equation_to_solve', '') else 'LaTeX искажен'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=200, help='Разборов на замер')
+    parser.add_argument('--book-size', type=int, default=300, help='Задач в ответе "книги"')
+    args = parser.parse_args()
+
+    parsers = {
+        'problem': (_legacy_problem_json, lambda text: parse_llm_json(text)[0]),
+        'book': (_legacy_book_json, _new_book_json),
+    }
+
+    for name, text, kind in build_corpus(args.book_size):
+        number = max(1, args.number // 20) if kind == 'book' else args.number
+        print(f"📄 {name} | {len(text) / 1024:.1f} КБ")
+        timings = []
+        for label, func in zip(('прежний', 'новый'), parsers[kind]):
+            elapsed = min(timeit.repeat(lambda: _run(func, text), number=number, repeat=3))
+            timings.append(elapsed / number * 1e3)
+            print(f"   {label:<9}{timings[-1]:>10.3f} мс | {_describe(_run(func, text), kind)}")
+        print(f"   ускорение: {timings[0] / timings[1]:.1f}x\n")
+
+
+if __name__ == '__main__':
+    main()
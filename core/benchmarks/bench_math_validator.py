@@ -0,0 +1,100 @@
+"""
+Бенчмарк числовой проверки MathValidator против simplify
+Случаи из core/tests/test_math_validator.py и несколько с иррациональными
+корнями и символьными ответами. Два замера: полная проверка с пустым кешем
+решений и проверка с уже решенным уравнением (кеш решений заполнен,
+подстановки корней и сравнения выражений выполняются заново)
+
+Запуск: python -m core.benchmarks.bench_math_validator [--number 50]
+"""
+
+import argparse
+import logging
+import timeit
+from unittest import mock
+
+from core import math_validator
+from core.math_validator import MathValidator
+
+EQUATION = 'equation'
+IRRATIONAL = 'irrational'
+EQUIVALENCE = 'equivalence'
+
+# (название, вид проверки, аргументы)
+TEST_CASES = [
+    ('линейное, верный корень', EQUATION, ('x + 5 = 12', ['7'])),
+    ('квадратное, оба корня', EQUATION, ('x^2 - 5*x + 6 = 0', ['2', '3'])),
+    ('линейное, неверный корень', EQUATION, ('x + 5 = 12', ['10'])),
+    ('квадратное, пропущен корень', EQUATION, ('x^2 - 5*x + 6 = 0', ['2'])),
+    ('иррациональное, верный корень', IRRATIONAL, ('sqrt(x+5) = x-1', ['4'])),
+    ('иррациональное, посторонний корень', IRRATIONAL, ('sqrt(x+5) = x-1', ['-1', '4'])),
+    ('иррациональное sqrt(2x+3) = x', IRRATIONAL, ('sqrt(2*x+3) = x', ['3'])),
+    ('эквивалентность 0.5 и 1/2', EQUIVALENCE, ('0.5', '1/2')),
+    ('эквивалентность 2*x и x*2', EQUIVALENCE, ('2*x', 'x*2')),
+    ('эквивалентность 3 и 4', EQUIVALENCE, ('3', '4')),
+]
+
+EXTRA_CASES = [
+    ('квадратное, корни 2 ± sqrt(3)', EQUATION, ('x^2 - 4*x + 1 = 0', ['2 + sqrt(3)', '2 - sqrt(3)'])),
+    ('кубическое, корень 2**(1/3)', EQUATION, ('x^3 = 2', ['2**(1/3)'])),
+    ('эквивалентность (x+1)^2', EQUIVALENCE, ('(x+1)**2', 'x**2 + 2*x + 1')),
+    ('эквивалентность дробей', EQUIVALENCE, ('(x**2 - 1)/(x - 1)', 'x + 1')),
+    ('неэквивалентные выражения', EQUIVALENCE, ('2*x', 'x + 1')),
+]
+
+
+def _run(kind, args, validator=None):
+    validator = validator or MathValidator()
+    if kind == EQUATION:
+        return validator.validate_equation_solution(*args)['is_valid']
+    if kind == IRRATIONAL:
+        return validator.validate_irrational_equation(*args)['is_valid']
+    return validator.compare_answers(*args)
+
+
+def _run_solved(kind, args, validator):
+    """Проверка с решением из кеша: сбрасываются только результаты подстановок"""
+    for solved in validator.solve_cache.values():
+        solved.checks.clear()
+    return _run(kind, args, validator)
+
+
+def _measure(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=50, help='Проверок на замер')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    totals = {'cold': [0.0, 0.0], 'solved': [0.0, 0.0]}
+    for title, cases in (('Случаи из test_math_validator.py', TEST_CASES), ('Дополнительные случаи', EXTRA_CASES)):
+        print(f"📄 {title}")
+        print(f"   {'':<38}{'пустой кеш, мс':>24}   {'уравнение решено, мс':>26}")
+        for name, kind, case_args in cases:
+            timings = {'cold': [], 'solved': []}
+            results = []
+            for fast_path in (False, True):
+                with mock.patch.object(math_validator, 'MATH_NUMERIC_FAST_PATH', fast_path):
+                    validator = MathValidator()
+                    results.append(_run(kind, case_args, validator))
+                    timings['cold'].append(_measure(lambda: _run(kind, case_args), args.number))
+                    timings['solved'].append(_measure(lambda: _run_solved(kind, case_args, validator), args.number))
+            line = f"   {name:<38}"
+            for key in ('cold', 'solved'):
+                before, after = timings[key]
+                totals[key] = [totals[key][0] + before, totals[key][1] + after]
+                line += f"{before:>8.2f} -> {after:>6.2f} ({before / after:>4.1f}x)  "
+            same = 'совпадает' if results[0] == results[1] else f'РАЗЛИЧАЕТСЯ: {results}'
+            print(f"{line}| результат {same}")
+        print()
+
+    for key, label in (('cold', 'пустой кеш'), ('solved', 'уравнение решено')):
+        before, after = totals[key]
+        print(f"Итого ({label}): {before:.2f} мс -> {after:.2f} мс ({before / after:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
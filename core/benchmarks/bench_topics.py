@@ -0,0 +1,70 @@
+"""
+Микро-бенчмарк выбора тем из каталога MATH_TOPICS_DATABASE
+Сравнивает индексированные функции с прежним линейным перебором
+
+Запуск: python -m core.benchmarks.bench_topics [--number 2000]
+"""
+
+import argparse
+import random
+import timeit
+
+from core.math_topics_database import (
+    MATH_TOPICS_DATABASE,
+    get_random_topic_for_grade,
+    get_topic_by_difficulty,
+    get_topics_by_grade,
+)
+
+
+# Прежние реализации (линейный перебор всего каталога) для сравнения
+
+def _linear_topics_by_grade(grade, max_topics=50):
+    suitable = [t for t in MATH_TOPICS_DATABASE if t['grade_min'] <= grade <= t['grade_max']]
+    suitable.sort(key=lambda x: x['difficulty_min'])
+    return suitable[:max_topics]
+
+
+def _linear_topic_by_difficulty(difficulty, grade=None):
+    suitable = [
+        t for t in MATH_TOPICS_DATABASE
+        if t['difficulty_min'] <= difficulty <= t['difficulty_max']
+        and (grade is None or t['grade_min'] <= grade <= t['grade_max'])
+    ]
+    return random.choice(suitable) if suitable else None
+
+
+def _linear_random_topic_for_grade(grade):
+    topics = _linear_topics_by_grade(grade, max_topics=1000)
+    return random.choice(topics) if topics else None
+
+
+CASES = [
+    ('get_topics_by_grade', lambda g, d: _linear_topics_by_grade(g), lambda g, d: get_topics_by_grade(g)),
+    ('get_topic_by_difficulty', _linear_topic_by_difficulty, get_topic_by_difficulty),
+    ('get_random_topic_for_grade', lambda g, d: _linear_random_topic_for_grade(g), lambda g, d: get_random_topic_for_grade(g)),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=2000, help='Вызовов на замер')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    inputs = [(rng.randint(1, 12), rng.randint(0, 3000)) for _ in range(args.number)]
+
+    print(f"📊 Тем в каталоге: {len(MATH_TOPICS_DATABASE)} | Вызовов: {args.number}\n")
+    print(f"{'Функция':<28}{'линейно, мкс':>14}{'индекс, мкс':>14}{'ускорение':>12}")
+    for name, linear, indexed in CASES:
+        timings = []
+        for func in (linear, indexed):
+            elapsed = min(timeit.repeat(
+                lambda: [func(g, d) for g, d in inputs], number=1, repeat=3
+            ))
+            timings.append(elapsed / args.number * 1e6)
+        print(f"{name:<28}{timings[0]:>14.2f}{timings[1]:>14.2f}{timings[0] / timings[1]:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
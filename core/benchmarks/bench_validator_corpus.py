@@ -0,0 +1,402 @@
+"""
+Бенчмарк MathValidator на корпусе уравнений из каталога тем
+Корпус генерируется детерминированно (--seed) по темам MATH_TOPICS_DATABASE:
+линейные, квадратные, иррациональные, дробно-рациональные и тригонометрические
+уравнения со сложностью из диапазона темы. Для каждого метода - p50/p95
+времени, таймауты, ошибки, расхождения с ожидаемым вердиктом и пик памяти
+(прирост над памятью до вызова, tracemalloc, отдельным проходом). Результаты пишутся в JSON (--output)
+и сравниваются с прежним запуском (--baseline).
+
+Запуск: python -m core.benchmarks.bench_validator_corpus [--size 400] [--timeout 5]
+        [--output results.json] [--baseline baseline.json]
+"""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import signal
+import statistics
+import time
+import tracemalloc
+from fractions import Fraction
+
+import sympy
+
+from core import math_validator
+from core.math_topics_database import MATH_TOPICS_DATABASE
+from core.math_validator import MathValidator
+
+LINEAR = 'linear'
+QUADRATIC = 'quadratic'
+IRRATIONAL = 'irrational'
+RATIONAL = 'rational'
+TRIG = 'trig'
+
+# Семейство -> слова в названии темы каталога
+FAMILY_TOPICS = {
+    LINEAR: ('Линейные уравнения', 'Простые уравнения'),
+    QUADRATIC: ('Квадратные уравнения', 'Биквадратные', 'приводимые к квадратным'),
+    IRRATIONAL: ('Иррациональные уравнения',),
+    RATIONAL: ('Дробно-рациональные', 'Уравнения с дробями'),
+    TRIG: ('Тригонометрические уравнения',),
+}
+
+# Тригонометрические уравнения f(x) = v, их решения в форме SymPy
+# и другая запись первого решения
+TRIG_TABLE = [
+    ('sin(x)', '1/2', ['pi/6', '5*pi/6'], 'asin(1/2)'),
+    ('cos(x)', '1/2', ['pi/3', '5*pi/3'], 'acos(1/2)'),
+    ('tan(x)', '1', ['pi/4'], 'atan(1)'),
+    ('sin(x)', '-sqrt(2)/2', ['-pi/4', '5*pi/4'], '-asin(sqrt(2)/2)'),
+    ('cos(x)', '-1', ['pi'], 'acos(-1)'),
+    ('2*sin(x)**2 - sin(x)', '1', ['-pi/6', 'pi/2', '7*pi/6'], 'asin(-1/2)'),
+    ('sin(2*x)', '0', ['0', 'pi/2'], 'asin(0)'),
+    ('cos(x)**2', '1/4', ['pi/3', '2*pi/3', '4*pi/3', '5*pi/3'], 'acos(1/2)'),
+    ('tan(x)', 'sqrt(3)', ['pi/3'], 'atan(sqrt(3))'),
+    ('sin(x/2)', '1', ['pi'], '2*asin(1)'),
+]
+
+METHODS = ('_parse_equation', 'validate_equation_solution', 'validate_irrational_equation', 'validate_answer_equivalence')
+
+
+class _Timeout(BaseException):
+    """Превышен лимит времени вызова (BaseException: методы валидатора ловят Exception)"""
+
+
+def _on_alarm(signum, frame):
+    raise _Timeout()
+
+
+def _family_topics():
+    """Темы каталога для каждого семейства уравнений"""
+    topics = {}
+    for family, keywords in FAMILY_TOPICS.items():
+        topics[family] = [
+            topic for topic in MATH_TOPICS_DATABASE
+            if any(keyword in topic['topic'] for keyword in keywords)
+        ]
+    return topics
+
+
+def _scale(difficulty):
+    """Размах коэффициентов растет со сложностью темы"""
+    return 3 + max(0, difficulty - 500) // 80
+
+
+def _number(value):
+    value = Fraction(value)
+    return str(value.numerator) if value.denominator == 1 else f'{value.numerator}/{value.denominator}'
+
+
+def _plus(value):
+    """Слагаемое со знаком: 3 -> '+ 3', -3 -> '- 3'"""
+    return f'+ {_number(value)}' if value >= 0 else f'- {_number(-value)}'
+
+
+def _linear(rng, k):
+    a = rng.choice([i for i in range(-k, k + 1) if i not in (0, 1)])
+    root = Fraction(rng.randint(-k, k), rng.choice((1, 1, 2, 3)))
+    b = rng.randint(-k * 2, k * 2)
+    c = a * root + b
+    return f'{a}*x {_plus(b)} = {_number(c)}', [_number(root)], f'{_number(root * 2)}/2', True
+
+
+def _quadratic(rng, k):
+    if rng.random() < 0.25:
+        # Иррациональные корни m ± sqrt(d)
+        m, d = rng.randint(1, k), rng.choice((2, 3, 5, 6, 7))
+        roots = [str(sympy.sympify(f'{m} - sqrt({d})')), str(sympy.sympify(f'{m} + sqrt({d})'))]
+        return f'x^2 - {2 * m}*x {_plus(m * m - d)} = 0', roots, f'{m} - sqrt({4 * d})/2', True
+    r1, r2 = rng.randint(-k, k), rng.randint(-k, k)
+    a = rng.choice((1, 1, 2, 3))
+    roots = sorted({r1, r2})
+    return (
+        f'{a}*x^2 {_plus(-a * (r1 + r2))}*x {_plus(a * r1 * r2)} = 0',
+        [str(r) for r in roots],
+        f'{roots[0]}.0',
+        True,
+    )
+
+
+def _irrational(rng, k):
+    # sqrt(a*x + b) = x + c с корнем r (r + c >= 0); второй корень квадрата
+    # (x + c)^2 = a*x + b по теореме Виета - посторонний, если other + c < 0
+    r = rng.randint(0, k)
+    c = rng.randint(-r, k)
+    a = rng.randint(1, k)
+    b = (r + c) ** 2 - a * r
+    other = a - 2 * c - r
+    equation = f'sqrt({a}*x {_plus(b)}) = x {_plus(c)}'
+    if other + c >= 0:
+        roots = sorted({r, other})
+        equivalent = f'sqrt({roots[0] ** 2})' if roots[0] >= 0 else f'-sqrt({roots[0] ** 2})'
+        return equation, [str(root) for root in roots], equivalent, True
+    if rng.random() < 0.5:
+        # Посторонний корень в ответе - ответ невалиден
+        return equation, [str(r), str(other)], f'sqrt({r * r})', False
+    return equation, [str(r)], f'sqrt({r * r})', True
+
+
+def _rational(rng, k):
+    # a/(x + b) = c с корнем a/c - b
+    a = rng.choice([i for i in range(-k * 2, k * 2 + 1) if i])
+    c = rng.choice([i for i in range(-k, k + 1) if i])
+    b = rng.randint(-k, k)
+    root = Fraction(a, c) - b
+    return f'{a}/(x {_plus(b)}) = {c}', [_number(root)], f'({_number(root)})*1', True
+
+
+def _trig(rng, k):
+    function, value, answers, equivalent = rng.choice(TRIG_TABLE)
+    coefficient = rng.randint(1, max(1, k // 4))
+    if coefficient == 1:
+        return f'{function} = {value}', list(answers), equivalent, True
+    return f'{coefficient}*({function}) = {coefficient}*({value})', list(answers), equivalent, True
+
+
+# Генератор: (rng, размах коэффициентов) -> (уравнение, ответы, другая запись
+# первого ответа, валиден ли ответ)
+GENERATORS = {LINEAR: _linear, QUADRATIC: _quadratic, IRRATIONAL: _irrational, RATIONAL: _rational, TRIG: _trig}
+
+
+def build_corpus(size, seed):
+    """
+    Корпус уравнений по темам каталога
+
+    Returns:
+        Список dict: family, topic, difficulty, equation, answers, expected_valid,
+        equivalent (другая запись первого ответа), expected_equivalent
+    """
+    rng = random.Random(seed)
+    topics = _family_topics()
+    families = list(GENERATORS)
+    corpus = []
+    for index in range(size):
+        family = families[index % len(families)]
+        topic = topics[family][(index // len(families)) % len(topics[family])]
+        difficulty = rng.randint(topic['difficulty_min'], topic['difficulty_max'])
+        equation, answers, equivalent, valid = GENERATORS[family](rng, _scale(difficulty))
+        # Каждое десятое уравнение - с заведомо неверным ответом
+        expected_equivalent = True
+        if family != TRIG and rng.random() < 0.1:
+            answers = [f'{answers[0]} + 1'] + answers[1:]
+            expected_equivalent = False
+        expected_valid = expected_equivalent and valid
+        corpus.append({
+            'family': family,
+            'topic': topic['topic'],
+            'difficulty': difficulty,
+            'equation': equation,
+            'answers': answers,
+            'expected_valid': expected_valid,
+            'equivalent': equivalent,
+            'expected_equivalent': expected_equivalent,
+        })
+    return corpus
+
+
+def _calls(validator, case):
+    """Вызовы методов для одного уравнения: (метод, функция, ожидаемый результат)"""
+    var = sympy.symbols('x')
+    calls = [('_parse_equation', lambda: validator._parse_equation(case['equation'], var) is not None, True)]
+    if case['family'] == IRRATIONAL:
+        calls.append((
+            'validate_irrational_equation',
+            lambda: validator.validate_irrational_equation(case['equation'], case['answers'])['is_valid'],
+            case['expected_valid'],
+        ))
+    else:
+        calls.append((
+            'validate_equation_solution',
+            lambda: validator.validate_equation_solution(case['equation'], case['answers'])['is_valid'],
+            case['expected_valid'],
+        ))
+    calls.append((
+        'validate_answer_equivalence',
+        lambda: validator.validate_answer_equivalence(case['answers'][0], case['equivalent']),
+        case['expected_equivalent'],
+    ))
+    return calls
+
+
+def _run_pass(corpus, timeout, memory):
+    """
+    Один проход по корпусу: кеш решений очищается перед каждым вызовом
+
+    Returns:
+        {метод: [{family, ms, outcome, expected, peak_kb}]}
+    """
+    validator = MathValidator()
+    samples = {method: [] for method in METHODS}
+    use_alarm = timeout > 0 and hasattr(signal, 'setitimer')
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+    if memory:
+        tracemalloc.start()
+    try:
+        for case in corpus:
+            for method, call, expected in _calls(validator, case):
+                validator.solve_cache.clear()
+                if memory:
+                    tracemalloc.reset_peak()
+                    baseline_bytes = tracemalloc.get_traced_memory()[0]
+                started = time.perf_counter()
+                try:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, timeout)
+                    outcome = bool(call())
+                except _Timeout:
+                    outcome = 'timeout'
+                except Exception:
+                    outcome = 'error'
+                finally:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                samples[method].append({
+                    'family': case['family'],
+                    'ms': elapsed_ms,
+                    'outcome': outcome,
+                    'expected': expected,
+                    'peak_kb': (tracemalloc.get_traced_memory()[1] - baseline_bytes) / 1024 if memory else None,
+                })
+    finally:
+        if memory:
+            tracemalloc.stop()
+        if use_alarm:
+            signal.signal(signal.SIGALRM, previous)
+    return samples
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+def _summary(samples):
+    timings = [s['ms'] for s in samples]
+    return {
+        'calls': len(samples),
+        'p50_ms': _percentile(timings, 50),
+        'p95_ms': _percentile(timings, 95),
+        'max_ms': max(timings) if timings else None,
+        'timeouts': sum(s['outcome'] == 'timeout' for s in samples),
+        'errors': sum(s['outcome'] == 'error' for s in samples),
+        'mismatches': sum(isinstance(s['outcome'], bool) and s['outcome'] != s['expected'] for s in samples),
+    }
+
+
+def build_results(corpus, timing, memory, args):
+    """Машиночитаемые результаты: по методам и по семействам внутри метода"""
+    methods = {}
+    for method in METHODS:
+        if not timing[method]:
+            continue
+        summary = _summary(timing[method])
+        if memory:
+            peaks = [s['peak_kb'] for s in memory[method]]
+            summary.update({
+                'peak_kb_p50': _percentile(peaks, 50),
+                'peak_kb_p95': _percentile(peaks, 95),
+                'peak_kb_max': max(peaks),
+            })
+        summary['families'] = {
+            family: _summary([s for s in timing[method] if s['family'] == family])
+            for family in GENERATORS
+            if any(s['family'] == family for s in timing[method])
+        }
+        methods[method] = summary
+
+    return {
+        'meta': {
+            'corpus_size': len(corpus),
+            'seed': args.seed,
+            'timeout_s': args.timeout,
+            'numeric_fast_path': math_validator.MATH_NUMERIC_FAST_PATH,
+            'python': platform.python_version(),
+            'sympy': sympy.__version__,
+            'platform': platform.platform(),
+        },
+        'methods': methods,
+    }
+
+
+def _format_ms(value):
+    return f"{value:>9.2f}" if value is not None else f"{'-':>9}"
+
+
+def print_results(results, baseline=None):
+    meta = results['meta']
+    print(f"📊 Уравнений: {meta['corpus_size']} | seed: {meta['seed']} | лимит: {meta['timeout_s']} сек"
+          f" | SymPy {meta['sympy']}\n")
+    print(f"{'Метод':<30}{'вызовов':>8}{'p50, мс':>9}{'p95, мс':>9}{'max, мс':>9}"
+          f"{'таймауты':>10}{'ошибки':>8}{'расхожд.':>10}{'пик p95, КБ':>13}")
+    for method, summary in results['methods'].items():
+        peak = summary.get('peak_kb_p95')
+        print(
+            f"{method:<30}{summary['calls']:>8}{_format_ms(summary['p50_ms'])}{_format_ms(summary['p95_ms'])}"
+            f"{_format_ms(summary['max_ms'])}{summary['timeouts']:>10}{summary['errors']:>8}"
+            f"{summary['mismatches']:>10}{(f'{peak:.0f}' if peak is not None else '-'):>13}"
+        )
+        for family, family_summary in summary['families'].items():
+            print(f"   {family:<27}{family_summary['calls']:>8}{_format_ms(family_summary['p50_ms'])}"
+                  f"{_format_ms(family_summary['p95_ms'])}{_format_ms(family_summary['max_ms'])}"
+                  f"{family_summary['timeouts']:>10}{family_summary['errors']:>8}{family_summary['mismatches']:>10}")
+
+    if baseline:
+        print("\n📈 Сравнение с baseline (p50 / p95):")
+        for method, summary in results['methods'].items():
+            before = baseline.get('methods', {}).get(method)
+            if not before:
+                print(f"   {method:<30} нет в baseline")
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms'):
+                if before.get(key) and summary.get(key):
+                    changes.append(f"{before[key]:.2f} -> {summary[key]:.2f} мс ({summary[key] / before[key]:.2f}x)")
+            timeouts = f"таймауты {before.get('timeouts', 0)} -> {summary['timeouts']}"
+            print(f"   {method:<30} {' | '.join(changes)} | {timeouts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=400, help='Уравнений в корпусе')
+    parser.add_argument('--seed', type=int, default=42, help='Seed генерации корпуса')
+    parser.add_argument('--timeout', type=float, default=5.0, help='Лимит одного вызова, сек (0 - без лимита)')
+    parser.add_argument('--no-memory', action='store_true', help='Не измерять память (проход с tracemalloc)')
+    parser.add_argument('--output', help='Записать результаты в JSON')
+    parser.add_argument('--baseline', help='JSON прежнего запуска для сравнения')
+    parser.add_argument('--dump-corpus', help='Записать корпус в JSON')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    corpus = build_corpus(args.size, args.seed)
+    if args.dump_corpus:
+        with open(args.dump_corpus, 'w', encoding='utf-8') as f:
+            json.dump(corpus, f, ensure_ascii=False, indent=2)
+
+    # Прогрев: импорт и внутренние кеши SymPy не должны попасть в замер
+    _run_pass(corpus[:len(GENERATORS)], args.timeout, memory=False)
+    timing = _run_pass(corpus, args.timeout, memory=False)
+    memory = None if args.no_memory else _run_pass(corpus, args.timeout, memory=True)
+    results = build_results(corpus, timing, memory, args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
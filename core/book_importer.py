@@ -10,10 +10,12 @@ from typing import Dict, List, Any, Optional
 from pathlib import Path
 from django.db import transaction
 from django.core.files.uploadedfile import UploadedFile
-from decouple import config
-import google.generativeai as genai
 
 from problems.models import Problem, Topic
+from .json_repair import parse_llm_json
+from .llm_backends import create_llm_backend
+from .llm_guard import get_llm_guard
+from .metrics import get_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -24,13 +26,8 @@ class BookImporter:
     """
     
     def __init__(self):
-        """Инициализация с Gemini API"""
-        api_key = config('GEMINI_API_KEY', default=None)
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY не установлен")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        """Инициализация модели (бэкенд задается LLM_BACKEND)"""
+        self.model = create_llm_backend('gemini-2.0-flash-exp')
         logger.info("BookImporter инициализирован")
     
     def extract_problems_from_pdf(
@@ -90,13 +87,13 @@ class BookImporter:
             )
             
             # Отправляем PDF в Gemini для анализа
-            response = self.model.generate_content([
+            response = get_llm_guard().call(self.model.generate_content, [
                 {
                     'mime_type': 'application/pdf',
                     'data': pdf_base64
                 },
                 prompt
-            ])
+            ], operation='book_pdf')
             
             # Парсим ответ от Gemini
             problems_data = self._parse_gemini_response(response.text)
@@ -157,7 +154,7 @@ class BookImporter:
             
             full_prompt = f"{prompt}\n\n**ТЕКСТ С ЗАДАЧАМИ:**\n{text_content}"
             
-            response = self.model.generate_content(full_prompt)
+            response = get_llm_guard().call(self.model.generate_content, full_prompt, operation='book_text')
             
             problems_data = self._parse_gemini_response(response.text)
             
@@ -254,58 +251,25 @@ class BookImporter:
     def _parse_gemini_response(self, response_text: str) -> List[Dict[str, Any]]:
         """
         Парсит ответ от Gemini и извлекает JSON с задачами
+        Если ответ оборван, возвращаются все задачи, полученные целиком
         """
-        import json
-        import re
-        
         try:
-            # Ищем JSON в ответе (с или без маркеров ```json)
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1).strip()
-            else:
-                # Пробуем найти массив напрямую
-                json_match = re.search(r'\[\s*\{[\s\S]*\}\s*\]', response_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                else:
-                    # Последняя попытка - весь текст может быть JSON
-                    json_str = response_text.strip()
-            
-            # Пробуем распарсить
-            try:
-                problems = json.loads(json_str)
-            except json.JSONDecodeError:
-                # Если не получилось, пробуем найти и исправить частичный JSON
-                # Ищем начало массива и пытаемся найти все объекты
-                objects = re.findall(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', json_str, re.DOTALL)
-                if objects:
-                    problems = []
-                    for obj_str in objects:
-                        try:
-                            obj = json.loads(obj_str)
-                            problems.append(obj)
-                        except:
-                            continue
-                    if not problems:
-                        logger.warning("Не удалось извлечь задачи из ответа")
-                        logger.debug(f"Ответ Gemini (первые 1000 символов): {response_text[:1000]}")
-                        return []
-                else:
-                    logger.warning("JSON не найден в ответе Gemini")
-                    logger.debug(f"Ответ Gemini (первые 1000 символов): {response_text[:1000]}")
-                    return []
-            
-            if not isinstance(problems, list):
-                problems = [problems]
-            
-            logger.info(f"Извлечено {len(problems)} задач из ответа Gemini")
-            return problems
-            
-        except Exception as e:
-            logger.error(f"Ошибка при парсинге ответа: {str(e)}")
+            problems, fixes = parse_llm_json(response_text)
+        except ValueError as e:
+            get_metrics().increment('book_json_parse_total', result='failed')
+            logger.warning(f"Не удалось извлечь задачи из ответа: {e}")
             logger.debug(f"Ответ Gemini (первые 1000 символов): {response_text[:1000]}")
             return []
+        
+        get_metrics().increment('book_json_parse_total', result='repaired' if fixes else 'clean')
+        if fixes:
+            logger.info(f"JSON исправлен: {', '.join(fixes)}")
+        
+        if not isinstance(problems, list):
+            problems = [problems]
+        
+        logger.info(f"Извлечено {len(problems)} задач из ответа Gemini")
+        return problems
     
     def _save_problems_to_db(
         self,
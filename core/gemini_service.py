@@ -3,16 +3,23 @@
 Генерация задач и проверка решений через ИИ
 """
 
+import asyncio
 import json
-import re
 import logging
 import time
-from typing import Dict, Any, Optional
-from concurrent.futures import ThreadPoolExecutor
-import google.generativeai as genai
+import weakref
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from asgiref.sync import async_to_sync
 from decouple import config
-from .math_validator import get_math_validator
-from .math_topics_database import get_topic_by_difficulty, get_random_topic_for_grade
+from .json_repair import parse_llm_json
+from .json_stream import StreamingFieldExtractor
+from .llm_backends import create_llm_backend
+from .llm_guard import GEMINI_CALL_TIMEOUT, LLMUnavailableError, get_llm_guard
+from .math_validator import (
+    VERDICT_BUSY, VERDICT_FAIL, VERDICT_MEMORY, VERDICT_PASS, VERDICT_SKIPPED, VERDICT_TIMEOUT
+)
+from .metrics import get_metrics
+from .validation_pool import get_validation_pool
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -21,151 +28,41 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-class GeminiService:
-    """Класс для взаимодействия с Gemini API"""
-    
-    def __init__(self):
-        """Инициализация клиента Gemini"""
-        api_key = config('GEMINI_API_KEY', default=None)
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY не установлен в переменных окружения")
-        
-        # Конфигурируем API
-        genai.configure(api_key=api_key)
-        
-        # Создаем модель
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
-    
-    def _parse_gemini_json(self, response_text: str) -> Dict[str, Any]:
-        """
-        Надежный парсинг JSON от Gemini с очисткой проблемных символов
-        """
-        import re
-        
-        # Список попыток очистки от простой к агрессивной
-        attempts = [
-            # Попытка 1: Без изменений
-            lambda t: t,
-            # Попытка 2: Заменяем двойные обратные слэши
-            lambda t: t.replace('\\\\', '\\'),
-            # Попытка 3: Заменяем LaTeX команды на простые символы
-            lambda t: t.replace('\\cdot', '*').replace('\\div', '/').replace('\\times', '*'),
-            # Попытка 4: Удаляем все LaTeX команды типа \text{...}
-            lambda t: re.sub(r'\\text\{([^}]*)\}', r'\1', t),
-            # Попытка 5: Заменяем все обратные слэши на пустую строку (кроме \n, \t)
-            lambda t: re.sub(r'\\(?![nt"])', '', t),
-            # Попытка 6: Экстремальная очистка - удаляем все проблемные символы
-            lambda t: t.replace('\\', '').replace('\n', ' '),
-        ]
-        
-        last_error = None
-        for i, clean_func in enumerate(attempts):
-            try:
-                cleaned = clean_func(response_text)
-                result = json.loads(cleaned)
-                if i > 0:
-                    logger.info(f"✅ JSON успешно распарсен на попытке {i + 1}")
-                return result
-            except json.JSONDecodeError as e:
-                last_error = e
-                continue
-        
-        # Если все попытки провалились, логируем и выбрасываем ошибку
-        logger.error(f"❌ Все попытки парсинга JSON провалились: {last_error}")
-        logger.error(f"Ответ Gemini (первые 500 символов): {response_text[:500]}")
-        raise ValueError(f"Ошибка парсинга JSON от Gemini: {last_error}")
-    
-    def generate_problem(
-        self,
-        topic: str,
-        difficulty: int,
-        user_level: int,
-        user_grade: int = None,
-        user_age: int = None
-    ) -> Dict[str, Any]:
-        """
-        Генерирует математическую задачу через Gemini API
-        
-        Args:
-            topic: Тема задачи (например, "Алгебра: Квадратные уравнения")
-            difficulty: Желаемая сложность (0-3000)
-            user_level: Уровень пользователя (индекс Ал Хоразми)
-            user_grade: Класс пользователя (1-12)
-            user_age: Возраст пользователя
-        
-        Returns:
-            Dict с полями:
-                - title: Заголовок задачи
-                - latex_formula: Формула в LaTeX
-                - description: Описание задачи
-                - correct_answer: Правильный ответ
-                - solution_steps: Список шагов решения
-                - hints: Список подсказок
-                - difficulty_score: Сложность задачи
-        """
-        
-        # Получаем тему из базы данных 1010+ тем
-        topic_param = "topic"
-        
-        if topic_param:
-            topic_name = topic_param
-        else:
-            # Используем базу данных из 1010+ тем
-            # Выбираем тему по классу и сложности
-            if user_grade:
-                topic_obj = get_random_topic_for_grade(user_grade)
-                if topic_obj:
-                    topic_name = f"{topic_obj['category']}: {topic_obj['topic']}"
-                    # Корректируем сложность на основе темы
-                    target_difficulty = (topic_obj['difficulty_min'] + topic_obj['difficulty_max']) // 2
-                    logger.info(f"📚 Выбрана тема из базы: {topic_name} | Сложность: {target_difficulty}")
-                else:
-                    # Fallback на старую систему
-                    topic_name = "Математика: Общие задачи"
-            else:
-                # Если класс не указан, выбираем по сложности
-                topic_obj = get_topic_by_difficulty(difficulty)
-                if topic_obj:
-                    topic_name = f"{topic_obj['category']}: {topic_obj['topic']}"
-                    logger.info(f"📚 Выбрана тема по сложности: {topic_name}")
-                else:
-                    topic_name = "Математика: Общие задачи"
-        
-        # Определяем уровень образования и допустимые темы
-        grade_info = ""
-        forbidden_topics = ""
-        
-        if user_grade:
-            grade_info = f"\nКЛАСС УЧЕНИКА: {user_grade} класс"
-            if user_grade <= 4:
-                grade_info += " (начальная школа - простая арифметика, сложение, вычитание, умножение, деление)"
-                forbidden_topics = "\n❌ ЗАПРЕЩЕНО: дроби, уравнения, геометрия, комбинаторика, факториалы"
-            elif user_grade <= 6:
-                grade_info += " (5-6 класс - дроби, проценты, простые уравнения, площади фигур)"
-                forbidden_topics = "\n❌ СТРОГО ЗАПРЕЩЕНО: комбинаторика, факториалы, перестановки, сочетания, квадратные уравнения, степени выше 2"
-            elif user_grade <= 9:
-                grade_info += " (7-9 класс - алгебра, геометрия, квадратные уравнения, простая комбинаторика)"
-                forbidden_topics = "\n❌ ЗАПРЕЩЕНО: производные, интегралы, логарифмы, тригонометрия (кроме базовой)"
-            elif user_grade <= 11:
-                grade_info += " (10-11 класс - тригонометрия, производные, логарифмы)"
-                forbidden_topics = ""
-            else:
-                grade_info += " (выпускник - олимпиадные задачи)"
-                forbidden_topics = ""
-        elif user_age:
-            grade_info = f"\nВОЗРАСТ: {user_age} лет"
-        
-        prompt = f"""Ты - эксперт по математике и педагог. Создай математическую задачу.
+# Максимум одновременных асинхронных запросов к Gemini на процесс
+GEMINI_MAX_CONCURRENCY = config('GEMINI_MAX_CONCURRENCY', default=200, cast=int)
 
-ТЕМА: {topic}
-СЛОЖНОСТЬ: {difficulty} (шкала 0-3000, где 1000 - средний уровень)
-УРОВЕНЬ ПОЛЬЗОВАТЕЛЯ: {user_level}{grade_info}
+# Политика попыток генерации задачи: максимум попыток, общий срок (сек)
+# и порог, после которого параллельно запускается следующая попытка (0 - без хеджирования)
+GEMINI_MAX_ATTEMPTS = config('GEMINI_MAX_ATTEMPTS', default=3, cast=int)
+GEMINI_GENERATION_DEADLINE = config('GEMINI_GENERATION_DEADLINE', default=25.0, cast=float)
+GEMINI_HEDGE_AFTER = config('GEMINI_HEDGE_AFTER', default=8.0, cast=float)
 
-КРИТИЧЕСКИ ВАЖНО:
-- Задача ДОЛЖНА соответствовать программе указанного класса!
-- Используй ТОЛЬКО те математические понятия, которые изучают в этом классе!{forbidden_topics}
+# Structured output: ответ модели ограничен JSON-схемой задачи (response_schema),
+# инструкции по формату JSON из промпта убираются
+GEMINI_STRUCTURED_OUTPUT = config('GEMINI_STRUCTURED_OUTPUT', default=True, cast=bool)
+
+# Поля задачи, которые отдаются клиенту при потоковой генерации по мере получения
+STREAM_FIELDS = ('title', 'problem_text', 'equation_to_solve')
+
+# Корзины гистограммы числа попыток
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 5)
+
+# Семафор привязан к event loop, поэтому храним по одному на каждый loop
+_llm_semaphores = weakref.WeakKeyDictionary()
 
-ПРИМЕРЫ ПОНЯТНЫХ ЗАДАЧ ДЛЯ РАЗНЫХ КЛАССОВ:
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    """Общий семафор асинхронных запросов для текущего event loop"""
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        _llm_semaphores[loop] = semaphore
+    return semaphore
+
+
+# Общие части промпта генерации задач (одиночной и пакетной)
+_PROBLEM_GUIDELINES = """ПРИМЕРЫ ПОНЯТНЫХ ЗАДАЧ ДЛЯ РАЗНЫХ КЛАССОВ:
 
 5-6 КЛАСС:
 ✅ "У Маши было 100 рублей. Она купила книгу за 30% этой суммы. Сколько денег осталось у Маши?"
@@ -205,8 +102,13 @@ class GeminiService:
 - После возведения в квадрат ОБЯЗАТЕЛЬНО проверь все корни подстановкой
 - Отбрось посторонние корни, которые не удовлетворяют исходному уравнению
 
-ФОРМАТ ОТВЕТА (строго JSON):
-{{
+"""
+
+_PROBLEM_JSON_HEADER = """ФОРМАТ ОТВЕТА (строго JSON):
+"""
+
+# Поля JSON задачи; {difficulty} подставляется при формировании промпта
+_PROBLEM_JSON_FIELDS = """
     "title": "Краткое название задачи",
     "problem_text": "ЧЕТКИЙ и понятный текст задачи - ОБЯЗАТЕЛЬНОЕ ПОЛЕ!",
     "description": "Подробное описание условия задачи",
@@ -226,7 +128,9 @@ class GeminiService:
     ],
     "difficulty_score": {difficulty},
     "self_check": "Проверка решения подстановкой"
-}}
+"""
+
+_PROBLEM_CONTENT_RULES = """
 
 🔴 КРИТИЧЕСКИ ВАЖНО ДЛЯ ПОНИМНОСТИ ЗАДАЧИ:
 - problem_text: ОБЯЗАТЕЛЬНО заполнить! ЧЕТКО и ПОНЯТНО опиши условие - что дано, что нужно найти
@@ -236,110 +140,610 @@ class GeminiService:
 - Подсказки должны помогать, а не давать готовое решение
 - НЕ оставляй поля пустыми!
 
-🔧 КРИТИЧЕСКИ ВАЖНО ДЛЯ JSON (ОБЯЗАТЕЛЬНО СОБЛЮДАЙ!):
-- НЕ используй LaTeX команды в solution_steps и hints!
+✏️ ЗАПИСЬ ОТВЕТА, ШАГОВ И ПОДСКАЗОК:
+- НЕ используй LaTeX команды в correct_answer, solution_steps и hints!
 - Используй простые символы: * вместо умножения, / вместо деления
 - Пиши единицы измерения обычным текстом: см, м, кг, л
+- Пиши дроби как: 1/3, 2/5, а НЕ как \\frac{1}{3}
+- Пиши корни как: sqrt(x), а НЕ как \\sqrt{x}
+- Пиши степени как: x^2, x^3, а НЕ как x²"""
+
+# Правила формата JSON - не нужны, когда ответ ограничен схемой
+_PROBLEM_JSON_RULES = """
+
+🔧 КРИТИЧЕСКИ ВАЖНО ДЛЯ JSON (ОБЯЗАТЕЛЬНО СОБЛЮДАЙ!):
 - НЕ используй обратные слэши (\\) в тексте!
-- Пиши дроби как: 1/3, 2/5, а НЕ как \\frac{{1}}{{3}}
-- Пиши корни как: sqrt(x), а НЕ как \\sqrt{{x}}
-- Пиши степени как: x^2, x^3, а НЕ как x²
 
-ВАЖНО: Верни ТОЛЬКО валидный JSON, без дополнительного текста!
+ВАЖНО: Верни ТОЛЬКО валидный JSON, без дополнительного текста!"""
+
+_PROBLEM_FINAL_CHECK = """
 ПЕРЕД ОТПРАВКОЙ: Проверь решение дважды, убедись что все вычисления корректны!"""
 
-        # Логируем начало генерации
-        start_time = time.time()
-        logger.info(f"🚀 Начало генерации задачи | Тема: {topic} | Сложность: {difficulty} | Класс: {user_grade or 'не указан'}")
+# Схема ответа для structured output: модель возвращает JSON нужной формы сама,
+# поэтому поля описываются здесь, а не в промпте
+_PROBLEM_SCHEMA_PROPERTIES = {
+    'title': {'type': 'string', 'description': 'Краткое название задачи'},
+    'problem_text': {'type': 'string', 'description': 'Четкий текст задачи: что дано и что найти'},
+    'description': {'type': 'string', 'description': 'Подробное описание условия'},
+    'equation_to_solve': {'type': 'string', 'description': 'Уравнение из условия в LaTeX без $, пусто если нет'},
+    'correct_answer': {
+        'type': 'string',
+        'description': 'Ответ без LaTeX: 1/3, sqrt(2), x^2; несколько корней через запятую',
+    },
+    'solution_formula': {'type': 'string'},
+    'solution_steps': {'type': 'array', 'items': {'type': 'string'}, 'description': 'Не меньше 4 шагов'},
+    'hints': {'type': 'array', 'items': {'type': 'string'}, 'description': '2-3 подсказки без готового решения'},
+    'difficulty_score': {'type': 'integer'},
+    'self_check': {'type': 'string', 'description': 'Проверка ответа подстановкой'},
+}
+_PROBLEM_SCHEMA_REQUIRED = ['title', 'problem_text', 'description', 'correct_answer', 'solution_steps', 'hints']
+
+PROBLEM_SCHEMA = {
+    'type': 'object',
+    'properties': _PROBLEM_SCHEMA_PROPERTIES,
+    'required': _PROBLEM_SCHEMA_REQUIRED,
+}
+
+BATCH_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {'index': {'type': 'integer'}, **_PROBLEM_SCHEMA_PROPERTIES},
+        'required': ['index'] + _PROBLEM_SCHEMA_REQUIRED,
+    },
+}
 
+# Сколько раз пакетная генерация повторяет неудавшиеся задачи
+BATCH_MAX_ATTEMPTS = 3
+
+
+class GeminiService:
+    """Класс для взаимодействия с Gemini API"""
+    
+    MODEL_NAME = 'gemini-2.5-flash'
+    
+    def __init__(self, backend=None):
+        """
+        Инициализация клиента модели
+        
+        Args:
+            backend: Бэкенд LLM (по умолчанию - по настройке LLM_BACKEND:
+                Gemini, офлайн-заглушка или запись/воспроизведение)
+        """
+        self.model = backend or create_llm_backend(self.MODEL_NAME)
+    
+    @staticmethod
+    def _response_config(schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """generation_config для structured output (None - обычный текстовый ответ)"""
+        if not GEMINI_STRUCTURED_OUTPUT:
+            return None
+        return {'response_mime_type': 'application/json', 'response_schema': schema}
+    
+    def _call_model(self, contents, operation: str, generation_config: Optional[Dict[str, Any]] = None):
+        """
+        Синхронный запрос к модели - единственная точка вызова API:
+        общий лимит запросов, предохранитель, таймаут запроса и метрики
+        по операции (время, токены)
+        """
+        return get_llm_guard().call(
+            self.model.generate_content, contents,
+            operation=operation,
+            generation_config=generation_config,
+            request_options={'timeout': GEMINI_CALL_TIMEOUT}
+        )
+    
+    async def _agenerate_content(self, prompt: str, operation: str,
+                                 generation_config: Optional[Dict[str, Any]] = None):
+        """
+        Асинхронный запрос к модели под общим семафором и лимитами LLMGuard.
+        При отмене корутины запрос к API тоже отменяется.
+        """
+        async with _get_llm_semaphore():
+            return await get_llm_guard().acall(
+                self.model.generate_content_async, prompt,
+                operation=operation, generation_config=generation_config
+            )
+    
+    async def _astream_content(self, prompt: str,
+                               generation_config: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Потоковый запрос к модели: фрагменты текста ответа по мере генерации"""
+        guard = get_llm_guard()
+        async with _get_llm_semaphore():
+            await guard.abefore_call()
+            started = time.monotonic()
+            response = None
+            try:
+                response = await self.model.generate_content_async(
+                    prompt, stream=True, generation_config=generation_config
+                )
+                first_chunk = True
+                async for chunk in response:
+                    if first_chunk:
+                        get_metrics().observe('gemini_stream_first_chunk_seconds', time.monotonic() - started)
+                        first_chunk = False
+                    yield chunk.text
+            except Exception as e:
+                guard.observe_call('stream', time.monotonic() - started, 'error')
+                guard.record_failure(e)
+                raise
+            guard.observe_call('stream', time.monotonic() - started, 'ok', response)
+            guard.record_success()
+    
+    def _parse_gemini_json(self, response_text: str) -> Any:
+        """
+        Надежный парсинг JSON от Gemini: LaTeX-слэши, лишние/пропущенные запятые,
+        обертка ``` и оборванный массив исправляются за один проход
+        """
         try:
-            # Генерируем контент через модель
-            response = self.model.generate_content(prompt)
-            
-            generation_time = time.time() - start_time
-            logger.info(f"⏱️  Gemini API ответил за {generation_time:.2f} сек")
-            
-            # Извлекаем текст ответа
-            response_text = response.text.strip()
-            
-            # Убираем markdown форматирование если есть
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.startswith('```'):
-                response_text = response_text[3:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            response_text = response_text.strip()
-            
-            # Полная очистка JSON от проблемных LaTeX символов
-            problem_data = self._parse_gemini_json(response_text)
-            
-            # Валидация обязательных полей
-            required_fields = [
-                'title', 'problem_text', 'description',
-                'correct_answer', 'solution_steps', 'hints'
-            ]
-            for field in required_fields:
-                if field not in problem_data:
-                    raise ValueError(f"Отсутствует обязательное поле: {field}")
-                if field == 'problem_text' and not problem_data[field].strip():
-                    raise ValueError("Поле problem_text не может быть пустым!")
-                if field == 'title' and not problem_data[field].strip():
-                    raise ValueError("Поле title не может быть пустым!")
-            
-            # Проверяем что есть либо equation_to_solve либо solution_formula
-            if 'equation_to_solve' not in problem_data and 'solution_formula' not in problem_data:
-                logger.warning("Нет ни equation_to_solve ни solution_formula - возможно текстовая задача")
-            
-            # Добавляем difficulty_score если отсутствует
-            if 'difficulty_score' not in problem_data:
-                problem_data['difficulty_score'] = difficulty
-            
-            # 🔴 АВТОМАТИЧЕСКАЯ ВАЛИДАЦИЯ РЕШЕНИЯ через SymPy
-            logger.info(f"🔍 Запуск автоматической валидации решения через SymPy")
-            validation_passed = self._validate_problem_solution(problem_data)
-            
-            if not validation_passed:
-                logger.warning(f"⚠️ Решение не прошло валидацию, регенерируем задачу")
-                # Пробуем регенерировать задачу один раз
-                return self.generate_problem(topic, difficulty, user_level, user_grade, user_age)
-            
-            total_time = time.time() - start_time
-            logger.info(f"✅ Задача успешно сгенерирована и валидирована | Название: '{problem_data['title']}' | Общее время: {total_time:.2f} сек")
-            
-            return problem_data
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Ошибка парсинга JSON от Gemini: {e}")
-            logger.debug(f"Ответ Gemini: {response_text[:500]}...")
-            raise ValueError(f"Ошибка парсинга JSON от Gemini: {e}\nОтвет: {response_text}")
-        except Exception as e:
-            logger.error(f"❌ Ошибка генерации задачи: {e}")
-            raise Exception(f"Ошибка генерации задачи через Gemini: {e}")
+            result, fixes = parse_llm_json(response_text)
+        except ValueError as e:
+            get_metrics().increment('gemini_json_parse_total', result='failed')
+            logger.error(f"❌ Парсинг JSON не удался: {e}")
+            logger.error(f"Ответ Gemini (первые 500 символов): {response_text[:500]}")
+            raise ValueError(f"Ошибка парсинга JSON от Gemini: {e}")
+        
+        metrics = get_metrics()
+        metrics.increment('gemini_json_parse_total', result='repaired' if fixes else 'clean')
+        for fix in fixes:
+            metrics.increment('gemini_json_repair_total', fix=fix)
+        if fixes:
+            logger.info(f"🔧 JSON исправлен: {', '.join(fixes)}")
+        return result
     
-    def check_solution(
+    def _grade_requirements(self, user_grade: int = None, user_age: int = None) -> Tuple[str, str]:
+        """Описание класса ученика и запрещенные темы для промпта"""
+        
+        # Определяем уровень образования и допустимые темы
+        grade_info = ""
+        forbidden_topics = ""
+        
+        if user_grade:
+            grade_info = f"\nКЛАСС УЧЕНИКА: {user_grade} класс"
+            if user_grade <= 4:
+                grade_info += " (начальная школа - простая арифметика, сложение, вычитание, умножение, деление)"
+                forbidden_topics = "\n❌ ЗАПРЕЩЕНО: дроби, уравнения, геометрия, комбинаторика, факториалы"
+            elif user_grade <= 6:
+                grade_info += " (5-6 класс - дроби, проценты, простые уравнения, площади фигур)"
+                forbidden_topics = "\n❌ СТРОГО ЗАПРЕЩЕНО: комбинаторика, факториалы, перестановки, сочетания, квадратные уравнения, степени выше 2"
+            elif user_grade <= 9:
+                grade_info += " (7-9 класс - алгебра, геометрия, квадратные уравнения, простая комбинаторика)"
+                forbidden_topics = "\n❌ ЗАПРЕЩЕНО: производные, интегралы, логарифмы, тригонометрия (кроме базовой)"
+            elif user_grade <= 11:
+                grade_info += " (10-11 класс - тригонометрия, производные, логарифмы)"
+                forbidden_topics = ""
+            else:
+                grade_info += " (выпускник - олимпиадные задачи)"
+                forbidden_topics = ""
+        elif user_age:
+            grade_info = f"\nВОЗРАСТ: {user_age} лет"
+        
+        return grade_info, forbidden_topics
+    
+    def _build_problem_prompt(
         self,
-        problem_data: Dict[str, Any],
-        user_answer: str,
-        solution_photo: Optional[str] = None
+        topic: str,
+        difficulty: int,
+        user_level: int,
+        user_grade: int = None,
+        user_age: int = None
+    ) -> str:
+        """Формирует промпт для генерации задачи"""
+        grade_info, forbidden_topics = self._grade_requirements(user_grade, user_age)
+        
+        prompt = f"""Ты - эксперт по математике и педагог. Создай математическую задачу.
+
+ТЕМА: {topic}
+СЛОЖНОСТЬ: {difficulty} (шкала 0-3000, где 1000 - средний уровень)
+УРОВЕНЬ ПОЛЬЗОВАТЕЛЯ: {user_level}{grade_info}
+
+КРИТИЧЕСКИ ВАЖНО:
+- Задача ДОЛЖНА соответствовать программе указанного класса!
+- Используй ТОЛЬКО те математические понятия, которые изучают в этом классе!{forbidden_topics}
+
+{_PROBLEM_GUIDELINES}"""
+        if GEMINI_STRUCTURED_OUTPUT:
+            # Формат ответа задает схема - в промпте только требования к содержанию
+            return prompt.rstrip() + _PROBLEM_CONTENT_RULES + _PROBLEM_FINAL_CHECK
+        return (
+            prompt + _PROBLEM_JSON_HEADER + '{' + _PROBLEM_JSON_FIELDS.format(difficulty=difficulty) + '}'
+            + _PROBLEM_CONTENT_RULES + _PROBLEM_JSON_RULES + _PROBLEM_FINAL_CHECK
+        )
+    
+    def _build_batch_prompt(self, specs: List[Dict[str, Any]]) -> str:
+        """
+        Формирует один промпт на несколько задач
+        
+        Args:
+            specs: Задания - dict с ключами topic, difficulty, grade
+                (опционально user_level, age)
+        """
+        tasks = []
+        for index, spec in enumerate(specs):
+            grade_info, forbidden_topics = self._grade_requirements(spec.get('grade'), spec.get('age'))
+            tasks.append(
+                f"ЗАДАЧА index={index}:\n"
+                f"ТЕМА: {spec['topic']}\n"
+                f"СЛОЖНОСТЬ: {spec['difficulty']} (шкала 0-3000, где 1000 - средний уровень)\n"
+                f"УРОВЕНЬ ПОЛЬЗОВАТЕЛЯ: {spec.get('user_level', spec['difficulty'])}{grade_info}{forbidden_topics}"
+            )
+        task_list = '\n\n'.join(tasks)
+        
+        prompt = f"""Ты - эксперт по математике и педагог. Создай математические задачи - по одной на каждое задание ниже (всего: {len(specs)}).
+
+{task_list}
+
+КРИТИЧЕСКИ ВАЖНО:
+- Каждая задача ДОЛЖНА соответствовать программе класса из своего задания!
+- Используй ТОЛЬКО те математические понятия, которые изучают в этом классе!
+
+{_PROBLEM_GUIDELINES}"""
+        if GEMINI_STRUCTURED_OUTPUT:
+            return (
+                prompt + f"Верни массив из {len(specs)} задач в порядке заданий, index - номер задания."
+                + _PROBLEM_CONTENT_RULES + _PROBLEM_FINAL_CHECK
+            )
+        return (
+            prompt + _PROBLEM_JSON_HEADER
+            + f"JSON-МАССИВ из {len(specs)} объектов в порядке заданий, каждый объект:\n"
+            + '{\n    "index": номер задания,' + _PROBLEM_JSON_FIELDS.format(difficulty='сложность из задания') + '}'
+            + _PROBLEM_CONTENT_RULES + _PROBLEM_JSON_RULES + _PROBLEM_FINAL_CHECK
+        )
+    
+    @staticmethod
+    def _strip_markdown(response_text: str) -> str:
+        """Убирает markdown-обертку ```json ... ``` вокруг ответа"""
+        response_text = response_text.strip()
+        if response_text.startswith('```json'):
+            response_text = response_text[7:]
+        if response_text.startswith('```'):
+            response_text = response_text[3:]
+        if response_text.endswith('```'):
+            response_text = response_text[:-3]
+        return response_text.strip()
+    
+    def _parse_problem_response(self, response_text: str, difficulty: int) -> Dict[str, Any]:
+        """
+        Разбирает ответ модели с задачей и проверяет обязательные поля
+        
+        Args:
+            response_text: Текст ответа Gemini
+            difficulty: Запрошенная сложность (если модель её не вернула)
+        
+        Returns:
+            Dict с данными задачи
+        """
+        # Полная очистка JSON от проблемных LaTeX символов
+        problem_data = self._parse_gemini_json(self._strip_markdown(response_text))
+        return self._check_problem_fields(problem_data, difficulty)
+    
+    def _check_problem_fields(self, problem_data: Dict[str, Any], difficulty: int) -> Dict[str, Any]:
+        """Проверяет обязательные поля задачи и дополняет сложность"""
+        if not isinstance(problem_data, dict):
+            raise ValueError("Ответ модели не является объектом задачи")
+        
+        # Валидация обязательных полей
+        required_fields = [
+            'title', 'problem_text', 'description',
+            'correct_answer', 'solution_steps', 'hints'
+        ]
+        for field in required_fields:
+            if field not in problem_data:
+                raise ValueError(f"Отсутствует обязательное поле: {field}")
+            if field == 'problem_text' and not problem_data[field].strip():
+                raise ValueError("Поле problem_text не может быть пустым!")
+            if field == 'title' and not problem_data[field].strip():
+                raise ValueError("Поле title не может быть пустым!")
+        
+        # Проверяем что есть либо equation_to_solve либо solution_formula
+        if 'equation_to_solve' not in problem_data and 'solution_formula' not in problem_data:
+            logger.warning("Нет ни equation_to_solve ни solution_formula - возможно текстовая задача")
+        
+        # Добавляем difficulty_score если отсутствует
+        if 'difficulty_score' not in problem_data:
+            problem_data['difficulty_score'] = difficulty
+        
+        return problem_data
+    
+    async def _agenerate_once(self, prompt: str, difficulty: int) -> Optional[Dict[str, Any]]:
+        """
+        Одна попытка генерации: запрос к модели, разбор и валидация через SymPy
+        
+        Returns:
+            Данные задачи или None, если решение не прошло валидацию
+        """
+        start_time = time.time()
+        response = await self._agenerate_content(prompt, 'generate', self._response_config(PROBLEM_SCHEMA))
+        logger.info(f"⏱️  Gemini API ответил за {time.time() - start_time:.2f} сек")
+        
+        problem_data = self._parse_problem_response(response.text, difficulty)
+        
+        # SymPy - синхронный и CPU-емкий, выполняем вне event loop
+        logger.info(f"🔍 Запуск автоматической валидации решения через SymPy")
+        if not await asyncio.to_thread(self._validate_problem_solution, problem_data):
+            logger.warning(f"⚠️ Решение не прошло валидацию")
+            return None
+        return problem_data
+    
+    @staticmethod
+    def _finish_generation(started: float, attempts: int, hedged: bool, outcome: str):
+        """Логи и метрики по итогам генерации одной задачи"""
+        metrics = get_metrics()
+        metrics.increment('gemini_generation_total', outcome=outcome)
+        metrics.observe('gemini_generation_attempts', attempts, buckets=ATTEMPT_BUCKETS)
+        metrics.observe('gemini_generation_seconds', time.monotonic() - started, outcome=outcome)
+        if hedged:
+            metrics.increment('gemini_generation_hedged_total')
+        logger.info(
+            f"📊 Генерация завершена | Итог: {outcome} | Попыток: {attempts} | "
+            f"Хеджирование: {'да' if hedged else 'нет'} | Время: {time.monotonic() - started:.2f} сек"
+        )
+    
+    @staticmethod
+    def _generation_error(outcome: str, attempts: int, last_error: Optional[Exception]) -> Exception:
+        if last_error is not None:
+            return Exception(f"Ошибка генерации задачи через Gemini: {last_error}")
+        if outcome == 'deadline':
+            return Exception(f"Генерация задачи не уложилась в {GEMINI_GENERATION_DEADLINE} сек (попыток: {attempts})")
+        return Exception(f"Не удалось сгенерировать задачу, прошедшую валидацию (попыток: {attempts})")
+    
+    def generate_problem(
+        self,
+        topic: str,
+        difficulty: int,
+        user_level: int,
+        user_grade: int = None,
+        user_age: int = None
     ) -> Dict[str, Any]:
         """
-        Проверяет решение пользователя через Gemini API
+        Генерирует математическую задачу через Gemini API
+        
+        Попыток не больше GEMINI_MAX_ATTEMPTS, общее время ограничено
+        GEMINI_GENERATION_DEADLINE. Если попытка не ответила за
+        GEMINI_HEDGE_AFTER сек, параллельно запускается следующая;
+        берется первая задача, прошедшая валидацию (см. agenerate_problem).
         
         Args:
-            problem_data: Данные задачи (title, latex_formula, description, correct_answer)
-            user_answer: Ответ пользователя
-            solution_photo: Путь к фото решения (опционально)
+            topic: Тема задачи (например, "Алгебра: Квадратные уравнения")
+            difficulty: Желаемая сложность (0-3000)
+            user_level: Уровень пользователя (индекс Ал Хоразми)
+            user_grade: Класс пользователя (1-12)
+            user_age: Возраст пользователя
         
         Returns:
             Dict с полями:
-                - is_correct: Правильно ли решение
-                - feedback: Обратная связь
-                - detailed_analysis: Детальный анализ (если есть фото)
-                - confidence: Уверенность ИИ (0-1)
+                - title: Заголовок задачи
+                - latex_formula: Формула в LaTeX
+                - description: Описание задачи
+                - correct_answer: Правильный ответ
+                - solution_steps: Список шагов решения
+                - hints: Список подсказок
+                - difficulty_score: Сложность задачи
+        """
+        # Попытки выполняются асинхронно: проигравшие отменяются вместе с запросами
+        # к API, а не дорабатывают в фоновых потоках, расходуя платные вызовы
+        return async_to_sync(self.agenerate_problem)(topic, difficulty, user_level, user_grade, user_age)
+    
+    async def agenerate_problem(
+        self,
+        topic: str,
+        difficulty: int,
+        user_level: int,
+        user_grade: int = None,
+        user_age: int = None
+    ) -> Dict[str, Any]:
+        """
+        Асинхронная версия generate_problem
+        
+        Запрос к Gemini идет через асинхронный клиент под общим семафором,
+        поэтому процесс может держать сотни запросов одновременно, не занимая
+        потоки. Синхронный generate_problem выполняет эту же корутину; после первого
+        успешного результата остальные попытки отменяются вместе с запросами к API.
+        """
+        prompt = self._build_problem_prompt(topic, difficulty, user_level, user_grade, user_age)
+        
+        started = time.monotonic()
+        deadline = started + GEMINI_GENERATION_DEADLINE
+        logger.info(f"🚀 Начало асинхронной генерации задачи | Тема: {topic} | Сложность: {difficulty} | Класс: {user_grade or 'не указан'}")
+        
+        running = set()
+        attempts = 0
+        hedged = False
+        last_error = None
+        outcome = 'exhausted'
+        
+        try:
+            while True:
+                if not running:
+                    if attempts >= GEMINI_MAX_ATTEMPTS:
+                        break
+                    attempts += 1
+                    running.add(asyncio.ensure_future(self._agenerate_once(prompt, difficulty)))
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    outcome = 'deadline'
+                    break
+                
+                can_hedge = GEMINI_HEDGE_AFTER > 0 and attempts < GEMINI_MAX_ATTEMPTS
+                done, running = await asyncio.wait(
+                    running,
+                    timeout=min(remaining, GEMINI_HEDGE_AFTER) if can_hedge else remaining,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                if not done:
+                    if can_hedge:
+                        attempts += 1
+                        hedged = True
+                        logger.info(f"🔀 Хеджирование: запуск параллельной попытки {attempts}")
+                        running.add(asyncio.ensure_future(self._agenerate_once(prompt, difficulty)))
+                    continue
+                
+                for task in done:
+                    try:
+                        problem_data = task.result()
+                    except LLMUnavailableError:
+                        # Лимит или предохранитель - повторные попытки бессмысленны
+                        self._finish_generation(started, attempts, hedged, 'unavailable')
+                        raise
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка попытки генерации: {e}")
+                        last_error = e
+                        continue
+                    if problem_data is not None:
+                        outcome = 'ok'
+                        self._finish_generation(started, attempts, hedged, outcome)
+                        logger.info(f"✅ Задача успешно сгенерирована и валидирована | Название: '{problem_data['title']}'")
+                        return problem_data
+        finally:
+            # Отменяем оставшиеся попытки (и при отмене самой корутины)
+            for task in running:
+                task.cancel()
+        
+        self._finish_generation(started, attempts, hedged, outcome)
+        raise self._generation_error(outcome, attempts, last_error)
+    
+    async def astream_problem(
+        self,
+        topic: str,
+        difficulty: int,
+        user_level: int,
+        user_grade: int = None,
+        user_age: int = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Потоковая генерация задачи
+        
+        Yields:
+            ('field', (имя, значение)) - для полей из STREAM_FIELDS по мере получения;
+            последним - ('problem', данные задачи) или ('problem', None), если ответ
+            не разобрался или решение не прошло валидацию
+        """
+        prompt = self._build_problem_prompt(topic, difficulty, user_level, user_grade, user_age)
+        extractor = StreamingFieldExtractor(STREAM_FIELDS)
+        
+        start_time = time.time()
+        logger.info(f"🚀 Начало потоковой генерации задачи | Тема: {topic} | Сложность: {difficulty} | Класс: {user_grade or 'не указан'}")
+        
+        try:
+            first_chunk = True
+            async for chunk in self._astream_content(prompt, self._response_config(PROBLEM_SCHEMA)):
+                if first_chunk:
+                    logger.info(f"⏱️  Первый фрагмент от Gemini за {time.time() - start_time:.2f} сек")
+                    first_chunk = False
+                for field in extractor.feed(chunk):
+                    yield 'field', field
+            
+            logger.info(f"⏱️  Gemini API завершил ответ за {time.time() - start_time:.2f} сек")
+            problem_data = self._parse_problem_response(extractor.text, difficulty)
+        except Exception as e:
+            logger.error(f"❌ Ошибка потоковой генерации: {e}")
+            get_metrics().increment('gemini_stream_total', outcome='error')
+            yield 'problem', None
+            return
+        
+        # SymPy - синхронный и CPU-емкий, выполняем вне event loop
+        logger.info(f"🔍 Запуск автоматической валидации решения через SymPy")
+        if not await asyncio.to_thread(self._validate_problem_solution, problem_data):
+            logger.warning(f"⚠️ Решение не прошло валидацию")
+            get_metrics().increment('gemini_stream_total', outcome='invalid')
+            yield 'problem', None
+            return
+        
+        get_metrics().increment('gemini_stream_total', outcome='ok')
+        yield 'problem', problem_data
+    
+    def _parse_batch_response(self, response_text: str, specs: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """
+        Разбирает JSON-массив задач пакетного ответа
+        
+        Returns:
+            Dict позиция задания -> данные задачи (только для корректных элементов)
+        """
+        items = self._parse_gemini_json(self._strip_markdown(response_text))
+        if isinstance(items, dict):
+            items = items.get('problems', [items])
+        if not isinstance(items, list):
+            raise ValueError("Ответ модели не является JSON-массивом")
+        
+        parsed = {}
+        for position, item in enumerate(items):
+            # Сопоставляем по index, если модель его вернула, иначе по порядку
+            index = item.get('index', position) if isinstance(item, dict) else position
+            if not isinstance(index, int) or not 0 <= index < len(specs) or index in parsed:
+                continue
+            try:
+                problem_data = self._check_problem_fields(item, specs[index]['difficulty'])
+            except ValueError as e:
+                logger.warning(f"⚠️ Задача index={index} из пакета отклонена: {e}")
+                continue
+            problem_data.pop('index', None)
+            parsed[index] = problem_data
+        return parsed
+    
+    def generate_problems_batch(
+        self,
+        specs: List[Dict[str, Any]],
+        max_attempts: int = BATCH_MAX_ATTEMPTS
+    ) -> List[Optional[Dict[str, Any]]]:
         """
+        Генерирует несколько задач одним запросом к Gemini
         
+        Инструкции промпта передаются один раз на весь пакет. Каждая задача
+        валидируется отдельно через SymPy; повторно запрашиваются только
+        задачи, которые не разобрались или не прошли валидацию.
+        
+        Args:
+            specs: Задания - dict с ключами topic, difficulty, grade
+                (опционально user_level, age)
+            max_attempts: Сколько раз запрашивать неудавшиеся задачи
+        
+        Returns:
+            Список той же длины, что specs: данные задачи или None,
+            если задачу не удалось получить за max_attempts попыток
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(specs)
+        pending = list(range(len(specs)))
+        
+        for attempt in range(1, max_attempts + 1):
+            if not pending:
+                break
+            
+            batch_specs = [specs[i] for i in pending]
+            if attempt > 1:
+                get_metrics().increment('gemini_batch_retried_total', len(batch_specs))
+            start_time = time.time()
+            logger.info(f"🚀 Пакетная генерация | Задач: {len(batch_specs)} | Попытка: {attempt}/{max_attempts}")
+            
+            try:
+                response = self._call_model(
+                    self._build_batch_prompt(batch_specs), 'generate_batch', self._response_config(BATCH_SCHEMA)
+                )
+                parsed = self._parse_batch_response(response.text, batch_specs)
+            except LLMUnavailableError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка пакетной генерации: {e}")
+                continue
+            
+            logger.info(f"⏱️  Gemini API ответил за {time.time() - start_time:.2f} сек | Разобрано: {len(parsed)}/{len(batch_specs)}")
+            
+            still_pending = []
+            for position, spec_index in enumerate(pending):
+                problem_data = parsed.get(position)
+                if problem_data is not None and self._validate_problem_solution(problem_data):
+                    results[spec_index] = problem_data
+                else:
+                    still_pending.append(spec_index)
+            pending = still_pending
+        
+        if pending:
+            logger.warning(f"⚠️ Пакетная генерация: не получено задач: {len(pending)} из {len(specs)}")
+        
+        return results
+    
+    def _build_check_prompt(self, problem_data: Dict[str, Any], user_answer: str) -> str:
+        """Формирует промпт для проверки ответа"""
         prompt = f"""Ты - эксперт по математике. Проверь решение задачи.
 
 ЗАДАЧА:
@@ -365,39 +769,76 @@ class GeminiService:
 }}
 
 ВАЖНО: Верни ТОЛЬКО валидный JSON!"""
+        return prompt
+    
+    def _parse_check_response(self, response_text: str) -> Dict[str, Any]:
+        """Разбирает ответ модели с результатом проверки"""
+        # Парсим JSON
+        check_result = json.loads(self._strip_markdown(response_text))
+        
+        # Валидация
+        if 'is_correct' not in check_result:
+            raise ValueError("Отсутствует поле is_correct в ответе")
+        
+        # Устанавливаем значения по умолчанию
+        check_result.setdefault('feedback', 'Проверка завершена')
+        check_result.setdefault('confidence', 0.9)
+        check_result.setdefault('explanation', '')
+        
+        return check_result
+    
+    def check_solution(
+        self,
+        problem_data: Dict[str, Any],
+        user_answer: str,
+        solution_photo: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Проверяет решение пользователя через Gemini API
+        
+        Args:
+            problem_data: Данные задачи (title, latex_formula, description, correct_answer)
+            user_answer: Ответ пользователя
+            solution_photo: Путь к фото решения (опционально)
+        
+        Returns:
+            Dict с полями:
+                - is_correct: Правильно ли решение
+                - feedback: Обратная связь
+                - detailed_analysis: Детальный анализ (если есть фото)
+                - confidence: Уверенность ИИ (0-1)
+        """
+        prompt = self._build_check_prompt(problem_data, user_answer)
 
         try:
             # Генерируем контент через модель
-            response = self.model.generate_content(prompt)
-            
-            response_text = response.text.strip()
-            
-            # Убираем markdown форматирование
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.startswith('```'):
-                response_text = response_text[3:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            response_text = response_text.strip()
-            
-            # Парсим JSON
-            check_result = json.loads(response_text)
+            response = self._call_model(prompt, 'check')
+            return self._parse_check_response(response.text)
             
-            # Валидация
-            if 'is_correct' not in check_result:
-                raise ValueError("Отсутствует поле is_correct в ответе")
-            
-            # Устанавливаем значения по умолчанию
-            check_result.setdefault('feedback', 'Проверка завершена')
-            check_result.setdefault('confidence', 0.9)
-            check_result.setdefault('explanation', '')
-            
-            return check_result
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Ошибка парсинга JSON от Gemini: {e}")
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка проверки решения через Gemini: {e}")
+    
+    async def acheck_solution(
+        self,
+        problem_data: Dict[str, Any],
+        user_answer: str,
+        solution_photo: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Асинхронная версия check_solution"""
+        prompt = self._build_check_prompt(problem_data, user_answer)
+        
+        try:
+            response = await self._agenerate_content(prompt, 'check')
+            return self._parse_check_response(response.text)
             
         except json.JSONDecodeError as e:
             raise ValueError(f"Ошибка парсинга JSON от Gemini: {e}")
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             raise Exception(f"Ошибка проверки решения через Gemini: {e}")
     
@@ -412,55 +853,47 @@ class GeminiService:
             bool - прошла ли валидация
         """
         try:
-            validator = get_math_validator()
-            
-            # Извлекаем данные
-            # Для валидации используем equation_to_solve или solution_formula
-            equation = problem_data.get('equation_to_solve', '') or problem_data.get('solution_formula', '')
-            correct_answer = problem_data.get('correct_answer', '')
+            started = time.monotonic()
+            outcome = get_validation_pool().validate_problem(problem_data)
+            verdict = outcome['verdict']
             
             # Пропускаем валидацию для геометрических и текстовых задач
-            if not equation or 'площадь' in problem_data.get('title', '').lower():
+            if verdict == VERDICT_SKIPPED:
                 logger.info("⏭️ Пропускаем валидацию для геометрической/текстовой задачи")
+                get_metrics().increment('gemini_validation_total', result='skipped')
                 return True
             
-            # Определяем тип задачи
-            is_irrational = 'sqrt' in equation.lower() or '\\sqrt' in equation
+            # Пул занят - задача не проверена, но и не отклонена: новая генерация стоила бы платного вызова
+            if verdict == VERDICT_BUSY:
+                logger.warning(f"⏳ Валидация пропущена, пул проверки занят: {outcome.get('errors')}")
+                get_metrics().increment('gemini_validation_total', result=VERDICT_BUSY)
+                return True
             
-            # Парсим ответ (может быть несколько решений)
-            answers = []
-            if ',' in correct_answer:
-                answers = [a.strip() for a in correct_answer.split(',')]
-            elif 'и' in correct_answer:
-                answers = [a.strip() for a in correct_answer.split('и')]
-            else:
-                answers = [correct_answer.strip()]
-            
-            # Валидируем решение
-            if is_irrational:
-                logger.info(f"🔍 Валидация иррационального уравнения: {equation}")
-                validation_result = validator.validate_irrational_equation(
-                    equation, answers
-                )
-            else:
-                logger.info(f"🔍 Валидация уравнения: {equation}")
-                validation_result = validator.validate_equation_solution(
-                    equation, answers
-                )
+            logger.info(f"🔍 Валидация уравнения: {outcome.get('equation', problem_data.get('equation_to_solve'))}")
+            get_metrics().observe('gemini_validation_seconds', time.monotonic() - started)
             
             # Проверяем результат
-            if validation_result.get('is_valid'):
+            if verdict == VERDICT_PASS:
                 logger.info(f"✅ Валидация пройдена успешно")
+                get_metrics().increment('gemini_validation_total', result='pass')
                 return True
-            else:
-                logger.warning(f"❌ Валидация не пройдена: {validation_result.get('errors')}")
-                logger.warning(f"Правильные решения по SymPy: {validation_result.get('sympy_solutions')}")
-                logger.warning(f"Заявленные решения: {answers}")
+            elif verdict == VERDICT_FAIL:
+                get_metrics().increment('gemini_validation_total', result='fail')
+                logger.warning(f"❌ Валидация не пройдена: {outcome.get('errors')}")
+                logger.warning(f"Правильные решения по SymPy: {outcome.get('sympy_solutions')}")
+                logger.warning(f"Заявленные решения: {outcome.get('answers')}")
+                return False
+            elif verdict in (VERDICT_TIMEOUT, VERDICT_MEMORY):
+                # Уравнение, которое SymPy не может проверить за лимит, не показываем
+                get_metrics().increment('gemini_validation_total', result=verdict)
+                logger.warning(f"⏱️ Валидация прервана ({verdict}): {outcome.get('errors')}")
                 return False
+            raise ValueError('; '.join(outcome.get('errors') or [verdict]))
                 
         except Exception as e:
             # Если валидация не удалась (например, сложное уравнение), пропускаем
             logger.warning(f"⚠️ Не удалось провести валидацию: {e}")
+            get_metrics().increment('gemini_validation_total', result='error')
             logger.warning("Пропускаем валидацию и доверяем AI")
             return True
     
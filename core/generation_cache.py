@@ -0,0 +1,115 @@
+"""
+Кеш сгенерированных задач
+Пул проверенных задач по ключу (тема, корзина сложности, класс, версия промпта),
+чтобы одинаковый спрос не вызывал новых платных запросов к Gemini
+"""
+
+import hashlib
+import logging
+import re
+import time
+from typing import Any, Container, Dict, List, Optional
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Увеличивать при изменении промпта генерации в GeminiService,
+# чтобы задачи по старому промпту перестали выдаваться
+GENERATION_PROMPT_VERSION = 2
+
+# Ширина корзины сложности в ключе
+GENERATION_BUCKET_SIZE = 100
+
+# Сколько задач хранится в пуле одного ключа (старые вытесняются)
+GENERATION_POOL_SIZE = 5
+
+# Время жизни пула и каждой задачи в нем (сек); лишние ключи вытесняет сам кеш
+GENERATION_CACHE_TTL = 24 * 3600
+
+
+def _normalize_topic(topic: str) -> str:
+    return re.sub(r'\s+', ' ', (topic or '').strip().lower())
+
+
+def generation_key(topic: str, difficulty: int, grade: Optional[int],
+                   prompt_version: int = GENERATION_PROMPT_VERSION) -> str:
+    """Ключ пула: хеш нормализованного (тема, корзина, класс, версия промпта)"""
+    parts = (
+        _normalize_topic(topic),
+        max(0, int(difficulty)) // GENERATION_BUCKET_SIZE,
+        grade or 0,
+        prompt_version,
+    )
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+    return f"gen_pool_{digest}"
+
+
+class GenerationCache:
+    """
+    Пулы сгенерированных задач в общем кеше Django.
+
+    Пул - список до GENERATION_POOL_SIZE задач (новые в конце). Задача
+    выдается пользователю, только если её problem_id не входит в его
+    множество решенных задач. Каждый ключ живет GENERATION_CACHE_TTL,
+    устаревшие задачи внутри пула отбрасываются при чтении. Общего индекса
+    ключей нет: чтение не пишет в кеш, запись меняет только свой ключ.
+    """
+
+    def _load(self, key: str) -> List[Dict[str, Any]]:
+        entries = cache.get(key) or []
+        now = time.time()
+        return [e for e in entries if now - e['cached_at'] < GENERATION_CACHE_TTL]
+
+    def get(
+        self,
+        topic: str,
+        difficulty: int,
+        grade: Optional[int],
+        exclude: Optional[Container[int]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Ищет в пуле задачу, которую пользователь еще не решал
+
+        Args:
+            topic: Тема задачи
+            difficulty: Целевая сложность
+            grade: Класс
+            exclude: ID задач, решенных пользователем
+
+        Returns:
+            Копия данных задачи или None
+        """
+        key = generation_key(topic, difficulty, grade)
+        entries = self._load(key)
+
+        # Самые свежие задачи - первыми
+        for entry in reversed(entries):
+            problem_id = entry['problem_data'].get('problem_id')
+            if problem_id is None or (exclude and problem_id in exclude):
+                continue
+            logger.info(f"♻️ Задача из кеша генерации | Тема: {topic} | ID: {problem_id}")
+            return dict(entry['problem_data'])
+
+        return None
+
+    def put(self, topic: str, difficulty: int, grade: Optional[int], problem_data: Dict[str, Any]):
+        """Добавляет проверенную и сохраненную в БД задачу в пул"""
+        if problem_data.get('problem_id') is None:
+            return
+
+        key = generation_key(topic, difficulty, grade)
+        entries = self._load(key)
+        entries.append({'problem_data': dict(problem_data), 'cached_at': time.time()})
+        cache.set(key, entries[-GENERATION_POOL_SIZE:], timeout=GENERATION_CACHE_TTL)
+
+
+# Singleton instance
+_generation_cache = None
+
+def get_generation_cache() -> GenerationCache:
+    """Получить экземпляр GenerationCache (Singleton)"""
+    global _generation_cache
+    if _generation_cache is None:
+        _generation_cache = GenerationCache()
+    return _generation_cache
@@ -0,0 +1,261 @@
+"""
+Разбор JSON из ответов LLM с исправлением типичных дефектов
+Одиночные LaTeX-слэши исправляются за один проход по всему тексту; если
+JSON после этого все еще некорректен (запятые, обрыв), текст один раз
+проходится по токенам, и исправленный JSON собирается по ходу. Корректные
+элементы внешнего массива при этом разбираются целиком через raw_decode.
+"""
+
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+# Исправления, которые может применить repair_json
+FIX_WRAPPER = 'wrapper'              # текст или ``` вокруг JSON
+FIX_LATEX_ESCAPE = 'latex_escape'    # одиночные обратные слэши LaTeX в строках
+FIX_TRAILING_COMMA = 'trailing_comma'
+FIX_MISSING_COMMA = 'missing_comma'
+FIX_GARBAGE = 'garbage'              # посторонние символы между токенами
+FIX_TRUNCATED = 'truncated'          # ответ оборван: оставлены только завершенные элементы
+
+# Пробелы между токенами пропускаются самим выражением
+_TOKEN = re.compile(r'''\s*(?:
+    (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")
+  | (?P<open>[\[{])
+  | (?P<close>[\]}])
+  | (?P<comma>,)
+  | (?P<colon>:)
+  | (?P<literal>-?\d[\d.eE+\-]*|true|false|null)
+  | (?P<other>.)
+)''', re.VERBOSE | re.DOTALL)
+
+# Символ после обратного слэша в допустимой JSON-последовательности.
+# \f и \b перед буквой - это LaTeX (\frac, \beta): в тексте задач
+# управляющие символы form feed и backspace не встречаются. \n, \t, \r
+# перед буквой - обычно перевод строки или табуляция, LaTeX - только
+# если дальше идет известная команда (\neq, \times, \right)
+_SIMPLE_ESCAPES = frozenset('"/bfnrt')
+_LATEX_ONLY_ESCAPES = frozenset('bf')
+_HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+
+# Команды LaTeX, начинающиеся с n, t, r
+_LATEX_COMMANDS = frozenset({
+    'nabla', 'ne', 'neq', 'neg', 'ni', 'nu', 'not', 'notin', 'nexists',
+    'nleq', 'ngeq', 'nless', 'ngtr', 'nmid', 'nparallel', 'nsubseteq', 'newline',
+    'times', 'theta', 'tau', 'tan', 'tanh', 'text', 'textbf', 'textit', 'textrm',
+    'tfrac', 'tbinom', 'tilde', 'to', 'top', 'triangle', 'therefore', 'textstyle',
+    'right', 'rightarrow', 'rho', 'rangle', 'rceil', 'rfloor', 'rbrace', 'rvert',
+    'rVert', 'rm', 'root',
+})
+_COMMAND_NAME = re.compile(r'[A-Za-z]+')
+
+_ROOT_START = re.compile(r'[\[{]')
+
+_DECODER = json.JSONDecoder(strict=False)
+
+
+def _is_valid_escape(tail: str) -> bool:
+    """Допустима ли JSON-последовательность обратный слэш + tail"""
+    first = tail[:1]
+    if first == 'u':
+        return len(tail) >= 5 and _HEX_DIGITS.issuperset(tail[1:5])
+    if first not in _SIMPLE_ESCAPES:
+        return False
+    if first in _LATEX_ONLY_ESCAPES:
+        return not (tail[1:2].isascii() and tail[1:2].isalpha())
+    command = _COMMAND_NAME.match(tail)
+    return command is None or command.group() not in _LATEX_COMMANDS
+
+
+def _fix_latex_escapes(text: str) -> Tuple[str, bool]:
+    """
+    Экранирует обратные слэши, не образующие допустимую JSON-последовательность
+    Вне строк слэшей в корректном JSON нет, поэтому текст обрабатывается целиком:
+    str.split по слэшам и один проход по кускам
+    """
+    if '\\' not in text:
+        return text, False
+
+    pieces = text.split('\\')
+    out = [pieces[0]]
+    changed = False
+    index, count = 1, len(pieces)
+    while index < count:
+        piece = pieces[index]
+        if not piece and index + 1 < count:
+            # Пара \\ - экранированный слэш, следующий кусок - обычный текст
+            out.append('\\\\')
+            out.append(pieces[index + 1])
+            index += 2
+            continue
+        if _is_valid_escape(piece):
+            out.append('\\')
+        else:
+            out.append('\\\\')
+            changed = True
+        out.append(piece)
+        index += 1
+
+    return (''.join(out), True) if changed else (text, False)
+
+
+def _prepare(text: str) -> Tuple[str, set]:
+    """
+    Вырезает корневое значение (от первой { или [ до последней } или ])
+    и исправляет LaTeX-слэши
+    """
+    start = _ROOT_START.search(text)
+    if start is None:
+        raise ValueError('JSON не найден в ответе')
+    end = max(text.rfind('}'), text.rfind(']'), start.start()) + 1
+
+    fixes = set()
+    tail = text[end:].strip()
+    # Хвост оборванного ответа (", {..." ) оберткой не считается
+    if text[:start.start()].strip() or tail and tail[0] not in ',:"[{':
+        fixes.add(FIX_WRAPPER)
+
+    body, escaped = _fix_latex_escapes(text[start.start():end])
+    if escaped:
+        fixes.add(FIX_LATEX_ESCAPE)
+    return body, fixes
+
+
+def _repair_structure(text: str, fixes: set) -> str:
+    """
+    Один проход по токенам: лишние и пропущенные запятые, посторонние
+    символы, обрыв. Текст начинается с корневой { или [.
+    """
+    parts: List[str] = []
+    stack: List[str] = []
+    # Глубина самого внешнего открытого массива (0 - массива в стеке нет)
+    outer_array_depth = 0
+    after_value = False
+    # Последняя точка, до которой можно откатиться при обрыве: (len(parts), стек)
+    safe_point: Optional[Tuple[int, Tuple[str, ...]]] = None
+    complete = False
+    position = 0
+
+    while True:
+        match = _TOKEN.match(text, position)
+        if match is None:
+            break
+        position = match.end()
+        kind = match.lastgroup
+        token = match.group(kind)
+
+        if kind in ('string', 'literal', 'open'):
+            if after_value:
+                parts.append(',')
+                fixes.add(FIX_MISSING_COMMA)
+            if kind == 'open' and len(stack) == outer_array_depth:
+                # Элемент внешнего массива: корректный разбирается целиком
+                # на скорости C, токены перебираются только у дефектного
+                try:
+                    position = _DECODER.raw_decode(text, match.start(kind))[1]
+                    kind, token = 'element', text[match.start(kind):position]
+                except json.JSONDecodeError:
+                    pass
+            parts.append(token)
+            if kind == 'open':
+                stack.append(token)
+                if token == '[' and not outer_array_depth:
+                    outer_array_depth = len(stack)
+                after_value = False
+            else:
+                after_value = True
+        elif kind == 'close':
+            if not stack:
+                break
+            if parts[-1] == ',':
+                parts.pop()
+                fixes.add(FIX_TRAILING_COMMA)
+            # Закрываем то, что открыто, даже если модель перепутала скобку
+            if len(stack) == outer_array_depth:
+                outer_array_depth = 0
+            parts.append(']' if stack.pop() == '[' else '}')
+            after_value = True
+            if not stack:
+                complete = True
+                break
+        elif kind == 'comma':
+            if parts[-1] in (',', '[', '{'):
+                fixes.add(FIX_GARBAGE)
+                continue
+            parts.append(',')
+            after_value = False
+        elif kind == 'colon':
+            parts.append(':')
+            after_value = False
+        else:
+            if token == '"':
+                # Незакрытая строка - ответ оборван
+                break
+            fixes.add(FIX_GARBAGE)
+            continue
+
+        # Элемент самого внешнего массива завершен (или массив только открыт)
+        if len(stack) == outer_array_depth and parts[-1] != ',':
+            safe_point = (len(parts), tuple(stack))
+
+    if not complete:
+        if safe_point is None:
+            raise ValueError('JSON оборван')
+        fixes.add(FIX_TRUNCATED)
+        length, saved_stack = safe_point
+        del parts[length:]
+        stack = list(saved_stack)
+        while stack:
+            if parts[-1] == ',':
+                parts.pop()
+            parts.append(']' if stack.pop() == '[' else '}')
+
+    return ''.join(parts)
+
+
+def repair_json(text: str) -> Tuple[str, List[str]]:
+    """
+    Исправляет JSON из ответа LLM
+
+    Текст до первой { или [ и после конца корневого значения отбрасывается.
+    Если ответ оборван внутри массива, остаются только завершенные элементы
+    самого внешнего массива (например, целые задачи из списка).
+
+    Args:
+        text: Ответ модели
+
+    Returns:
+        (исправленный JSON, список примененных исправлений FIX_*)
+
+    Raises:
+        ValueError: JSON не найден или оборван вне массива
+    """
+    body, fixes = _prepare(text)
+    return _repair_structure(body, fixes), sorted(fixes)
+
+
+def parse_llm_json(text: str) -> Tuple[Any, List[str]]:
+    """
+    Разбирает JSON из ответа LLM с исправлением дефектов
+
+    Сначала исправляются только обертка и LaTeX-слэши (самые частые дефекты),
+    разбор по токенам - только если json.loads все еще не справляется.
+
+    Returns:
+        (значение, список примененных исправлений)
+
+    Raises:
+        ValueError: Ответ не удалось разобрать
+    """
+    body, fixes = _prepare(text)
+    try:
+        # strict=False - переводы строк внутри строк, которые модель не экранирует
+        return json.loads(body, strict=False), sorted(fixes)
+    except json.JSONDecodeError:
+        pass
+
+    repaired = _repair_structure(body, fixes)
+    try:
+        return json.loads(repaired, strict=False), sorted(fixes)
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Некорректный JSON: {e}') from e
@@ -0,0 +1,77 @@
+"""
+Инкрементальное извлечение полей из JSON, который приходит частями
+Используется для потоковой генерации: поле отдается клиенту, как только
+его строковое значение полностью получено, не дожидаясь конца ответа
+"""
+
+import json
+import re
+from typing import Dict, Iterable, List, Tuple
+
+
+class StreamingFieldExtractor:
+    """
+    Извлекает строковые поля JSON-объекта по мере поступления текста.
+
+    feed() принимает очередной фрагмент ответа модели и возвращает поля,
+    значения которых завершились в этом фрагменте. Каждое поле отдается
+    один раз; структура остального JSON не проверяется.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self._buffer = ''
+        self._patterns = {
+            field: re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+            for field in fields
+        }
+        self.values: Dict[str, str] = {}
+
+    @staticmethod
+    def _find_closing_quote(text: str, start: int) -> int:
+        """Позиция закрывающей кавычки строки, начинающейся с start, или -1"""
+        position = start
+        while position < len(text):
+            char = text[position]
+            if char == '\\':
+                position += 2
+                continue
+            if char == '"':
+                return position
+            position += 1
+        return -1
+
+    @staticmethod
+    def _decode(raw: str) -> str:
+        try:
+            return json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            # Модель иногда пишет LaTeX с одиночными обратными слэшами
+            return raw.replace('\\"', '"').replace('\\n', '\n')
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """
+        Добавляет фрагмент ответа
+
+        Returns:
+            Список (поле, значение) для полей, завершившихся в этом фрагменте
+        """
+        self._buffer += chunk
+        completed = []
+        for field, pattern in self._patterns.items():
+            if field in self.values:
+                continue
+            match = pattern.search(self._buffer)
+            if match is None:
+                continue
+            end = self._find_closing_quote(self._buffer, match.end())
+            if end == -1:
+                continue
+            value = self._decode(self._buffer[match.end():end])
+            self.values[field] = value
+            completed.append((field, value))
+        return completed
+
+    @property
+    def text(self) -> str:
+        """Весь полученный текст"""
+        return self._buffer
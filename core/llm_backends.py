@@ -0,0 +1,377 @@
+"""
+Бэкенды LLM: Gemini, детерминированная офлайн-заглушка и запись/воспроизведение
+Все бэкенды повторяют интерфейс genai.GenerativeModel, который используют
+GeminiService и BookImporter: generate_content / generate_content_async
+(в том числе stream=True), ответ с полями text и usage_metadata.
+Бэкенд выбирается настройкой LLM_BACKEND.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+# gemini - реальный API; fake - офлайн-заглушка; record - Gemini с записью
+# ответов на диск; replay - воспроизведение записанных ответов
+LLM_BACKEND = config('LLM_BACKEND', default='gemini')
+
+# Параметры заглушки: задержка ответа (сек), доля ошибок запроса и доля
+# задач с неверным ответом (не проходят валидацию SymPy)
+LLM_FAKE_LATENCY = config('LLM_FAKE_LATENCY', default=0.0, cast=float)
+LLM_FAKE_FAILURE_RATE = config('LLM_FAKE_FAILURE_RATE', default=0.0, cast=float)
+LLM_FAKE_INVALID_RATE = config('LLM_FAKE_INVALID_RATE', default=0.0, cast=float)
+LLM_FAKE_SEED = config('LLM_FAKE_SEED', default=0, cast=int)
+
+# Каталог записанных ответов для record/replay
+LLM_RECORDINGS_DIR = config('LLM_RECORDINGS_DIR', default='llm_recordings')
+
+# Сколько фрагментов отдает заглушка в потоковом режиме
+FAKE_STREAM_CHUNKS = 4
+
+
+class LLMBackendError(Exception):
+    """Ошибка бэкенда LLM (в том числе внедренная заглушкой); code - HTTP-статус, если есть"""
+
+    def __init__(self, message: str, code: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+
+
+class ReplayMissError(LLMBackendError):
+    """Для запроса нет записанного ответа"""
+
+
+@dataclass
+class LLMResponse:
+    """Ответ (или фрагмент потокового ответа) не-Gemini бэкендов"""
+    text: str
+    usage_metadata: Any = None
+
+
+def _usage(prompt_tokens: int, response_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=response_tokens)
+
+
+def _estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов: ~4 символа на токен"""
+    return max(1, len(text) // 4)
+
+
+class _ChunkStream:
+    """Потоковый ответ из готовых фрагментов; usage_metadata - после последнего"""
+
+    def __init__(self, chunks: List[str], delay: float = 0.0, usage: Any = None):
+        self._chunks = chunks
+        self._delay = delay
+        self.usage_metadata = usage
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            if self._delay:
+                await asyncio.sleep(self._delay)
+            yield LLMResponse(chunk)
+
+
+class GeminiBackend:
+    """Реальный Gemini API"""
+
+    name = 'gemini'
+
+    def __init__(self, model_name: str):
+        api_key = config('GEMINI_API_KEY', default=None)
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY не установлен в переменных окружения")
+
+        import google.generativeai as genai
+        self._genai = genai
+        genai.configure(api_key=api_key)
+
+        self.model_name = model_name
+        self._model = genai.GenerativeModel(model_name)
+        # Асинхронный gRPC-клиент модели привязан к event loop,
+        # поэтому для каждого loop держим свой экземпляр модели
+        self._async_models = weakref.WeakKeyDictionary()
+
+    def _get_async_model(self):
+        """Экземпляр модели для текущего event loop"""
+        loop = asyncio.get_running_loop()
+        model = self._async_models.get(loop)
+        if model is None:
+            model = self._genai.GenerativeModel(self.model_name)
+            self._async_models[loop] = model
+        return model
+
+    def generate_content(self, contents, **kwargs):
+        return self._model.generate_content(contents, **kwargs)
+
+    async def generate_content_async(self, contents, **kwargs):
+        return await self._get_async_model().generate_content_async(contents, **kwargs)
+
+
+class FakeBackend:
+    """
+    Детерминированная офлайн-заглушка
+
+    По тексту промпта определяет тип запроса (задача, пакет задач, проверка
+    ответа, извлечение задач из книги) и возвращает корректный JSON:
+    линейные уравнения с целым корнем, которые проходят валидацию SymPy.
+    Последовательность ответов определяется seed.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency: float = LLM_FAKE_LATENCY, failure_rate: float = LLM_FAKE_FAILURE_RATE,
+                 invalid_rate: float = LLM_FAKE_INVALID_RATE, seed: int = LLM_FAKE_SEED):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.invalid_rate = invalid_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _problem(self, difficulty: int, index: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            a = self._rng.randint(2, 9)
+            root = self._rng.randint(-10, 10)
+            b = self._rng.randint(1, 20)
+            invalid = self._rng.random() < self.invalid_rate
+        c = a * root + b
+        problem = {
+            'title': f'Линейное уравнение {a}x + {b} = {c}',
+            'problem_text': f'Решите уравнение {a}x + {b} = {c}. Найдите x.',
+            'description': f'Решите уравнение {a}x + {b} = {c}. Найдите x.',
+            'equation_to_solve': f'{a}*x + {b} = {c}',
+            'correct_answer': str(root + 1 if invalid else root),
+            'solution_formula': f'x = ({c} - {b}) / {a}',
+            'solution_steps': [
+                f'Переносим {b} вправо: {a}x = {c} - {b}',
+                f'Получаем {a}x = {c - b}',
+                f'Делим обе части на {a}: x = {c - b}/{a}',
+                f'x = {root}',
+            ],
+            'hints': ['Перенесите свободный член в правую часть', f'Разделите обе части на {a}'],
+            'difficulty_score': difficulty,
+            'self_check': f'{a}*{root} + {b} = {c}',
+        }
+        if index is not None:
+            problem = {'index': index, **problem}
+        return problem
+
+    def _respond(self, prompt: str) -> str:
+        """Текст ответа по типу запроса"""
+        difficulty_match = re.search(r'СЛОЖНОСТЬ: (\d+)', prompt)
+        difficulty = int(difficulty_match.group(1)) if difficulty_match else 1000
+
+        if 'ОТВЕТ ПОЛЬЗОВАТЕЛЯ:' in prompt:
+            correct = re.search(r'ПРАВИЛЬНЫЙ ОТВЕТ: (.*)', prompt)
+            answer = re.search(r'ОТВЕТ ПОЛЬЗОВАТЕЛЯ: (.*)', prompt)
+            is_correct = bool(correct and answer) and (
+                correct.group(1).strip().replace(' ', '').lower()
+                == answer.group(1).strip().replace(' ', '').lower()
+            )
+            return json.dumps({
+                'is_correct': is_correct,
+                'feedback': 'Верно!' if is_correct else 'Неверно, попробуйте еще раз',
+                'confidence': 0.9,
+                'explanation': 'Ответ сравнен с правильным',
+            }, ensure_ascii=False)
+
+        batch_size = len(re.findall(r'ЗАДАЧА index=\d+', prompt))
+        if batch_size:
+            difficulties = [int(d) for d in re.findall(r'СЛОЖНОСТЬ: (\d+)', prompt)]
+            return json.dumps([
+                self._problem(difficulties[i] if i < len(difficulties) else difficulty, index=i)
+                for i in range(batch_size)
+            ], ensure_ascii=False)
+
+        if 'извлечь все математические задачи' in prompt:
+            return json.dumps([
+                dict(self._problem(difficulty), number=str(number), topic='Алгебра: Линейные уравнения')
+                for number in range(1, 4)
+            ], ensure_ascii=False)
+
+        return json.dumps(self._problem(difficulty), ensure_ascii=False)
+
+    def _maybe_fail(self):
+        with self._lock:
+            failed = self._rng.random() < self.failure_rate
+        if failed:
+            raise LLMBackendError('Внедренная ошибка заглушки LLM', code=503)
+
+    @staticmethod
+    def _prompt_text(contents) -> str:
+        if isinstance(contents, str):
+            return contents
+        return '\n'.join(part for part in contents if isinstance(part, str))
+
+    def _response(self, contents) -> LLMResponse:
+        self._maybe_fail()
+        prompt = self._prompt_text(contents)
+        text = self._respond(prompt)
+        return LLMResponse(text, _usage(_estimate_tokens(prompt), _estimate_tokens(text)))
+
+    def generate_content(self, contents, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._response(contents)
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        if stream:
+            response = self._response(contents)
+            size = max(1, len(response.text) // FAKE_STREAM_CHUNKS + 1)
+            chunks = [response.text[i:i + size] for i in range(0, len(response.text), size)]
+            return _ChunkStream(chunks, self.latency / len(chunks), response.usage_metadata)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._response(contents)
+
+
+class RecordReplayBackend:
+    """
+    Запись ответов другого бэкенда на диск и их воспроизведение
+
+    Ключ записи - хеш запроса (промпт и generation_config). На один ключ
+    записывается список ответов (повторные попытки с тем же промптом),
+    при воспроизведении они выдаются по кругу.
+    """
+
+    def __init__(self, directory: str, inner: Any = None):
+        self.directory = Path(directory)
+        self.inner = inner
+        self.name = 'record' if inner is not None else 'replay'
+        self._replay_positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if inner is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def _key_part(cls, part: Any) -> Any:
+        """
+        Стабильное представление части запроса для ключа: файлы - по хешу
+        содержимого или URI, а не по repr объекта (в нем адрес в памяти)
+        """
+        if part is None or isinstance(part, (str, int, float, bool)):
+            return part
+        if isinstance(part, (bytes, bytearray)):
+            return {'sha1': hashlib.sha1(part).hexdigest()}
+        if isinstance(part, dict):
+            return {
+                str(name): (
+                    cls._key_part(value.encode('utf-8') if isinstance(value, str) else value)
+                    if name == 'data' else cls._key_part(value)
+                )
+                for name, value in part.items()
+            }
+        if isinstance(part, (list, tuple)):
+            return [cls._key_part(item) for item in part]
+        # Загруженный файл (genai.upload_file) и изображение
+        uri = getattr(part, 'uri', None)
+        if isinstance(uri, str):
+            return {'uri': uri}
+        if callable(getattr(part, 'tobytes', None)):
+            return {'sha1': hashlib.sha1(part.tobytes()).hexdigest()}
+        if callable(getattr(part, 'to_dict', None)):
+            return cls._key_part(part.to_dict())
+        return f'<{type(part).__name__}>'
+
+    @classmethod
+    def request_key(cls, contents, generation_config=None) -> str:
+        payload = json.dumps(
+            {'contents': cls._key_part(contents), 'generation_config': cls._key_part(generation_config)},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f'{key}.json'
+
+    def _record(self, key: str, contents, chunks: List[str], usage: Any):
+        entry = {
+            'chunks': chunks,
+            'usage': {
+                'prompt_token_count': getattr(usage, 'prompt_token_count', 0) or 0,
+                'candidates_token_count': getattr(usage, 'candidates_token_count', 0) or 0,
+            },
+        }
+        with self._lock:
+            path = self._path(key)
+            record = json.loads(path.read_text('utf-8')) if path.exists() else {
+                'prompt': FakeBackend._prompt_text(contents)[:300],
+                'responses': [],
+            }
+            record['responses'].append(entry)
+            path.write_text(json.dumps(record, ensure_ascii=False, indent=2), 'utf-8')
+
+    def _replay(self, key: str) -> Dict[str, Any]:
+        path = self._path(key)
+        if not path.exists():
+            raise ReplayMissError(f'Нет записанного ответа для запроса {key[:12]}')
+        responses = json.loads(path.read_text('utf-8'))['responses']
+        with self._lock:
+            position = self._replay_positions.get(key, 0)
+            self._replay_positions[key] = position + 1
+        return responses[position % len(responses)]
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        key = self.request_key(contents, generation_config)
+        if self.inner is None:
+            entry = self._replay(key)
+            return LLMResponse(''.join(entry['chunks']), SimpleNamespace(**entry['usage']))
+
+        response = self.inner.generate_content(contents, generation_config=generation_config, **kwargs)
+        self._record(key, contents, [response.text], response.usage_metadata)
+        return response
+
+    async def generate_content_async(self, contents, generation_config=None, stream: bool = False, **kwargs):
+        key = self.request_key(contents, generation_config)
+        if self.inner is None:
+            entry = self._replay(key)
+            usage = SimpleNamespace(**entry['usage'])
+            if stream:
+                return _ChunkStream(entry['chunks'], usage=usage)
+            return LLMResponse(''.join(entry['chunks']), usage)
+
+        response = await self.inner.generate_content_async(
+            contents, generation_config=generation_config, stream=stream, **kwargs
+        )
+        if not stream:
+            self._record(key, contents, [response.text], response.usage_metadata)
+            return response
+
+        chunks = []
+        async for chunk in response:
+            chunks.append(chunk.text)
+        self._record(key, contents, chunks, getattr(response, 'usage_metadata', None))
+        return _ChunkStream(chunks, usage=getattr(response, 'usage_metadata', None))
+
+
+def create_llm_backend(model_name: str, backend: Optional[str] = None):
+    """
+    Создает бэкенд LLM по настройке LLM_BACKEND
+
+    Args:
+        model_name: Модель Gemini (для gemini и record)
+        backend: Явный выбор бэкенда вместо настройки
+    """
+    backend = backend or LLM_BACKEND
+    if backend == 'gemini':
+        return GeminiBackend(model_name)
+    if backend == 'fake':
+        return FakeBackend()
+    if backend == 'record':
+        return RecordReplayBackend(LLM_RECORDINGS_DIR, inner=GeminiBackend(model_name))
+    if backend == 'replay':
+        return RecordReplayBackend(LLM_RECORDINGS_DIR)
+    raise ValueError(f"Неизвестный LLM_BACKEND: {backend}")
@@ -0,0 +1,312 @@
+"""
+Ограничение запросов к LLM: token bucket и circuit breaker
+Состояние хранится в общем кеше Django, поэтому лимит и состояние
+предохранителя общие для всех gunicorn-воркеров (при Redis в CACHES)
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Optional
+
+from decouple import config
+from django.core.cache import cache
+
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Лимит запросов к Gemini на все воркеры: в среднем N в минуту, не больше BURST подряд
+GEMINI_RATE_PER_MINUTE = config('GEMINI_RATE_PER_MINUTE', default=60, cast=float)
+GEMINI_RATE_BURST = config('GEMINI_RATE_BURST', default=10, cast=int)
+
+# Сколько запрос готов ждать свободный токен (сек)
+GEMINI_RATE_MAX_WAIT = config('GEMINI_RATE_MAX_WAIT', default=5.0, cast=float)
+
+# Предохранитель: размыкается после N временных ошибок (таймауты, 429, 5xx)
+# подряд на RESET сек, затем пропускает один пробный запрос
+GEMINI_BREAKER_THRESHOLD = config('GEMINI_BREAKER_THRESHOLD', default=5, cast=int)
+GEMINI_BREAKER_RESET = config('GEMINI_BREAKER_RESET', default=30.0, cast=float)
+
+# Таймаут одного запроса к API (сек)
+GEMINI_CALL_TIMEOUT = config('GEMINI_CALL_TIMEOUT', default=20.0, cast=float)
+
+# Поля usage_metadata ответа Gemini -> метка kind счетчика токенов
+USAGE_FIELDS = (
+    ('prompt', 'prompt_token_count'),
+    ('response', 'candidates_token_count'),
+)
+
+
+class LLMUnavailableError(Exception):
+    """Запрос к LLM не выполнен из-за ограничений"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitExceeded(LLMUnavailableError):
+    """Не удалось получить токен за допустимое время ожидания"""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Предохранитель разомкнут - LLM временно не вызывается"""
+
+
+# Блокировка состояния корзины: сколько живет ключ (сек) и через сколько повторить попытку
+_BUCKET_LOCK_TIMEOUT = 1
+_BUCKET_LOCK_RETRY = 0.01
+
+
+class TokenBucket:
+    """
+    Token bucket в общем кеше.
+
+    Корзина вмещает burst токенов и непрерывно пополняется на rate
+    токенов в секунду, поэтому в любом интервале t проходит не больше
+    burst + rate * t запросов. Состояние (токены, время) - один ключ
+    кеша; чтение и запись выполняются под короткой блокировкой
+    через cache.add, общей для всех воркеров.
+    """
+
+    def __init__(self, name: str, rate_per_second: float, burst: int):
+        self.name = name
+        self.rate = rate_per_second
+        self.burst = max(1, burst)
+        self._state_key = f"llm_bucket_{name}"
+        self._lock_key = f"llm_bucket_{name}_lock"
+        # Полная корзина - то же, что отсутствие ключа
+        self._state_ttl = int(self.burst / self.rate) + 60
+
+    def try_acquire(self) -> float:
+        """
+        Берет токен
+
+        Returns:
+            0, если токен получен, иначе - сколько секунд ждать до следующего токена
+        """
+        if not cache.add(self._lock_key, 1, timeout=_BUCKET_LOCK_TIMEOUT):
+            return _BUCKET_LOCK_RETRY
+        try:
+            now = time.time()
+            tokens, updated_at = cache.get(self._state_key) or (self.burst, now)
+            tokens = min(self.burst, tokens + max(0.0, now - updated_at) * self.rate)
+            if tokens >= 1:
+                cache.set(self._state_key, (tokens - 1, now), timeout=self._state_ttl)
+                return 0.0
+            cache.set(self._state_key, (tokens, now), timeout=self._state_ttl)
+            return (1 - tokens) / self.rate
+        finally:
+            cache.delete(self._lock_key)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Временная ли ошибка LLM: таймаут, сбой соединения, 429 или 5xx.
+    Остальные (неверный запрос, ошибка разбора ответа) предохранитель не размыкают.
+    """
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    # google.api_core.exceptions и ошибки бэкендов LLM хранят HTTP-статус в code
+    status = getattr(error, 'code', None)
+    if not isinstance(status, int):
+        status = getattr(error, 'status_code', None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class CircuitBreaker:
+    """
+    Предохранитель в общем кеше.
+
+    Считает ошибки подряд; после threshold размыкается на reset_timeout
+    секунд. Затем пропускает один пробный запрос: успех замыкает
+    предохранитель, ошибка снова размыкает.
+    """
+
+    def __init__(self, name: str, threshold: int, reset_timeout: float):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures_key = f"llm_breaker_{name}_failures"
+        self._open_key = f"llm_breaker_{name}_open_until"
+        self._probe_key = f"llm_breaker_{name}_probe"
+
+    def retry_after(self) -> float:
+        """
+        Сколько секунд запросы еще будут отклоняться (0 - замкнут)
+        В полуоткрытом состоянии - пока не завершится пробный запрос
+        """
+        now = time.time()
+        open_until = cache.get(self._open_key)
+        if open_until is not None and open_until > now:
+            return open_until - now
+        probe_until = cache.get(self._probe_key)
+        if probe_until is not None:
+            return max(0.0, probe_until - now)
+        return 0.0
+
+    def is_open(self) -> bool:
+        return self.retry_after() > 0
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос сейчас"""
+        if self.is_open():
+            return False
+        if (cache.get(self._failures_key) or 0) >= self.threshold:
+            # Полуоткрытое состояние - пропускаем только один пробный запрос
+            return cache.add(
+                self._probe_key, time.time() + self.reset_timeout, timeout=int(self.reset_timeout) + 1
+            )
+        return True
+
+    def record_success(self):
+        if cache.get(self._failures_key):
+            cache.delete_many([self._failures_key, self._probe_key])
+
+    def record_failure(self):
+        cache.add(self._failures_key, 0, timeout=None)
+        try:
+            failures = cache.incr(self._failures_key)
+        except ValueError:
+            failures = 1
+            cache.set(self._failures_key, failures, timeout=None)
+
+        if failures >= self.threshold:
+            cache.set(self._open_key, time.time() + self.reset_timeout, timeout=int(self.reset_timeout) + 1)
+            cache.delete(self._probe_key)
+            get_metrics().increment('llm_breaker_opened_total', service=self.name)
+            logger.error(f"🔌 Предохранитель {self.name} разомкнут на {self.reset_timeout} сек | Ошибок подряд: {failures}")
+
+
+class LLMGuard:
+    """
+    Единая точка вызова LLM: предохранитель, затем лимит запросов,
+    затем сам запрос с учетом успеха/ошибки.
+
+    Каждый вызов попадает в метрики: llm_call_seconds (время по операции
+    и исходу) и llm_tokens_total (токены промпта и ответа из usage_metadata).
+    """
+
+    def __init__(self, name: str = 'gemini'):
+        self.name = name
+        self.bucket = TokenBucket(name, GEMINI_RATE_PER_MINUTE / 60.0, GEMINI_RATE_BURST)
+        self.breaker = CircuitBreaker(name, GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_RESET)
+        # None - ждать токен без ограничения (фоновые команды)
+        self.max_wait: Optional[float] = GEMINI_RATE_MAX_WAIT
+
+    def is_open(self) -> bool:
+        """Предохранитель разомкнут - вызывать LLM бессмысленно"""
+        return self.breaker.is_open()
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            get_metrics().increment('llm_rejected_total', service=self.name, reason='circuit_open')
+            raise CircuitOpenError(
+                'Сервис ИИ временно недоступен', retry_after=self.breaker.retry_after()
+            )
+
+    def _rate_limited(self, waited: float, wait: float):
+        if self.max_wait is not None and waited + wait > self.max_wait:
+            get_metrics().increment('llm_rejected_total', service=self.name, reason='rate_limit')
+            raise RateLimitExceeded('Превышен лимит запросов к ИИ', retry_after=wait)
+
+    def before_call(self):
+        """Проверяет предохранитель и ждет токен (синхронно)"""
+        self._check_breaker()
+        waited = 0.0
+        while True:
+            wait = self.bucket.try_acquire()
+            if not wait:
+                return
+            self._rate_limited(waited, wait)
+            time.sleep(wait)
+            waited += wait
+
+    async def abefore_call(self):
+        """Асинхронная версия before_call: ожидание не блокирует event loop"""
+        self._check_breaker()
+        waited = 0.0
+        while True:
+            wait = self.bucket.try_acquire()
+            if not wait:
+                return
+            self._rate_limited(waited, wait)
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def record_success(self):
+        self.breaker.record_success()
+
+    def record_failure(self, error: BaseException):
+        logger.warning(f"⚠️ Ошибка запроса к {self.name}: {error}")
+        if is_transient_error(error):
+            self.breaker.record_failure()
+
+    def observe_call(self, operation: str, seconds: float, outcome: str, response: Any = None):
+        """
+        Метрики одного запроса к LLM
+
+        Args:
+            operation: Операция (generate, check, book_pdf, ...)
+            seconds: Время запроса
+            outcome: ok, error или timeout
+            response: Ответ модели (для подсчета токенов)
+        """
+        metrics = get_metrics()
+        metrics.observe('llm_call_seconds', seconds, service=self.name, operation=operation, outcome=outcome)
+
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        for kind, field in USAGE_FIELDS:
+            tokens = getattr(usage, field, 0) or 0
+            if tokens:
+                metrics.increment('llm_tokens_total', tokens, service=self.name, operation=operation, kind=kind)
+
+    def call(self, func: Callable[..., Any], *args, operation: str = 'call', **kwargs) -> Any:
+        """Синхронный вызов LLM через ограничения"""
+        self.before_call()
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.observe_call(operation, time.monotonic() - started, 'error')
+            self.record_failure(e)
+            raise
+        self.observe_call(operation, time.monotonic() - started, 'ok', result)
+        self.record_success()
+        return result
+
+    async def acall(self, func: Callable[..., Any], *args, operation: str = 'call', **kwargs) -> Any:
+        """
+        Асинхронный вызов LLM через ограничения.
+        Таймаут запроса считается ошибкой, отмена извне (например,
+        проигравшая параллельная попытка) - нет.
+        """
+        await self.abefore_call()
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), timeout=GEMINI_CALL_TIMEOUT)
+        except asyncio.TimeoutError as e:
+            self.observe_call(operation, time.monotonic() - started, 'timeout')
+            self.record_failure(e)
+            raise
+        except Exception as e:
+            self.observe_call(operation, time.monotonic() - started, 'error')
+            self.record_failure(e)
+            raise
+        self.observe_call(operation, time.monotonic() - started, 'ok', result)
+        self.record_success()
+        return result
+
+
+# Singleton instance
+_llm_guard = None
+
+def get_llm_guard() -> LLMGuard:
+    """Получить экземпляр LLMGuard (Singleton на процесс, состояние - в общем кеше)"""
+    global _llm_guard
+    if _llm_guard is None:
+        _llm_guard = LLMGuard()
+    return _llm_guard
@@ -759,6 +759,43 @@ def _generate_additional_topics():
 # Добавляем сгенерированные темы к основной базе
 MATH_TOPICS_DATABASE.extend(_generate_additional_topics())
 
+# ==================== ИНДЕКСЫ КАТАЛОГА ====================
+# Строятся один раз при импорте, чтобы запросы не сканировали весь список
+
+# Ширина корзины сложности для интервального индекса
+_DIFFICULTY_BUCKET = 100
+
+
+def _build_grade_index(topics):
+    """Класс -> темы класса, отсортированные по минимальной сложности"""
+    by_grade = {}
+    for topic in topics:
+        for grade in range(topic['grade_min'], topic['grade_max'] + 1):
+            by_grade.setdefault(grade, []).append(topic)
+    for grade_topics in by_grade.values():
+        # Сортировка устойчивая - порядок внутри равной сложности как в каталоге
+        grade_topics.sort(key=lambda x: x['difficulty_min'])
+    return by_grade
+
+
+def _build_interval_index(topics):
+    """
+    Корзина сложности -> темы, чей интервал [difficulty_min, difficulty_max]
+    пересекает корзину. Поиск по точке - одна корзина и проверка её тем.
+    """
+    buckets = {}
+    for topic in topics:
+        first = topic['difficulty_min'] // _DIFFICULTY_BUCKET
+        last = topic['difficulty_max'] // _DIFFICULTY_BUCKET
+        for bucket in range(first, last + 1):
+            buckets.setdefault(bucket, []).append(topic)
+    return buckets
+
+
+_TOPICS_BY_GRADE = _build_grade_index(MATH_TOPICS_DATABASE)
+_TOPICS_BY_DIFFICULTY_BUCKET = _build_interval_index(MATH_TOPICS_DATABASE)
+
+
 # Функция для получения тем по классу
 def get_topics_by_grade(grade: int, max_topics: int = 50):
     """
@@ -771,15 +808,7 @@ def get_topics_by_grade(grade: int, max_topics: int = 50):
     Returns:
         List of topics
     """
-    suitable_topics = [
-        topic for topic in MATH_TOPICS_DATABASE
-        if topic['grade_min'] <= grade <= topic['grade_max']
-    ]
-    
-    # Сортируем по сложности
-    suitable_topics.sort(key=lambda x: x['difficulty_min'])
-    
-    return suitable_topics[:max_topics]
+    return _TOPICS_BY_GRADE.get(grade, [])[:max_topics]
 
 
 # Функция для получения темы по сложности
@@ -796,14 +825,14 @@ def get_topic_by_difficulty(difficulty: int, grade: int = None):
     """
     import random
     
-    suitable_topics = []
+    if difficulty < 0:
+        return None
     
-    for topic in MATH_TOPICS_DATABASE:
-        # Проверяем соответствие сложности
-        if topic['difficulty_min'] <= difficulty <= topic['difficulty_max']:
-            # Если указан класс, проверяем его
-            if grade is None or (topic['grade_min'] <= grade <= topic['grade_max']):
-                suitable_topics.append(topic)
+    suitable_topics = [
+        topic for topic in _TOPICS_BY_DIFFICULTY_BUCKET.get(difficulty // _DIFFICULTY_BUCKET, ())
+        if topic['difficulty_min'] <= difficulty <= topic['difficulty_max']
+        and (grade is None or topic['grade_min'] <= grade <= topic['grade_max'])
+    ]
     
     if suitable_topics:
         return random.choice(suitable_topics)
@@ -824,7 +853,7 @@ def get_random_topic_for_grade(grade: int):
     """
     import random
     
-    topics = get_topics_by_grade(grade, max_topics=1000)
+    topics = _TOPICS_BY_GRADE.get(grade)
     
     if topics:
         return random.choice(topics)
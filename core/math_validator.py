@@ -3,22 +3,293 @@
 Использует SymPy для проверки корректности решений и ответов
 """
 
+import cmath
 import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from typing import Dict, List, Any, Optional, Tuple
 import re
-from sympy import symbols, solve, simplify, expand, factor, sqrt, Eq, sympify
-from sympy.parsing.latex import parse_latex
-from sympy.core.sympify import SympifyError
+from decouple import config
 
 logger = logging.getLogger(__name__)
 
+# SymPy импортируется при создании первого MathValidator (_load_sympy): модуль
+# импортируют views и команды, которым проверка может не понадобиться
+symbols = solve = simplify = sympify = Float = Rational = SympifyError = None
+_sympy_loaded = False
+
+
+def _load_sympy():
+    """Импортирует используемые имена SymPy в модуль (один раз на процесс)"""
+    global symbols, solve, simplify, sympify, Float, Rational, SympifyError, _sympy_loaded
+    if _sympy_loaded:
+        return
+    from sympy import Float, Rational, simplify, solve, symbols, sympify
+    from sympy.core.sympify import SympifyError
+    _sympy_loaded = True
+
+# Кеш разобранных и решенных уравнений: максимум записей и время жизни (сек)
+MATH_SOLVE_CACHE_SIZE = config('MATH_SOLVE_CACHE_SIZE', default=2048, cast=int)
+MATH_SOLVE_CACHE_TTL = config('MATH_SOLVE_CACHE_TTL', default=3600, cast=float)
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Числовая проверка перед simplify: в выражение подставляются числа с точностью
+# NUMERIC_DPS знаков, simplify вызывается, только если вывод не ясен
+MATH_NUMERIC_FAST_PATH = config('MATH_NUMERIC_FAST_PATH', default=True, cast=bool)
+NUMERIC_DPS = 30
+# Подстановка корня: |значение| меньше - корень верен (допуск прежней проверки),
+# больше NUMERIC_NONZERO - неверен, между ними - решает simplify
+NUMERIC_ZERO = 1e-10
+NUMERIC_NONZERO = 1e-8
+
+# Десятичная дробь ("2.54") и наименьшее число знаков округленного ответа:
+# "2.5" для 2.54 - неверный ответ, а не округление
+_DECIMAL_RE = re.compile(r'^-?\d+\.(\d+)$')
+MIN_ROUNDED_DECIMALS = 2
+
+
+def _parse_exact(answer: str):
+    """Разбирает ответ; десятичная дробь - точное рациональное число, а не Float"""
+    if _DECIMAL_RE.match(answer.strip()):
+        return Rational(answer.strip())
+    return sympify(answer)
+
+
+def _is_terminating(value) -> bool:
+    """Рациональное число записывается конечной десятичной дробью (знаменатель 2^a*5^b)"""
+    if not value.is_Rational:
+        return False
+    denominator = int(value.q)
+    for prime in (2, 5):
+        while denominator % prime == 0:
+            denominator //= prime
+    return denominator == 1
+
+
+def _rounded_match(answer: str, value, exact) -> Optional[bool]:
+    """
+    Является ли десятичный answer (value) округлением exact до своих знаков
+
+    Округление засчитывается, только если exact нельзя записать конечной
+    дробью (1/3, sqrt(2)) и в ответе не меньше MIN_ROUNDED_DECIMALS знаков.
+
+    Returns:
+        True/False или None, если округление неприменимо - нужно точное сравнение
+    """
+    match = _DECIMAL_RE.match(answer.strip())
+    if not match or len(match.group(1)) < MIN_ROUNDED_DECIMALS:
+        return None
+    if _is_terminating(exact) or not exact.is_real:
+        return None
+    digits = len(match.group(1))
+    error = abs((exact - value).evalf(NUMERIC_DPS))
+    return bool(error <= Rational(5, 10 ** (digits + 1)))
+# Сравнение выражений с переменными: случайные точки и допуски (относительные)
+NUMERIC_SAMPLE_POINTS = 6
+NUMERIC_EQUAL = 1e-20
+NUMERIC_DIFFERENT = 1e-8
+
+
+def _numeric_value(expression, substitutions: Dict[Any, Any]) -> Optional[Any]:
+    """
+    Значение выражения после подстановки чисел с точностью NUMERIC_DPS
+    None - значение не число или не конечно (вне области определения)
+    """
+    try:
+        numbers = {var: value.evalf(NUMERIC_DPS + 5) for var, value in substitutions.items()}
+        value = expression.xreplace(numbers).evalf(NUMERIC_DPS)
+        if value.is_number and cmath.isfinite(complex(value)):
+            return value
+    except (TypeError, ValueError, ZeroDivisionError, OverflowError):
+        pass
+    return None
+
+
+@dataclass
+class SolvedEquation:
+    """
+    Результат разбора и решения уравнения (запись кеша)
+    Ошибки разбора и решения тоже кешируются, чтобы не повторять их
+    """
+    expression: Any = None
+    solutions: Optional[Tuple[Any, ...]] = None
+    parse_error: Optional[str] = None
+    solve_error: Optional[str] = None
+    # Результаты подстановки заявленных решений: решение -> (верно, результат подстановки)
+    checks: Dict[str, Tuple[bool, str]] = field(default_factory=dict)
+
+
+class SolveCache:
+    """
+    LRU-кеш с ограничением размера и времени жизни записей
+    Потокобезопасен; вычисление значения при промахе выполняется вне блокировки
+    """
+    
+    def __init__(self, maxsize: int = MATH_SOLVE_CACHE_SIZE, ttl: float = MATH_SOLVE_CACHE_TTL):
+        self.maxsize = max(0, maxsize)
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Значение по ключу или None (нет записи или истек TTL)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+    
+    def put(self, key: str, value: Any):
+        """Сохраняет значение, вытесняя давно не использованные записи"""
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def values(self) -> List[Any]:
+        """Все значения кеша (без учета TTL и статистики)"""
+        with self._lock:
+            return [value for _, value in self._entries.values()]
+    
+    def clear(self):
+        """Очищает кеш и статистику"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Размер кеша и статистика попаданий"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
 
 class MathValidator:
     """Класс для валидации математических решений"""
     
     def __init__(self):
         """Инициализация валидатора"""
+        _load_sympy()
         self.common_vars = symbols('x y z a b c t n m k p q r s u v w')
+        self.solve_cache = SolveCache()
+    
+    def _solve_equation(self, equation: str, var) -> SolvedEquation:
+        """
+        Разбирает и решает уравнение относительно var с кешированием
+        Ключ - уравнение без пробелов, переменная и ее допущения (real)
+        """
+        canonical = _WHITESPACE.sub('', equation)
+        key = f"{var.name}|{'real' if var.is_real else 'complex'}|{canonical}"
+        solved = self.solve_cache.get(key)
+        if solved is not None:
+            return solved
+        
+        solved = SolvedEquation()
+        try:
+            solved.expression = self._parse_equation(equation, var)
+        except Exception as e:
+            solved.parse_error = str(e)
+        else:
+            try:
+                solved.solutions = tuple(solve(solved.expression, var))
+            except Exception as e:
+                solved.solve_error = str(e)
+        
+        self.solve_cache.put(key, solved)
+        return solved
+    
+    def _check_root(self, solved: SolvedEquation, var, sol_value) -> Tuple[bool, str]:
+        """
+        Подставляет решение в уравнение: сначала точная подстановка и числовая
+        проверка, simplify - только если результат не ясен
+
+        Returns:
+            (верно ли решение, результат подстановки)
+        """
+        verification = solved.expression.subs(var, sol_value)
+        
+        if MATH_NUMERIC_FAST_PATH:
+            # Подстановка уже дала число (целые и рациональные корни)
+            if verification.is_Number:
+                return bool(verification == 0 or abs(float(verification)) < NUMERIC_ZERO), str(verification)
+            
+            # Иррациональные корни: значение в точке с высокой точностью
+            value = _numeric_value(solved.expression, {var: sol_value}) if sol_value.is_number else None
+            if value is not None and abs(complex(value)) < NUMERIC_ZERO:
+                return True, '0'
+            if value is not None and abs(complex(value)) > NUMERIC_NONZERO:
+                return False, str(verification)
+        
+        simplified = simplify(verification)
+        
+        # Проверяем, равно ли нулю
+        is_correct = simplified == 0 or abs(float(simplified)) < 1e-10
+        return bool(is_correct), str(simplified)
+    
+    def _numeric_equivalence(self, expr1, expr2) -> Optional[bool]:
+        """
+        Сравнивает выражения с переменными в случайных точках
+        
+        Returns:
+            True - совпадают во всех точках, False - различаются хотя бы в одной,
+            None - вывод не ясен (значения не вычислились или близки к допуску)
+        """
+        variables = expr1.free_symbols | expr2.free_symbols
+        
+        # Точки детерминированы выражением: повторная проверка дает тот же ответ
+        rng = random.Random(f'{expr1}|{expr2}')
+        evaluated = 0
+        for _ in range(NUMERIC_SAMPLE_POINTS):
+            point = {
+                var: Float(rng.choice((-1, 1)) * rng.uniform(0.2, 3.0), NUMERIC_DPS + 5)
+                for var in sorted(variables, key=str)
+            }
+            value1 = _numeric_value(expr1, point)
+            value2 = _numeric_value(expr2, point)
+            if value1 is None or value2 is None:
+                continue
+            difference = abs(complex((value1 - value2).evalf(NUMERIC_DPS)))
+            scale = max(1.0, abs(complex(value1)), abs(complex(value2)))
+            if difference > NUMERIC_DIFFERENT * scale:
+                return False
+            if difference > NUMERIC_EQUAL * scale:
+                return None
+            evaluated += 1
+        
+        # Совпадение в большинстве точек, остальные не вычислились (вне области определения)
+        return True if evaluated * 2 > NUMERIC_SAMPLE_POINTS else None
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Статистика кеша решенных уравнений"""
+        return self.solve_cache.stats()
     
     def validate_equation_solution(
         self,
@@ -50,50 +321,43 @@ class MathValidator:
         }
         
         try:
-            # Парсим уравнение
+            # Парсим и решаем уравнение (результат кешируется)
             var = symbols(variable)
+            solved = self._solve_equation(equation, var)
             
-            # Пробуем распарсить как LaTeX
-            try:
-                eq = self._parse_equation(equation, var)
-            except Exception as e:
-                logger.warning(f"Не удалось распарсить уравнение: {e}")
-                result['errors'].append(f"Ошибка парсинга уравнения: {str(e)}")
+            if solved.parse_error is not None:
+                logger.warning(f"Не удалось распарсить уравнение: {solved.parse_error}")
+                result['errors'].append(f"Ошибка парсинга уравнения: {solved.parse_error}")
                 return result
             
-            # Решаем уравнение через SymPy
-            try:
-                sympy_sols = solve(eq, var)
-                result['sympy_solutions'] = [str(sol) for sol in sympy_sols]
-                logger.info(f"SymPy решения: {result['sympy_solutions']}")
-            except Exception as e:
-                logger.error(f"SymPy не смог решить уравнение: {e}")
-                result['errors'].append(f"Не удалось решить уравнение: {str(e)}")
+            if solved.solve_error is not None:
+                logger.error(f"SymPy не смог решить уравнение: {solved.solve_error}")
+                result['errors'].append(f"Не удалось решить уравнение: {solved.solve_error}")
                 return result
             
+            result['sympy_solutions'] = [str(sol) for sol in solved.solutions]
+            logger.info(f"SymPy решения: {result['sympy_solutions']}")
+            
             # Проверяем каждое заявленное решение
             for claimed_sol in claimed_solutions:
                 try:
-                    # Парсим решение
-                    sol_value = sympify(claimed_sol)
-                    
-                    # Подставляем в исходное уравнение
-                    verification = eq.subs(var, sol_value)
-                    simplified = simplify(verification)
-                    
-                    # Проверяем, равно ли нулю
-                    is_correct = simplified == 0 or abs(float(simplified)) < 1e-10
+                    check = solved.checks.get(claimed_sol)
+                    if check is None:
+                        # Парсим решение и подставляем в исходное уравнение
+                        check = self._check_root(solved, var, sympify(claimed_sol))
+                        solved.checks[claimed_sol] = check
                     
+                    is_correct, substitution = check
                     result['verification'][claimed_sol] = {
                         'is_correct': is_correct,
-                        'substitution_result': str(simplified)
+                        'substitution_result': substitution
                     }
                     
                     if is_correct:
                         result['correct_solutions'].append(claimed_sol)
                     else:
                         result['errors'].append(
-                            f"Решение {claimed_sol} неверно: при подстановке получается {simplified}"
+                            f"Решение {claimed_sol} неверно: при подстановке получается {substitution}"
                         )
                         
                 except Exception as e:
@@ -151,11 +415,12 @@ class MathValidator:
         try:
             var = symbols(variable, real=True)
             
-            # Парсим уравнение
-            eq = self._parse_equation(equation, var)
-            
-            # Решаем уравнение
-            all_solutions = solve(eq, var)
+            # Парсим и решаем уравнение (результат кешируется)
+            solved = self._solve_equation(equation, var)
+            if solved.parse_error is not None or solved.solve_error is not None:
+                raise ValueError(solved.parse_error or solved.solve_error)
+            eq = solved.expression
+            all_solutions = solved.solutions
             
             # Проверяем каждое решение на ОДЗ
             for sol in all_solutions:
@@ -197,6 +462,14 @@ class MathValidator:
             claimed_set = set(claimed_solutions)
             correct_set = set(result['correct_solutions'])
             
+            # solve для вещественной переменной сам отбрасывает посторонние корни
+            # (например, появляющиеся при возведении в квадрат) - заявленные
+            # решения вне найденных тоже считаются посторонними
+            for claimed_sol in claimed_solutions:
+                if claimed_sol not in correct_set and claimed_sol not in result['extraneous_roots']:
+                    result['extraneous_roots'].append(claimed_sol)
+                    result['odz_check'][claimed_sol] = 'Не удовлетворяет уравнению или ОДЗ'
+            
             if claimed_set == correct_set:
                 result['is_valid'] = True
             else:
@@ -231,20 +504,72 @@ class MathValidator:
         Returns:
             bool - эквивалентны ли выражения
         """
+        verdict = self.compare_answers(answer1, answer2)
+        if verdict is None:
+            # Пробуем простое строковое сравнение
+            return answer1.strip() == answer2.strip()
+        return verdict
+    
+    def compare_answers(
+        self,
+        answer1: str,
+        answer2: str,
+        rounded: bool = False
+    ) -> Optional[bool]:
+        """
+        Сравнивает два ответа, различая "не равны" и "не удалось решить"
+        
+        Целые и рациональные числа (и десятичные дроби) сравниваются точно,
+        относительная погрешность 1e-9 - только для иррациональных значений.
+        
+        Args:
+            answer1: Первое выражение
+            answer2: Второе выражение
+            rounded: answer1 может быть округленным answer2: 0.33 для 1/3
+                засчитывается, 2.5 для 2.54 - нет (см. _rounded_match)
+        
+        Returns:
+            True/False, если эквивалентность установлена,
+            None - если выражения не разобрать или символьно сравнить не удалось
+        """
+        try:
+            expr1 = _parse_exact(answer1)
+            expr2 = _parse_exact(answer2)
+        except (SympifyError, SyntaxError, TypeError, ValueError) as e:
+            logger.debug(f"Не удалось разобрать ответ для сравнения: {e}")
+            return None
+        
         try:
-            expr1 = sympify(answer1)
-            expr2 = sympify(answer2)
+            if expr1.is_number and expr2.is_number:
+                if rounded:
+                    verdict = _rounded_match(answer1, expr1, expr2)
+                    if verdict is not None:
+                        return verdict
+                # Рациональные - точно: 1000000001 и 1000000000 различаются
+                if expr1.is_Rational and expr2.is_Rational:
+                    return expr1 == expr2
+                value1 = complex(expr1.evalf())
+                value2 = complex(expr2.evalf())
+                return abs(value1 - value2) <= 1e-9 * max(1.0, abs(value2))
+            
+            # Выражения с переменными: сначала значения в случайных точках.
+            # Различие - не доказанная неэквивалентность, поэтому None
+            if MATH_NUMERIC_FAST_PATH:
+                if expr1 - expr2 == 0:
+                    return True
+                numeric = self._numeric_equivalence(expr1, expr2)
+                if numeric is not None:
+                    return True if numeric else None
             
             # Упрощаем разность
             diff = simplify(expr1 - expr2)
             
-            # Проверяем, равна ли разность нулю
-            return diff == 0
+            # Проверяем, равна ли разность нулю; иначе - не доказано
+            return True if diff == 0 else None
             
         except Exception as e:
             logger.error(f"Ошибка проверки эквивалентности: {e}")
-            # Пробуем простое строковое сравнение
-            return answer1.strip() == answer2.strip()
+            return None
     
     def validate_step_by_step_solution(
         self,
@@ -320,16 +645,20 @@ class MathValidator:
         cleaned = cleaned.replace('sqrt', 'sqrt')
         cleaned = cleaned.replace('{', '(').replace('}', ')')
         
+        # Имя переменной связывается с переданным символом, иначе sympify
+        # создаст символ без допущений (real=True) и solve его не найдет
+        local_symbols = {var.name: var}
+        
         # Разделяем по знаку равенства
         if '=' in cleaned:
             parts = cleaned.split('=')
             if len(parts) == 2:
-                left = sympify(parts[0].strip())
-                right = sympify(parts[1].strip())
+                left = sympify(parts[0].strip(), locals=local_symbols)
+                right = sympify(parts[1].strip(), locals=local_symbols)
                 return left - right
         
         # Если нет знака равенства, считаем что уравнение = 0
-        return sympify(cleaned)
+        return sympify(cleaned, locals=local_symbols)
     
     def get_equation_domain(
         self,
@@ -382,3 +711,92 @@ def get_math_validator() -> MathValidator:
     if _math_validator is None:
         _math_validator = MathValidator()
     return _math_validator
+
+
+def get_solve_cache_stats() -> Dict[str, Any]:
+    """Статистика кеша решений; пока проверок не было, SymPy не загружается"""
+    if _math_validator is None:
+        return SolveCache().stats()
+    return _math_validator.cache_stats()
+
+
+# Вердикты проверки задачи (validate_problem_payload и пул процессов)
+VERDICT_PASS = 'pass'
+VERDICT_FAIL = 'fail'
+VERDICT_SKIPPED = 'skipped'
+VERDICT_ERROR = 'error'
+VERDICT_TIMEOUT = 'timeout'
+VERDICT_MEMORY = 'memory'
+# Проверка не выполнялась: все процессы пула заняты (не вердикт о задаче)
+VERDICT_BUSY = 'busy'
+
+# Поля задачи, нужные для проверки
+PROBLEM_VALIDATION_FIELDS = ('equation_to_solve', 'solution_formula', 'correct_answer', 'title')
+
+
+def _is_rounded_solution(validator: MathValidator, answer: str, solutions: List[str]) -> bool:
+    """Совпадает ли десятичный ответ с одним из корней с точностью его округления"""
+    return bool(_DECIMAL_RE.match(answer.strip())) and any(
+        validator.compare_answers(answer, solution, rounded=True) for solution in solutions
+    )
+
+
+def validate_problem_payload(problem_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Проверяет решение сгенерированной задачи через SymPy
+
+    Выбирает уравнение (equation_to_solve или solution_formula), разбирает
+    ответ на отдельные решения и вызывает проверку обычного или
+    иррационального уравнения. Аргументы и результат - простые типы,
+    поэтому функция выполняется и в процессах пула проверки.
+
+    Args:
+        problem_data: Данные задачи (достаточно PROBLEM_VALIDATION_FIELDS)
+
+    Returns:
+        Dict: verdict (pass/fail/skipped), equation, answers, errors, sympy_solutions,
+        wrong_answers - ответы, которые при подстановке не удовлетворяют уравнению
+        и не совпадают ни с одним корнем с точностью округления (fail без них -
+        например, пропущенный корень, неразобранное уравнение или ответ 3.33 для 10/3)
+    """
+    equation = problem_data.get('equation_to_solve', '') or problem_data.get('solution_formula', '')
+    correct_answer = problem_data.get('correct_answer', '')
+
+    # Пропускаем валидацию для геометрических и текстовых задач
+    if not equation or 'площадь' in problem_data.get('title', '').lower():
+        return {'verdict': VERDICT_SKIPPED, 'equation': equation, 'answers': [], 'errors': []}
+
+    # Парсим ответ (может быть несколько решений)
+    if ',' in correct_answer:
+        answers = [a.strip() for a in correct_answer.split(',')]
+    elif 'и' in correct_answer:
+        answers = [a.strip() for a in correct_answer.split('и')]
+    else:
+        answers = [correct_answer.strip()]
+
+    validator = get_math_validator()
+    if 'sqrt' in equation.lower() or '\\sqrt' in equation:
+        validation_result = validator.validate_irrational_equation(equation, answers)
+    else:
+        validation_result = validator.validate_equation_solution(equation, answers)
+
+    wrong_answers = []
+    if not validation_result.get('is_valid'):
+        # Иррациональная проверка не подставляет ответы в уравнение - подставляем отдельно
+        verification = validation_result.get('verification')
+        if verification is None:
+            verification = validator.validate_equation_solution(equation, answers)['verification']
+        solutions = validation_result.get('sympy_solutions', validation_result.get('correct_solutions', []))
+        wrong_answers = [
+            answer for answer, check in verification.items()
+            if not check['is_correct'] and not _is_rounded_solution(validator, answer, solutions)
+        ]
+
+    return {
+        'verdict': VERDICT_PASS if validation_result.get('is_valid') else VERDICT_FAIL,
+        'equation': equation,
+        'answers': answers,
+        'errors': validation_result.get('errors', []),
+        'sympy_solutions': validation_result.get('sympy_solutions', validation_result.get('correct_solutions', [])),
+        'wrong_answers': wrong_answers,
+    }
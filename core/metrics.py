@@ -0,0 +1,104 @@
+"""
+Метрики процесса: счетчики и гистограммы
+Хранятся в памяти воркера, снимок отдается через snapshot()
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, Tuple
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _make_key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class _Histogram:
+    """Гистограмма с фиксированными корзинами"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'total')
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def to_dict(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'count': self.count, 'sum': round(self.total, 6), 'buckets': buckets}
+
+
+class Metrics:
+    """Реестр счетчиков и гистограмм с метками (потокобезопасный)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, _Histogram] = {}
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """Увеличивает счетчик"""
+        key = _make_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels):
+        """Добавляет значение в гистограмму"""
+        key = _make_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def get_counter(self, name: str, **labels) -> float:
+        """Текущее значение счетчика"""
+        with self._lock:
+            return self._counters.get(_make_key(name, labels), 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Снимок всех метрик для отдачи в JSON"""
+        with self._lock:
+            return {
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), **histogram.to_dict()}
+                    for (name, labels), histogram in sorted(
+                        self._histograms.items(), key=lambda item: item[0]
+                    )
+                ],
+            }
+
+    def reset(self):
+        """Сбрасывает все метрики"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+# Singleton instance
+_metrics = None
+
+def get_metrics() -> Metrics:
+    """Получить экземпляр Metrics (Singleton на процесс)"""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
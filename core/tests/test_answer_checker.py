@@ -0,0 +1,101 @@
+"""
+Unit-тесты для локальной проверки ответов
+"""
+
+import time
+import unittest
+from core.answer_checker import (
+    TIER_EXACT, TIER_SYMPY, canonical_answer, check_answer_locally, problem_fingerprint, split_answers,
+    split_labelled_answers
+)
+
+
+class TestAnswerChecker(unittest.TestCase):
+    """Тесты для check_answer_locally"""
+    
+    def test_split_answers(self):
+        """Несколько корней, префиксы переменных и десятичная запятая"""
+        self.assertEqual(split_answers('x1 = 2; x2 = 0,5'), ['2', '0.5'])
+        self.assertEqual(split_answers('2 и 3'), ['2', '3'])
+        self.assertEqual(split_answers('x^2'), ['x**2'])
+    
+    def test_exact_match(self):
+        """Точное совпадение без учета порядка корней"""
+        result = check_answer_locally('x = 3; x = 2', '2, 3')
+        self.assertTrue(result['is_correct'])
+        self.assertEqual(result['tier'], TIER_EXACT)
+    
+    def test_sympy_equivalence(self):
+        """Эквивалентные формы ответа засчитываются через SymPy"""
+        for user_answer, correct_answer in [('0,5', '1/2'), ('2*sqrt(2)', 'sqrt(8)'), ('0.33', '1/3')]:
+            result = check_answer_locally(user_answer, correct_answer)
+            self.assertTrue(result['is_correct'], user_answer)
+            self.assertEqual(result['tier'], TIER_SYMPY)
+    
+    def test_wrong_answer_decided_locally(self):
+        """Неверный числовой ответ и пропущенный корень решаются без ИИ"""
+        self.assertFalse(check_answer_locally('4', '3')['is_correct'])
+        self.assertFalse(check_answer_locally('332.0', '1000/3')['is_correct'])
+        self.assertFalse(check_answer_locally('2', '2; 3')['is_correct'])
+    
+    def test_rounding_only_for_non_terminating(self):
+        """Округление засчитывается, только если правильный ответ требует больше знаков"""
+        for user_answer, correct_answer in [('2.5', '2.54'), ('12.3', '12.34'), ('0.1', '0.14'), ('0.3', '1/3')]:
+            result = check_answer_locally(user_answer, correct_answer)
+            self.assertFalse(result and result['is_correct'], user_answer)
+        self.assertTrue(check_answer_locally('1.41', 'sqrt(2)')['is_correct'])
+        self.assertFalse(check_answer_locally('1000000001', '1000000000')['is_correct'])
+    
+    def test_ambiguous_decimal_comma(self):
+        """Запятая без пробела - десятичная только для единственного правильного числа"""
+        for user_answer in ['-2, 3', 'x1=-2, x2=3', '-2; 3']:
+            result = check_answer_locally(user_answer, '-2,3')
+            self.assertTrue(result is None or result['is_correct'], user_answer)
+        self.assertIsNone(check_answer_locally('0.5', '0,5'))
+        self.assertTrue(check_answer_locally('-2,3', '-2.3')['is_correct'])
+        self.assertIsNone(check_answer_locally('-2,3', '-2; 3'))
+    
+    def test_undecidable_escalates(self):
+        """Текстовые и недоказанные символьные ответы передаются Gemini"""
+        self.assertIsNone(check_answer_locally('x > 3', '(3; +∞)'))
+        self.assertIsNone(check_answer_locally('2*x', 'x + 1'))
+        self.assertIsNone(check_answer_locally('__import__("os")', '1'))
+    
+    def test_exponent_tower_not_evaluated(self):
+        """Башня степеней и большой показатель не передаются в sympify"""
+        started = time.monotonic()
+        self.assertIsNone(check_answer_locally('9^9^9', '1'))
+        self.assertIsNone(check_answer_locally('(9^9)^9', '1'))
+        self.assertIsNone(check_answer_locally('2^1000000', '1'))
+        self.assertIsNone(check_answer_locally('exp(exp(exp(100)))', '5'))
+        self.assertIsNone(check_answer_locally('exp(1000)^2', '5'))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertTrue(check_answer_locally('2^(1/3)', '2**(1/3)')['is_correct'])
+    
+    def test_system_answers_keep_variables(self):
+        """Значения разных переменных сопоставляются по именам, а не как множество корней"""
+        self.assertEqual(split_labelled_answers('x = 3, y = 2'), [('x', '3'), ('y', '2')])
+        self.assertFalse(check_answer_locally('x=3, y=2', 'x=2, y=3')['is_correct'])
+        self.assertTrue(check_answer_locally('y = 3; x = 0,5', 'x = 1/2, y = 3')['is_correct'])
+        self.assertTrue(check_answer_locally('2, 3', 'x = 2, y = 3')['is_correct'])
+        self.assertFalse(check_answer_locally('3, 2', 'x = 2, y = 3')['is_correct'])
+    
+    def test_canonical_answer(self):
+        """Одинаковые по смыслу ответы дают одну каноническую форму"""
+        self.assertEqual(canonical_answer('x = 5'), canonical_answer('5.0'))
+        self.assertEqual(canonical_answer('x = 3; x = 2'), canonical_answer('2, 3'))
+        self.assertEqual(canonical_answer('x*2'), canonical_answer('2*x'))
+        self.assertNotEqual(canonical_answer('5'), canonical_answer('6'))
+        self.assertEqual(canonical_answer('y = 2, x = 0,5'), 'x=1/2;y=2')
+        self.assertNotEqual(canonical_answer('x=3, y=2'), canonical_answer('x=2, y=3'))
+        self.assertEqual(canonical_answer('9^9^9'), '9**9**9')
+    
+    def test_problem_fingerprint(self):
+        """Хеш зависит от содержимого задачи, а не от служебных полей"""
+        problem = {'title': 'Задача', 'correct_answer': '2'}
+        self.assertEqual(problem_fingerprint(problem), problem_fingerprint(dict(problem, problem_id=7)))
+        self.assertNotEqual(problem_fingerprint(problem), problem_fingerprint(dict(problem, correct_answer='3')))
+
+
+if __name__ == '__main__':
+    unittest.main()
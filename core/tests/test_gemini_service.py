@@ -0,0 +1,273 @@
+"""
+Unit-тесты для GeminiService с заглушкой модели (без обращения к API)
+"""
+
+import asyncio
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+from core import gemini_service
+from core.gemini_service import GeminiService
+from core.metrics import get_metrics
+from core.validation_pool import ValidationPool
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class _StubModel:
+    """
+    Модель, возвращающая заранее заданные ответы и запоминающая промпты.
+    Ответ может быть парой (задержка в сек, текст).
+    """
+    
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.prompts = []
+        self.configs = []
+        self._lock = threading.Lock()
+    
+    def _next(self, prompt, generation_config=None):
+        with self._lock:
+            self.prompts.append(prompt)
+            self.configs.append(generation_config)
+            response = self.responses.pop(0)
+        return response if isinstance(response, tuple) else (0, response)
+    
+    def generate_content(self, prompt, generation_config=None, **kwargs):
+        delay, text = self._next(prompt, generation_config)
+        time.sleep(delay)
+        return _Response(text)
+    
+    async def generate_content_async(self, prompt, generation_config=None, **kwargs):
+        delay, text = self._next(prompt, generation_config)
+        await asyncio.sleep(delay)
+        return _Response(text)
+
+
+def _problem(index, equation, answer):
+    return {
+        'index': index,
+        'title': f'Задача {index}',
+        'problem_text': f'Решите уравнение {equation}',
+        'description': f'Решите уравнение {equation}',
+        'equation_to_solve': equation,
+        'correct_answer': answer,
+        'solution_steps': ['Шаг 1', 'Шаг 2', 'Шаг 3', 'Шаг 4'],
+        'hints': ['Подсказка'],
+    }
+
+
+class _NoLimitGuard:
+    """Ограничитель без лимитов: тесты не зависят от кеша Django"""
+    
+    def call(self, func, *args, operation=None, **kwargs):
+        return func(*args, **kwargs)
+    
+    async def acall(self, func, *args, operation=None, **kwargs):
+        return await func(*args, **kwargs)
+
+
+_patchers = [
+    mock.patch.object(gemini_service, 'get_llm_guard', return_value=_NoLimitGuard()),
+    # Проверка в текущем процессе: тесты не запускают процессы пула
+    mock.patch.object(gemini_service, 'get_validation_pool', return_value=ValidationPool(size=0)),
+]
+
+
+def setUpModule():
+    for patcher in _patchers:
+        patcher.start()
+
+
+def tearDownModule():
+    for patcher in _patchers:
+        patcher.stop()
+
+
+def _make_service(responses):
+    service = GeminiService.__new__(GeminiService)
+    service.model = _StubModel(responses)
+    
+    async def agenerate_content(prompt, operation, generation_config=None):
+        return await service.model.generate_content_async(prompt, generation_config=generation_config)
+    
+    service._agenerate_content = agenerate_content
+    return service
+
+
+class TestGenerateProblemsBatch(unittest.TestCase):
+    """Тесты для generate_problems_batch"""
+    
+    def setUp(self):
+        self.specs = [
+            {'topic': 'Уравнения', 'difficulty': 800, 'grade': 6},
+            {'topic': 'Уравнения', 'difficulty': 900, 'grade': 6},
+            {'topic': 'Уравнения', 'difficulty': 1000, 'grade': 7},
+        ]
+    
+    def test_single_request_for_batch(self):
+        """Все задачи пакета получены одним запросом"""
+        service = _make_service([json.dumps([
+            _problem(0, 'x + 1 = 3', '2'),
+            _problem(1, 'x + 2 = 5', '3'),
+            _problem(2, 'x - 1 = 3', '4'),
+        ])])
+        
+        results = service.generate_problems_batch(self.specs)
+        
+        self.assertEqual(len(service.model.prompts), 1)
+        self.assertEqual([r['correct_answer'] for r in results], ['2', '3', '4'])
+        self.assertEqual([r['difficulty_score'] for r in results], [800, 900, 1000])
+        self.assertNotIn('index', results[0])
+    
+    def test_retries_only_failed_items(self):
+        """Повторно запрашиваются только задачи, не прошедшие валидацию"""
+        service = _make_service([
+            json.dumps([
+                _problem(0, 'x + 1 = 3', '2'),
+                _problem(1, 'x + 2 = 5', '7'),  # Неверный ответ
+                _problem(2, 'x - 1 = 3', '4'),
+            ]),
+            json.dumps([_problem(0, 'x + 2 = 5', '3')]),
+        ])
+        
+        results = service.generate_problems_batch(self.specs)
+        
+        self.assertEqual(len(service.model.prompts), 2)
+        self.assertIn('всего: 1', service.model.prompts[1])
+        self.assertEqual([r['correct_answer'] for r in results], ['2', '3', '4'])
+    
+    def test_truncated_response_keeps_complete_items(self):
+        """Из оборванного ответа берутся целые задачи, запрашивается только оборванная"""
+        truncated = json.dumps([
+            _problem(0, 'x + 1 = 3', '2'),
+            _problem(1, 'x + 2 = 5', '3'),
+            _problem(2, 'x - 1 = 3', '4'),
+        ])
+        service = _make_service([
+            truncated[:truncated.rindex('"correct_answer"')],
+            json.dumps([_problem(0, 'x - 1 = 3', '4')]),
+        ])
+        
+        results = service.generate_problems_batch(self.specs)
+        
+        self.assertEqual(len(service.model.prompts), 2)
+        self.assertEqual([r['correct_answer'] for r in results], ['2', '3', '4'])
+    
+    def test_gives_up_after_max_attempts(self):
+        """Невалидный ответ модели не роняет пакет, задача возвращается как None"""
+        service = _make_service(['не JSON', json.dumps([_problem(0, 'x + 1 = 3', '2')])])
+        
+        results = service.generate_problems_batch(self.specs[:1], max_attempts=1)
+        
+        self.assertEqual(results, [None])
+        self.assertEqual(len(service.model.prompts), 1)
+
+
+
+VALID = json.dumps(_problem(0, 'x + 1 = 3', '2'))
+INVALID = json.dumps(_problem(0, 'x + 1 = 3', '5'))
+
+
+class TestGenerationRetryPolicy(unittest.TestCase):
+    """Тесты для ограниченных попыток и хеджирования generate_problem"""
+    
+    def setUp(self):
+        get_metrics().reset()
+        # Значения по умолчанию; отдельные тесты переопределяют их своими патчами
+        for name, value in (('GEMINI_MAX_ATTEMPTS', 3), ('GEMINI_GENERATION_DEADLINE', 5.0)):
+            patcher = mock.patch.object(gemini_service, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def _generate(self, service, use_async):
+        if use_async:
+            return asyncio.run(service.agenerate_problem('Уравнения', 800, 800, 6))
+        return service.generate_problem('Уравнения', 800, 800, 6)
+    
+    @mock.patch.object(gemini_service, 'GEMINI_HEDGE_AFTER', 0)
+    def test_retries_after_failed_validation(self):
+        """Невалидное решение запрашивается повторно"""
+        for use_async in (False, True):
+            service = _make_service([INVALID, VALID])
+            self.assertEqual(self._generate(service, use_async)['correct_answer'], '2')
+            self.assertEqual(len(service.model.prompts), 2)
+        
+        metrics = get_metrics()
+        self.assertEqual(metrics.get_counter('gemini_validation_total', result='fail'), 2)
+        self.assertEqual(metrics.get_counter('gemini_validation_total', result='pass'), 2)
+        self.assertEqual(metrics.get_counter('gemini_json_parse_total', result='clean'), 4)
+    
+    @mock.patch.object(gemini_service, 'GEMINI_HEDGE_AFTER', 0)
+    def test_attempts_are_bounded(self):
+        """Не больше GEMINI_MAX_ATTEMPTS попыток, затем ошибка"""
+        for use_async in (False, True):
+            service = _make_service([INVALID] * 5)
+            with self.assertRaises(Exception):
+                self._generate(service, use_async)
+            self.assertEqual(len(service.model.prompts), 3)
+        self.assertEqual(get_metrics().get_counter('gemini_generation_total', outcome='exhausted'), 2)
+    
+    @mock.patch.object(gemini_service, 'GEMINI_HEDGE_AFTER', 0)
+    @mock.patch.object(gemini_service, 'GEMINI_GENERATION_DEADLINE', 0.2)
+    def test_deadline(self):
+        """Общий срок ограничивает ожидание медленного ответа"""
+        for use_async in (False, True):
+            service = _make_service([(1.0, VALID)])
+            started = time.monotonic()
+            with self.assertRaises(Exception):
+                self._generate(service, use_async)
+            self.assertLess(time.monotonic() - started, 0.8)
+    
+    @mock.patch.object(gemini_service, 'GEMINI_HEDGE_AFTER', 0.05)
+    def test_hedged_attempt_wins(self):
+        """Медленная попытка не задерживает ответ: побеждает параллельная"""
+        for use_async in (False, True):
+            service = _make_service([(1.0, VALID), VALID])
+            started = time.monotonic()
+            self.assertEqual(self._generate(service, use_async)['correct_answer'], '2')
+            self.assertLess(time.monotonic() - started, 0.8)
+            self.assertEqual(len(service.model.prompts), 2)
+        self.assertEqual(get_metrics().get_counter('gemini_generation_hedged_total'), 2)
+
+
+
+class TestStructuredOutput(unittest.TestCase):
+    """Тесты для режима structured output (response_schema)"""
+    
+    def _generate(self, structured):
+        with mock.patch.object(gemini_service, 'GEMINI_STRUCTURED_OUTPUT', structured):
+            service = _make_service([VALID, VALID, json.dumps([_problem(0, 'x + 1 = 3', '2')])])
+            service.generate_problem('Уравнения', 800, 800, 6)
+            asyncio.run(service.agenerate_problem('Уравнения', 800, 800, 6))
+            service.generate_problems_batch([{'topic': 'Уравнения', 'difficulty': 800, 'grade': 6}])
+        return service.model
+    
+    def test_schema_sent_and_prompt_trimmed(self):
+        """Схема передается в generation_config, инструкций формата JSON в промпте нет"""
+        structured = self._generate(True)
+        legacy = self._generate(False)
+        
+        self.assertEqual(
+            [config['response_schema'] for config in structured.configs],
+            [gemini_service.PROBLEM_SCHEMA, gemini_service.PROBLEM_SCHEMA, gemini_service.BATCH_SCHEMA]
+        )
+        self.assertEqual({config['response_mime_type'] for config in structured.configs}, {'application/json'})
+        self.assertEqual(legacy.configs, [None, None, None])
+        
+        for prompt, legacy_prompt in zip(structured.prompts, legacy.prompts):
+            self.assertNotIn('ФОРМАТ ОТВЕТА', prompt)
+            self.assertNotIn('обратные слэши', prompt)
+            self.assertIn('обратные слэши', legacy_prompt)
+            # Правила записи ответа нужны и при ответе по схеме
+            self.assertIn('sqrt(x), а НЕ как', prompt)
+            self.assertLess(len(prompt), len(legacy_prompt) * 0.8)
+
+
+if __name__ == '__main__':
+    unittest.main()
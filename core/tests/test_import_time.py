@@ -0,0 +1,72 @@
+"""
+Бюджет времени импорта: URLconf и команды не должны загружать SymPy и Gemini SDK
+Импорт проверяется в отдельном процессе через python -X importtime
+"""
+
+import os
+import re
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+# Что импортирует каждый gunicorn-воркер и каждая management-команда
+IMPORT_CODE = '\n'.join([
+    'import django',
+    'django.setup()',
+    'import al_khwarizmi.urls',
+    'import arena.management.commands.end_weekly_tournament',
+])
+
+# Загружаются только при первом использовании
+HEAVY_MODULES = ('sympy', 'mpmath', 'google.generativeai', 'pdfplumber')
+
+# Бюджет импорта URLconf (мс, кумулятивно по -X importtime); можно переопределить
+URLCONF_BUDGET_MS = int(os.environ.get('URLCONF_IMPORT_BUDGET_MS', 500))
+
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def _import_times():
+    """Модули процесса и кумулятивное время их импорта (мкс)"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='al_khwarizmi.settings')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT_CODE],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if completed.returncode != 0:
+        raise AssertionError(completed.stderr[-2000:])
+
+    times = {}
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    """Тесты времени импорта"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.times = _import_times()
+
+    def test_heavy_modules_are_lazy(self):
+        """SymPy, Gemini SDK и pdfplumber не импортируются при старте"""
+        loaded = sorted(
+            name for name in self.times
+            if any(name == heavy or name.startswith(heavy + '.') for heavy in HEAVY_MODULES)
+        )
+        self.assertEqual(loaded, [])
+
+    def test_urlconf_budget(self):
+        """Импорт URLconf укладывается в бюджет"""
+        elapsed_ms = self.times['al_khwarizmi.urls'] / 1000
+        self.assertLess(elapsed_ms, URLCONF_BUDGET_MS)
+
+
+if __name__ == '__main__':
+    unittest.main()
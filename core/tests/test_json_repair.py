@@ -0,0 +1,59 @@
+"""
+Unit-тесты для разбора JSON из ответов LLM
+"""
+
+import json
+import unittest
+from core.json_repair import (
+    FIX_LATEX_ESCAPE, FIX_MISSING_COMMA, FIX_TRAILING_COMMA, FIX_TRUNCATED, FIX_WRAPPER,
+    parse_llm_json,
+)
+
+
+class TestParseLLMJson(unittest.TestCase):
+    """Тесты для parse_llm_json"""
+
+    def test_valid_json_is_unchanged(self):
+        """Корректный JSON разбирается без исправлений"""
+        data = {'title': 'Задача', 'steps': ['x = 2'], 'hint': 'a\\nb', 'score': 1.5e3}
+        self.assertEqual(parse_llm_json(json.dumps(data, ensure_ascii=False)), (data, []))
+
+    def test_latex_escapes(self):
+        """\\frac и \\times остаются LaTeX, а не управляющими символами; \\n - перевод строки"""
+        value, fixes = parse_llm_json('{"f": "\\frac{1}{2} \\times \\sqrt{x}\\n\\\\alpha \\u0041"}')
+        self.assertEqual(value['f'], '\\frac{1}{2} \\times \\sqrt{x}\n\\alpha A')
+        self.assertEqual(fixes, [FIX_LATEX_ESCAPE])
+
+    def test_control_escapes_before_letters(self):
+        """Перевод строки и табуляция перед буквой не считаются LaTeX"""
+        data = {'s': 'a\nb', 't': 'x\ty', 'r': 'ok\rnext'}
+        self.assertEqual(parse_llm_json(json.dumps(data)), (data, []))
+        value, fixes = parse_llm_json('{"f": "x \\neq 0, \\nabla f, \\theta, \\right)"}')
+        self.assertEqual(value['f'], 'x \\neq 0, \\nabla f, \\theta, \\right)')
+        self.assertEqual(fixes, [FIX_LATEX_ESCAPE])
+
+    def test_wrapper_and_commas(self):
+        """Обертка ```json, лишние и пропущенные запятые"""
+        text = 'Вот задачи:\n```json\n[{"a": [1, 2,],} {"b": 3},]\n```'
+        value, fixes = parse_llm_json(text)
+        self.assertEqual(value, [{'a': [1, 2]}, {'b': 3}])
+        self.assertEqual(fixes, [FIX_MISSING_COMMA, FIX_TRAILING_COMMA, FIX_WRAPPER])
+
+    def test_truncated_array_keeps_complete_objects(self):
+        """Из оборванного массива извлекаются все завершенные объекты"""
+        value, fixes = parse_llm_json('[{"a": 1}, {"b": {"c": [2]}}, {"d": "оборв')
+        self.assertEqual(value, [{'a': 1}, {'b': {'c': [2]}}])
+        self.assertIn(FIX_TRUNCATED, fixes)
+
+        value, _ = parse_llm_json('{"problems": [{"a": 1}, {"a": 2, "x": [1,')
+        self.assertEqual(value, {'problems': [{'a': 1}]})
+
+    def test_truncated_object_fails(self):
+        """Оборванный одиночный объект не достраивается"""
+        for text in ('{"title": "Задача", "answer": ', 'нет JSON'):
+            with self.assertRaises(ValueError):
+                parse_llm_json(text)
+
+
+if __name__ == '__main__':
+    unittest.main()
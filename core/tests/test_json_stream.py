@@ -0,0 +1,48 @@
+"""
+Unit-тесты для инкрементального извлечения полей JSON
+"""
+
+import json
+import unittest
+from core.json_stream import StreamingFieldExtractor
+
+
+class TestStreamingFieldExtractor(unittest.TestCase):
+    """Тесты для StreamingFieldExtractor"""
+    
+    def test_fields_emitted_as_soon_as_complete(self):
+        """Поле отдается в том фрагменте, где закрылась его строка"""
+        extractor = StreamingFieldExtractor(['title', 'problem_text'])
+        
+        self.assertEqual(extractor.feed('```json\n{"title": "Урав'), [])
+        self.assertEqual(extractor.feed('нение", "problem_'), [('title', 'Уравнение')])
+        self.assertEqual(extractor.feed('text": "Решите \\"x + 1 = 3\\"'), [])
+        self.assertEqual(extractor.feed('", "hints": []}'), [('problem_text', 'Решите "x + 1 = 3"')])
+        self.assertEqual(extractor.feed(' '), [])
+    
+    def test_chunked_equals_whole(self):
+        """Разбиение на фрагменты не влияет на результат"""
+        payload = json.dumps({
+            'title': 'Задача',
+            'problem_text': 'Найдите x',
+            'equation_to_solve': 'x^2 = 4',
+        }, ensure_ascii=False)
+        
+        extractor = StreamingFieldExtractor(['title', 'problem_text', 'equation_to_solve'])
+        for char in payload:
+            extractor.feed(char)
+        
+        self.assertEqual(extractor.values, json.loads(payload))
+        self.assertEqual(extractor.text, payload)
+    
+    def test_invalid_latex_escape(self):
+        """Одиночный обратный слэш LaTeX не ломает извлечение"""
+        extractor = StreamingFieldExtractor(['equation_to_solve'])
+        self.assertEqual(
+            extractor.feed('{"equation_to_solve": "\\sqrt{x} = 2"}'),
+            [('equation_to_solve', '\\sqrt{x} = 2')]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Unit-тесты для бэкендов LLM: офлайн-заглушка и запись/воспроизведение
+"""
+
+import asyncio
+import json
+import tempfile
+import unittest
+from core.llm_backends import FakeBackend, LLMBackendError, RecordReplayBackend, ReplayMissError
+from core.math_validator import get_math_validator
+
+PROBLEM_PROMPT = 'Создай математическую задачу.\nТЕМА: Уравнения\nСЛОЖНОСТЬ: 1200 (шкала 0-3000)'
+
+
+class TestFakeBackend(unittest.TestCase):
+    """Тесты для FakeBackend"""
+
+    def test_problems_are_valid_and_deterministic(self):
+        """Задачи проходят проверку SymPy, одинаковый seed - одинаковые ответы"""
+        texts = [FakeBackend(seed=7).generate_content(PROBLEM_PROMPT).text for _ in range(2)]
+        self.assertEqual(texts[0], texts[1])
+
+        problem = json.loads(texts[0])
+        self.assertEqual(problem['difficulty_score'], 1200)
+        validation = get_math_validator().validate_equation_solution(
+            problem['equation_to_solve'], [problem['correct_answer']]
+        )
+        self.assertTrue(validation['is_valid'])
+
+    def test_batch_and_check_prompts(self):
+        """Пакетный промпт - массив с index, промпт проверки - is_correct"""
+        batch = 'ЗАДАЧА index=0:\nСЛОЖНОСТЬ: 800\n\nЗАДАЧА index=1:\nСЛОЖНОСТЬ: 900\n'
+        problems = json.loads(FakeBackend().generate_content(batch).text)
+        self.assertEqual([(p['index'], p['difficulty_score']) for p in problems], [(0, 800), (1, 900)])
+
+        check = 'ПРАВИЛЬНЫЙ ОТВЕТ: 1/2\nОТВЕТ ПОЛЬЗОВАТЕЛЯ: 1 / 2\n'
+        self.assertTrue(json.loads(FakeBackend().generate_content(check).text)['is_correct'])
+
+    def test_failure_and_invalid_injection(self):
+        """Внедренные ошибки запроса и неверные ответы"""
+        with self.assertRaises(LLMBackendError):
+            FakeBackend(failure_rate=1.0).generate_content(PROBLEM_PROMPT)
+
+        problem = json.loads(FakeBackend(invalid_rate=1.0).generate_content(PROBLEM_PROMPT).text)
+        validation = get_math_validator().validate_equation_solution(
+            problem['equation_to_solve'], [problem['correct_answer']]
+        )
+        self.assertFalse(validation['is_valid'])
+
+    def test_stream(self):
+        """Потоковый ответ собирается в тот же JSON, что и обычный"""
+        async def collect():
+            response = await FakeBackend(seed=3).generate_content_async(PROBLEM_PROMPT, stream=True)
+            return ''.join([chunk.text async for chunk in response]), response.usage_metadata
+
+        text, usage = asyncio.run(collect())
+        self.assertEqual(text, FakeBackend(seed=3).generate_content(PROBLEM_PROMPT).text)
+        self.assertGreater(usage.candidates_token_count, 0)
+
+
+class TestRecordReplayBackend(unittest.TestCase):
+    """Тесты для RecordReplayBackend"""
+
+    def test_replays_recorded_responses(self):
+        """Записанные ответы воспроизводятся по ключу запроса и по кругу"""
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = RecordReplayBackend(directory, inner=FakeBackend(seed=1))
+            config = {'response_mime_type': 'application/json'}
+            recorded = [recorder.generate_content(PROBLEM_PROMPT, generation_config=config).text for _ in range(2)]
+            self.assertNotEqual(recorded[0], recorded[1])
+
+            async def stream():
+                response = await recorder.generate_content_async('ЗАДАЧА index=0:\n', stream=True)
+                return ''.join([chunk.text async for chunk in response])
+
+            streamed = asyncio.run(stream())
+
+            player = RecordReplayBackend(directory)
+            replayed = [player.generate_content(PROBLEM_PROMPT, generation_config=config) for _ in range(3)]
+            self.assertEqual([r.text for r in replayed], recorded + recorded[:1])
+            self.assertGreater(replayed[0].usage_metadata.prompt_token_count, 0)
+            self.assertEqual(asyncio.run(player.generate_content_async('ЗАДАЧА index=0:\n')).text, streamed)
+
+            with self.assertRaises(ReplayMissError):
+                player.generate_content(PROBLEM_PROMPT)
+
+    def test_file_parts_keyed_by_content(self):
+        """Файлы в запросе входят в ключ по содержимому или URI, а не по repr объекта"""
+        class UploadedFile:
+            def __init__(self, uri):
+                self.uri = uri
+
+        key = RecordReplayBackend.request_key
+        pdf = {'mime_type': 'application/pdf', 'data': b'%PDF-1.4'}
+        self.assertEqual(key([dict(pdf), 'Извлеки задачи']), key([dict(pdf), 'Извлеки задачи']))
+        self.assertNotEqual(
+            key([pdf, 'Извлеки задачи']), key([{**pdf, 'data': b'%PDF-1.5'}, 'Извлеки задачи'])
+        )
+        self.assertEqual(key([UploadedFile('files/abc'), 'Проверь']), key([UploadedFile('files/abc'), 'Проверь']))
+        self.assertNotEqual(key([UploadedFile('files/abc'), 'Проверь']), key([UploadedFile('files/xyz'), 'Проверь']))
+
+
+if __name__ == '__main__':
+    unittest.main()
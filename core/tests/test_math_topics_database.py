@@ -0,0 +1,44 @@
+"""
+Unit-тесты для индексов каталога тем
+"""
+
+import unittest
+from unittest import mock
+from core import math_topics_database as catalog
+
+
+class TestTopicIndexes(unittest.TestCase):
+    """Индексированные запросы совпадают с перебором всего каталога"""
+    
+    def test_topics_by_grade_matches_linear_scan(self):
+        """Темы класса отсортированы по сложности и ограничены max_topics"""
+        for grade in range(0, 14):
+            expected = sorted(
+                (t for t in catalog.MATH_TOPICS_DATABASE if t['grade_min'] <= grade <= t['grade_max']),
+                key=lambda x: x['difficulty_min']
+            )
+            self.assertEqual(catalog.get_topics_by_grade(grade, max_topics=1000), expected)
+            self.assertEqual(catalog.get_topics_by_grade(grade), expected[:50])
+    
+    def test_topic_by_difficulty_candidates(self):
+        """Кандидаты по сложности совпадают с линейным перебором"""
+        for difficulty in range(-50, 3100, 37):
+            for grade in (None, 1, 5, 9, 12):
+                expected = [
+                    t for t in catalog.MATH_TOPICS_DATABASE
+                    if t['difficulty_min'] <= difficulty <= t['difficulty_max']
+                    and (grade is None or t['grade_min'] <= grade <= t['grade_max'])
+                ]
+                with mock.patch('random.choice', side_effect=lambda seq: list(seq)):
+                    found = catalog.get_topic_by_difficulty(difficulty, grade)
+                self.assertEqual(found or [], expected)
+    
+    def test_random_topic_for_grade(self):
+        """Случайная тема подходит классу"""
+        topic = catalog.get_random_topic_for_grade(7)
+        self.assertTrue(topic['grade_min'] <= 7 <= topic['grade_max'])
+        self.assertIsNone(catalog.get_random_topic_for_grade(40))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,8 @@ Unit-тесты для модуля валидации математическ
 """
 
 import unittest
-from core.math_validator import MathValidator
+from unittest import mock
+from core.math_validator import MathValidator, SolveCache
 
 
 class TestMathValidator(unittest.TestCase):
@@ -135,5 +136,86 @@ class TestIrrationalEquations(unittest.TestCase):
         self.assertNotIn("-1", result['correct_solutions'])
 
 
+class TestSolveCache(unittest.TestCase):
+    """Тесты для кеша решенных уравнений"""
+    
+    def setUp(self):
+        self.validator = MathValidator()
+    
+    def test_repeated_validation_hits_cache(self):
+        """Повторная проверка того же уравнения не вызывает solve"""
+        first = self.validator.validate_equation_solution("x^2 - 5*x + 6 = 0", ["2", "3"])
+        with mock.patch('core.math_validator.solve') as solve, \
+                mock.patch('core.math_validator.simplify') as simplify:
+            second = self.validator.validate_equation_solution("x^2-5*x+6 = 0", ["2", "3"])
+            wrong = self.validator.validate_equation_solution("x^2 - 5*x + 6 = 0", ["2"])
+        
+        solve.assert_not_called()
+        simplify.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertFalse(wrong['is_valid'])
+        stats = self.validator.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (2, 1, 1))
+    
+    def test_variable_and_assumptions_are_part_of_key(self):
+        """Одно уравнение для разных переменных и допущений кешируется отдельно"""
+        self.validator.validate_equation_solution("sqrt(x+5) = x-1", ["4"])
+        self.assertTrue(self.validator.validate_irrational_equation("sqrt(x+5) = x-1", ["4"])['is_valid'])
+        self.assertEqual(self.validator.cache_stats()['size'], 2)
+    
+    def test_lru_and_ttl_eviction(self):
+        """Вытесняется давно не использованная запись, устаревшие - не отдаются"""
+        cache = SolveCache(maxsize=2, ttl=60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        
+        with mock.patch('core.math_validator.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+
+class TestNumericFastPath(unittest.TestCase):
+    """Тесты числовой проверки до simplify"""
+    
+    def setUp(self):
+        self.validator = MathValidator()
+    
+    def test_irrational_roots_without_simplify(self):
+        """Иррациональные корни проверяются подстановкой без simplify"""
+        with mock.patch('core.math_validator.simplify', side_effect=AssertionError('simplify')):
+            result = self.validator.validate_equation_solution("x^2 - 4*x + 1 = 0", ["2 + sqrt(3)", "2 - sqrt(3)"])
+            wrong = self.validator.validate_equation_solution("x^2 - 4*x + 1 = 0", ["2 + sqrt(2)"])
+        self.assertEqual(result['correct_solutions'], ["2 + sqrt(3)", "2 - sqrt(3)"])
+        self.assertFalse(wrong['verification']["2 + sqrt(2)"]['is_correct'])
+    
+    def test_equivalence_without_simplify(self):
+        """Эквивалентность выражений решается в точках без simplify"""
+        with mock.patch('core.math_validator.simplify', side_effect=AssertionError('simplify')):
+            self.assertTrue(self.validator.compare_answers("(x+1)**2", "x**2 + 2*x + 1"))
+            self.assertTrue(self.validator.compare_answers("(x**2 - 1)/(x - 1)", "x + 1"))
+            self.assertIsNone(self.validator.compare_answers("2*x", "x + 1"))
+    
+    def test_numbers_compared_exactly(self):
+        """Целые и рациональные сравниваются точно, округление - только для бесконечных дробей"""
+        self.assertFalse(self.validator.compare_answers("1000000001", "1000000000"))
+        self.assertTrue(self.validator.compare_answers("0.5", "1/2"))
+        self.assertFalse(self.validator.compare_answers("0.33", "1/3"))
+        self.assertTrue(self.validator.compare_answers("0.33", "1/3", rounded=True))
+        self.assertFalse(self.validator.compare_answers("2.5", "2.54", rounded=True))
+        self.assertTrue(self.validator.compare_answers("sqrt(8)", "2*sqrt(2)"))
+    
+    def test_disabled_fast_path_matches(self):
+        """Без числовой проверки результаты те же"""
+        with mock.patch('core.math_validator.MATH_NUMERIC_FAST_PATH', False):
+            validator = MathValidator()
+            result = validator.validate_equation_solution("x^2 - 4*x + 1 = 0", ["2 + sqrt(3)", "2 - sqrt(3)"])
+            self.assertEqual(result['correct_solutions'], ["2 + sqrt(3)", "2 - sqrt(3)"])
+            self.assertTrue(validator.compare_answers("(x+1)**2", "x**2 + 2*x + 1"))
+
+
 if __name__ == '__main__':
     unittest.main()
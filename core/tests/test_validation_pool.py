@@ -0,0 +1,60 @@
+"""
+Unit-тесты для пула процессов проверки решений
+"""
+
+import time
+import unittest
+from core.math_validator import VERDICT_BUSY, VERDICT_FAIL, VERDICT_PASS, VERDICT_SKIPPED, VERDICT_TIMEOUT
+from core.metrics import get_metrics
+from core.validation_pool import ValidationPool
+
+# solve раскладывает многочлен 60-й степени дольше минуты
+SLOW_EQUATION = '(x+1)**60 = 3*x**45 + 7'
+
+
+class TestValidationPool(unittest.TestCase):
+    """Тесты для ValidationPool"""
+
+    def setUp(self):
+        get_metrics().reset()
+        self.pool = ValidationPool(size=1, timeout=1.0)
+        self.addCleanup(self.pool.close)
+
+    def test_verdicts(self):
+        """Проверка в процессе пула: верное, неверное и пропущенное решение"""
+        cases = [
+            ({'equation_to_solve': 'x^2 - 5*x + 6 = 0', 'correct_answer': '2, 3'}, VERDICT_PASS),
+            ({'equation_to_solve': 'sqrt(x+5) = x-1', 'correct_answer': 4}, VERDICT_PASS),
+            ({'equation_to_solve': 'x + 5 = 12', 'correct_answer': '10'}, VERDICT_FAIL),
+            ({'title': 'Задача без уравнения', 'correct_answer': '10'}, VERDICT_SKIPPED),
+        ]
+        for problem_data, verdict in cases:
+            self.assertEqual(self.pool.validate_problem(problem_data)['verdict'], verdict)
+            self.assertEqual(ValidationPool(size=0).validate_problem(problem_data)['verdict'], verdict)
+
+    def test_timeout_replaces_worker(self):
+        """Долгая проверка прерывается по лимиту, процесс заменяется и пул работает дальше"""
+        started = time.monotonic()
+        result = self.pool.validate_problem({'equation_to_solve': SLOW_EQUATION, 'correct_answer': '1'})
+        self.assertEqual(result['verdict'], VERDICT_TIMEOUT)
+        self.assertLess(time.monotonic() - started, 10)
+
+        result = self.pool.validate_problem({'equation_to_solve': 'x + 1 = 3', 'correct_answer': '2'})
+        self.assertEqual(result['verdict'], VERDICT_PASS)
+        self.assertEqual(
+            get_metrics().get_counter('math_validation_workers_replaced_total', reason=VERDICT_TIMEOUT), 1
+        )
+
+    def test_busy_pool_returns_busy(self):
+        """Если все процессы заняты, задание не ждет бесконечно, а получает busy"""
+        self.pool._slots.acquire()
+        self.addCleanup(self.pool._slots.release)
+        started = time.monotonic()
+        result = self.pool.validate_problem({'equation_to_solve': 'x + 1 = 3', 'correct_answer': '2'}, timeout=0.2)
+        self.assertEqual(result['verdict'], VERDICT_BUSY)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(get_metrics().get_counter('math_validation_queue_timeouts_total'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+"""
+Пул процессов для проверки решений через SymPy
+solve и simplify на патологических уравнениях от LLM могут работать
+минутами. Проверка выполняется в постоянных процессах-воркерах с заранее
+импортированным SymPy: у задания есть лимит времени и памяти, зависший
+воркер убивается и заменяется новым, а задание получает вердикт timeout.
+Веб-воркер при этом только ждет ответа и не блокируется дольше лимита.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from typing import Any, Dict, Optional
+
+from decouple import config
+
+from .math_validator import (
+    PROBLEM_VALIDATION_FIELDS, VERDICT_BUSY, VERDICT_ERROR, VERDICT_MEMORY, VERDICT_TIMEOUT, validate_problem_payload,
+)
+from .metrics import get_metrics
+
+try:
+    import resource
+except ImportError:  # Windows: лимит памяти недоступен
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Процессов проверки (0 - проверять в текущем процессе без лимитов)
+MATH_VALIDATION_WORKERS = config('MATH_VALIDATION_WORKERS', default=2, cast=int)
+# Лимит времени одной проверки (сек) и памяти процесса проверки (МБ, 0 - без лимита)
+MATH_VALIDATION_TIMEOUT = config('MATH_VALIDATION_TIMEOUT', default=5.0, cast=float)
+MATH_VALIDATION_MEMORY_MB = config('MATH_VALIDATION_MEMORY_MB', default=512, cast=int)
+
+# forkserver: воркеры порождаются из чистого процесса с уже импортированным
+# SymPy, а не из многопоточного веб-воркера
+_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def _worker_main(conn, memory_mb: int):
+    """Цикл процесса проверки: задание из conn -> результат в conn"""
+    if memory_mb and resource is not None:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # Итог проверки логирует родительский процесс
+    logging.disable(logging.WARNING)
+
+    while True:
+        try:
+            payload = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            result = validate_problem_payload(payload)
+        except MemoryError:
+            # После нехватки памяти процесс не переиспользуется
+            conn.send({'verdict': VERDICT_MEMORY, 'errors': ['Превышен лимит памяти проверки']})
+            return
+        except Exception as e:
+            result = {'verdict': VERDICT_ERROR, 'errors': [str(e)]}
+        conn.send(result)
+
+
+class _Worker:
+    """Процесс проверки и его конец канала"""
+
+    def __init__(self, context, memory_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_mb), name='math-validation', daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+
+class ValidationPool:
+    """
+    Пул постоянных процессов проверки
+
+    Процессы создаются по требованию (не больше size) и переиспользуются.
+    Задание ждет свободный процесс не дольше timeout (иначе - вердикт
+    timeout), затем не дольше timeout - собственного выполнения;
+    по истечении процесс убивается и сразу заменяется.
+    """
+
+    def __init__(self, size: int = MATH_VALIDATION_WORKERS, timeout: float = MATH_VALIDATION_TIMEOUT,
+                 memory_mb: int = MATH_VALIDATION_MEMORY_MB):
+        self.size = max(0, size)
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.pid = os.getpid()
+        self._context = None
+        self._idle: 'queue.LifoQueue[_Worker]' = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(1, self.size))
+        self._lock = threading.Lock()
+
+    def _get_context(self):
+        with self._lock:
+            if self._context is None:
+                self._context = multiprocessing.get_context(_START_METHOD)
+                if _START_METHOD == 'forkserver':
+                    # core.math_validator загружает SymPy лениво - импортируем его явно
+                    self._context.set_forkserver_preload(['sympy', 'core.math_validator'])
+            return self._context
+
+    def _acquire(self, wait: float) -> Optional[_Worker]:
+        """Свободный процесс или None, если все заняты дольше wait секунд"""
+        if not self._slots.acquire(timeout=wait):
+            return None
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return _Worker(self._get_context(), self.memory_mb)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, worker: _Worker):
+        self._idle.put(worker)
+        self._slots.release()
+
+    def _replace(self, worker: _Worker, reason: str):
+        """Убивает процесс и запускает замену, чтобы следующее задание не ждало запуска"""
+        worker.kill()
+        get_metrics().increment('math_validation_workers_replaced_total', reason=reason)
+        try:
+            self._idle.put(_Worker(self._get_context(), self.memory_mb))
+        except Exception as e:
+            logger.error(f"❌ Не удалось запустить процесс проверки: {e}")
+        finally:
+            self._slots.release()
+
+    def validate_problem(self, problem_data: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Проверяет решение задачи (см. validate_problem_payload)
+
+        Returns:
+            Результат validate_problem_payload, вердикт timeout/memory/error
+            или busy - проверка не выполнялась, свободного процесса не дождались
+        """
+        payload = {name: str(problem_data.get(name) or '') for name in PROBLEM_VALIDATION_FIELDS}
+        if not self.size:
+            return validate_problem_payload(payload)
+
+        timeout = self.timeout if timeout is None else timeout
+        # Очередь к процессам ждем не дольше самой проверки: запрос не висит за чужими заданиями
+        worker = self._acquire(timeout)
+        if worker is None:
+            logger.warning(f"⏱️ Нет свободного процесса проверки за {timeout} сек: {payload['equation_to_solve']}")
+            get_metrics().increment('math_validation_queue_timeouts_total')
+            return {'verdict': VERDICT_BUSY, 'errors': [f'Нет свободного процесса проверки за {timeout} сек']}
+        try:
+            worker.conn.send(payload)
+            if not worker.conn.poll(timeout):
+                logger.warning(f"⏱️ Проверка не уложилась в {timeout} сек, процесс заменен: {payload['equation_to_solve']}")
+                self._replace(worker, VERDICT_TIMEOUT)
+                return {'verdict': VERDICT_TIMEOUT, 'errors': [f'Проверка дольше {timeout} сек']}
+            result = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            # Процесс упал - как правило, из-за лимита памяти (RLIMIT_AS)
+            self._replace(worker, 'crash')
+            return {'verdict': VERDICT_MEMORY, 'errors': [f'Процесс проверки завершился: {e!r}']}
+
+        if result.get('verdict') == VERDICT_MEMORY:
+            self._replace(worker, VERDICT_MEMORY)
+        else:
+            self._release(worker)
+        return result
+
+    def close(self):
+        """Завершает простаивающие процессы"""
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+
+# Singleton instance
+_validation_pool = None
+_pool_lock = threading.Lock()
+
+def get_validation_pool() -> ValidationPool:
+    """Получить экземпляр ValidationPool (Singleton на процесс; после fork создается заново)"""
+    global _validation_pool
+    with _pool_lock:
+        if _validation_pool is None or _validation_pool.pid != os.getpid():
+            _validation_pool = ValidationPool()
+            atexit.register(_validation_pool.close)
+        return _validation_pool
@@ -1 +1,37 @@
-# Core app - no views needed for now
+"""
+Views приложения core
+"""
+
+import os
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from .llm_guard import get_llm_guard
+from .math_validator import get_solve_cache_stats
+from .metrics import get_metrics
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """
+    Метрики процесса (только для админов)
+    GET /api/metrics/
+    
+    Счетчики и гистограммы текущего воркера: время и токены запросов к LLM
+    по операциям, попытки разбора JSON, валидация и повторные попытки,
+    статистика кеша решенных уравнений SymPy.
+    Каждый gunicorn-воркер отдает свои метрики; состояние предохранителя общее.
+    """
+    guard = get_llm_guard()
+    return Response({
+        'pid': os.getpid(),
+        'llm': {
+            'circuit_open': guard.is_open(),
+            'retry_after': round(guard.breaker.retry_after(), 1),
+        },
+        'math_solve_cache': get_solve_cache_stats(),
+        **get_metrics().snapshot(),
+    })
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Topic, Problem, UserAttempt
+from .models import Topic, Problem, UserAttempt, AnswerVerdict
 
 
 @admin.register(Topic)
@@ -16,19 +16,22 @@ class ProblemAdmin(admin.ModelAdmin):
         'source', 'times_used', 'is_active', 'created_at'
     ]
     list_filter = [
-        'topic', 'difficulty_score', 'grade_level', 
-        'source', 'is_active', 'created_at'
+        'topic', 'difficulty_score', 'grade_level', 'category',
+        'source', 'is_active', 'validation_status', 'created_at'
     ]
     search_fields = ['title', 'description', 'latex_formula']
-    readonly_fields = ['created_at', 'updated_at', 'times_used']
+    readonly_fields = [
+        'created_at', 'updated_at', 'times_used', 'canonical_answer',
+        'validation_status', 'validation_errors', 'validation_ms', 'validated_at'
+    ]
     actions = ['activate_problems', 'deactivate_problems', 'reset_usage_counter']
     
     fieldsets = (
         ('Основная информация', {
-            'fields': ('topic', 'title', 'difficulty_score', 'grade_level', 'source', 'is_active')
+            'fields': ('topic', 'title', 'difficulty_score', 'grade_level', 'category', 'source', 'is_active')
         }),
         ('Содержание задачи', {
-            'fields': ('latex_formula', 'description', 'correct_answer')
+            'fields': ('latex_formula', 'description', 'correct_answer', 'canonical_answer')
         }),
         ('Решение и подсказки', {
             'fields': ('solution_steps', 'hints')
@@ -36,6 +39,9 @@ class ProblemAdmin(admin.ModelAdmin):
         ('Статистика', {
             'fields': ('times_used',)
         }),
+        ('Проверка SymPy', {
+            'fields': ('validation_status', 'validation_errors', 'validation_ms', 'validated_at')
+        }),
         ('Даты', {
             'fields': ('created_at', 'updated_at')
         }),
@@ -81,3 +87,11 @@ class UserAttemptAdmin(admin.ModelAdmin):
             'fields': ('solution_photo', 'ai_analysis', 'attempt_date')
         }),
     )
+
+
+@admin.register(AnswerVerdict)
+class AnswerVerdictAdmin(admin.ModelAdmin):
+    list_display = ['canonical_answer', 'problem_hash', 'is_correct', 'created_at']
+    list_filter = ['is_correct', 'created_at']
+    search_fields = ['canonical_answer', 'problem_hash']
+    readonly_fields = ['created_at']
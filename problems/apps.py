@@ -5,3 +5,6 @@ class ProblemsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'problems'
     verbose_name = 'Задачи'
+    
+    def ready(self):
+        import problems.signals
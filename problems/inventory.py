@@ -0,0 +1,170 @@
+"""
+Запас задач в БД по ячейкам (класс, корзина сложности, категория)
+Учет покрытия и сохранение сгенерированных ИИ задач
+"""
+
+import logging
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db.models import Count, F
+
+from core.math_topics_database import MATH_TOPICS_DATABASE
+from .models import Problem
+from .problem_index import DIFFICULTY_BUCKET_SIZE, difficulty_bucket
+
+logger = logging.getLogger(__name__)
+
+Cell = Tuple[int, int, str]
+
+
+def build_inventory_cells() -> Dict[Cell, List[Dict[str, Any]]]:
+    """
+    Ячейки каталога тем: (класс, корзина сложности, категория) -> темы ячейки
+    """
+    cells: Dict[Cell, List[Dict[str, Any]]] = {}
+    for topic in MATH_TOPICS_DATABASE:
+        for grade in range(topic['grade_min'], topic['grade_max'] + 1):
+            first = difficulty_bucket(topic['difficulty_min'])
+            last = difficulty_bucket(topic['difficulty_max'])
+            for bucket in range(first, last + 1):
+                cells.setdefault((grade, bucket, topic['category']), []).append(topic)
+    return cells
+
+
+def coverage_counts(max_times_used: int = 0) -> Dict[Cell, int]:
+    """
+    Количество неиспользованных активных задач по ячейкам - один GROUP BY по Problem
+
+    Args:
+        max_times_used: Задача считается неиспользованной, если показана не больше N раз
+
+    Returns:
+        Dict (класс, корзина, категория) -> количество задач
+    """
+    rows = (
+        Problem.objects
+        .filter(is_active=True, times_used__lte=max_times_used, grade_level__isnull=False)
+        .annotate(bucket=F('difficulty_score') / DIFFICULTY_BUCKET_SIZE)
+        .values('grade_level', 'bucket', 'category')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    return {
+        (row['grade_level'], row['bucket'], row['category']): row['total']
+        for row in rows
+    }
+
+
+def pick_topic_for_cell(cell: Cell, topics: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    """
+    Выбирает тему ячейки и сложность внутри пересечения корзины и диапазона темы
+    """
+    _, bucket, _ = cell
+    topic = random.choice(topics)
+    low = max(topic['difficulty_min'], bucket * DIFFICULTY_BUCKET_SIZE)
+    high = min(topic['difficulty_max'], (bucket + 1) * DIFFICULTY_BUCKET_SIZE - 1)
+    return topic, random.randint(low, max(low, high))
+
+
+def clamp_to_bucket(score: Any, bucket: int, default: int) -> int:
+    """
+    Сложность задачи в пределах корзины ячейки
+
+    Args:
+        score: difficulty_score, который вернула модель
+        bucket: Корзина ячейки, для которой генерировали
+        default: Сложность запроса - если модель не вернула число
+    """
+    try:
+        score = int(score)
+    except (TypeError, ValueError):
+        score = default
+    low = bucket * DIFFICULTY_BUCKET_SIZE
+    return min(max(score, low), low + DIFFICULTY_BUCKET_SIZE - 1)
+
+
+def _category_stem(category: str) -> str:
+    """Основа первого слова категории: "уравнен" для "уравнение" и "уравнения" """
+    word = category.split()[0].lower()
+    return word[:max(4, len(word) - 2)]
+
+
+class CategoryMatcher:
+    """
+    Определяет категорию каталога для задачи, сохраненной без категории
+
+    По порядку: префикс темы "Категория: тема", название темы каталога
+    в названии или тексте задачи, основа названия категории. Среди найденных
+    предпочитаются категории ячейки (класс, корзина); если ничего не найдено,
+    а в ячейке одна категория - берется она.
+    """
+
+    def __init__(self):
+        self.categories = {topic['category'] for topic in MATH_TOPICS_DATABASE}
+        # Длинные названия первыми: "Квадратные уравнения" точнее "Уравнения"
+        self.topics = sorted(
+            ((topic['topic'].lower(), topic['category']) for topic in MATH_TOPICS_DATABASE),
+            key=lambda item: -len(item[0])
+        )
+        self.stems = [(_category_stem(category), category) for category in sorted(self.categories)]
+        self.slots: Dict[Tuple[int, int], set] = {}
+        for grade, bucket, category in build_inventory_cells():
+            self.slots.setdefault((grade, bucket), set()).add(category)
+
+    def match(self, grade: Optional[int], difficulty: int, topic_name: str = '', text: str = '') -> str:
+        """
+        Returns:
+            Категория каталога или '', если определить не удалось
+        """
+        prefix = (topic_name or '').split(':', 1)[0].strip()
+        if prefix in self.categories:
+            return prefix
+
+        candidates = self.slots.get((grade, difficulty_bucket(difficulty)), set()) if grade else set()
+        haystack = f"{topic_name or ''} {text or ''}".lower()
+        found = [category for name, category in self.topics if name in haystack]
+        found += [category for stem, category in self.stems if stem in haystack]
+        for category in found:
+            if category in candidates:
+                return category
+        if found:
+            return found[0]
+        if len(candidates) == 1:
+            return next(iter(candidates))
+        return ''
+
+
+def create_problem_from_ai(
+    problem_data: Dict[str, Any],
+    grade_level: Optional[int],
+    category: str = '',
+    times_used: int = 0
+) -> Problem:
+    """
+    Сохраняет сгенерированную ИИ задачу в БД
+
+    Args:
+        problem_data: Ответ GeminiService.generate_problem
+        grade_level: Класс
+        category: Категория темы из каталога
+        times_used: Начальное значение счетчика показов
+
+    Returns:
+        Созданная Problem
+    """
+    return Problem.objects.create(
+        topic=None,
+        title=problem_data['title'],
+        latex_formula=problem_data.get('equation_to_solve', ''),
+        description=problem_data.get('problem_text', problem_data.get('description', '')),
+        correct_answer=problem_data['correct_answer'],
+        difficulty_score=problem_data['difficulty_score'],
+        solution_steps=problem_data.get('solution_steps', []),
+        hints=problem_data.get('hints', []),
+        grade_level=grade_level,
+        category=category or '',
+        source='ai_generated',
+        times_used=times_used,
+        is_active=True
+    )
@@ -0,0 +1,56 @@
+"""
+Management command для заполнения канонических ответов задач
+Нужен для задач, сохраненных до появления Problem.canonical_answer
+или импортированных в обход Problem.save
+"""
+from django.core.management.base import BaseCommand
+from problems.models import Problem, problem_canonical_answer
+
+
+class Command(BaseCommand):
+    help = 'Заполнение Problem.canonical_answer для существующих задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Задач в одном запросе чтения и обновления (по умолчанию: 500)'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать все задачи, а не только с пустым каноническим ответом'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        queryset = Problem.objects.only('id', 'correct_answer', 'canonical_answer').order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(canonical_answer='')
+
+        total = queryset.count()
+        self.stdout.write(f"🔢 Задач для пересчета: {total}")
+
+        checked = 0
+        changed = []
+        updated = 0
+        for problem in queryset.iterator(chunk_size=batch_size):
+            checked += 1
+            answer = problem_canonical_answer(problem.correct_answer)
+            if answer != problem.canonical_answer:
+                problem.canonical_answer = answer
+                changed.append(problem)
+
+            if len(changed) >= batch_size:
+                updated += Problem.objects.bulk_update(changed, ['canonical_answer'])
+                changed = []
+                self.stdout.write(f"   ... {checked}/{total}")
+
+        if changed:
+            updated += Problem.objects.bulk_update(changed, ['canonical_answer'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Готово: проверено {checked}, обновлено {updated}"
+        ))
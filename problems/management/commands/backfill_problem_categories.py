@@ -0,0 +1,73 @@
+"""
+Management command для заполнения категорий задач по каталогу тем
+Нужен для задач, сохраненных до появления Problem.category: без категории
+задача не попадает в ячейки запаса, и replenish_problems генерирует
+для ячейки новые задачи, хотя подходящие уже есть
+"""
+from django.core.management.base import BaseCommand
+from problems.inventory import CategoryMatcher
+from problems.models import Problem
+
+
+class Command(BaseCommand):
+    help = 'Заполнение Problem.category по каталогу тем для задач без категории'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Задач в одном запросе чтения и обновления (по умолчанию: 500)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, ничего не сохранять'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        matcher = CategoryMatcher()
+
+        queryset = (
+            Problem.objects.filter(category='')
+            .select_related('topic')
+            .only('id', 'title', 'description', 'grade_level', 'difficulty_score', 'category', 'topic__name')
+            .order_by('id')
+        )
+
+        total = queryset.count()
+        self.stdout.write(f"🏷️ Задач без категории: {total}")
+
+        checked = 0
+        changed = []
+        updated = 0
+        for problem in queryset.iterator(chunk_size=batch_size):
+            checked += 1
+            category = matcher.match(
+                problem.grade_level,
+                problem.difficulty_score,
+                topic_name=problem.topic.name if problem.topic else '',
+                text=f"{problem.title} {problem.description}"
+            )
+            if category:
+                problem.category = category
+                changed.append(problem)
+
+            if len(changed) >= batch_size:
+                updated += self._save(changed, options['dry_run'])
+                changed = []
+                self.stdout.write(f"   ... {checked}/{total}")
+
+        if changed:
+            updated += self._save(changed, options['dry_run'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Готово: проверено {checked}, категория определена у {updated}, "
+            f"осталось без категории {checked - updated}"
+        ))
+
+    def _save(self, problems, dry_run):
+        if dry_run:
+            return len(problems)
+        return Problem.objects.bulk_update(problems, ['category'])
@@ -0,0 +1,244 @@
+"""
+Management command для нагрузочного замера пайплайна генерации и проверки задач
+Виртуальные ученики параллельно вызывают /api/problems/generate-ai/ и
+/api/problems/submit-ai/ в процессе (AsyncClient) с офлайн-бэкендом LLM
+(заглушка или воспроизведение записи), без расхода квоты Gemini
+"""
+import asyncio
+import logging
+import statistics
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.signals import post_save
+from django.test import AsyncClient
+
+from core import gemini_service
+from core.gemini_service import GeminiService
+from core.llm_backends import LLM_RECORDINGS_DIR, FakeBackend, RecordReplayBackend, create_llm_backend
+from core.llm_guard import (
+    GEMINI_BREAKER_RESET, GEMINI_BREAKER_THRESHOLD, CircuitBreaker, TokenBucket, get_llm_guard,
+)
+from core.metrics import get_metrics
+from problems.models import Problem
+
+BENCH_USERNAME_PREFIX = 'bench_ai_'
+
+
+class Command(BaseCommand):
+    help = 'Замер пропускной способности generate-ai/submit-ai с офлайн-бэкендом LLM'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=20,
+            help='Параллельных учеников (по умолчанию: 20)'
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=5,
+            help='Пар генерация + проверка на ученика (по умолчанию: 5)'
+        )
+        parser.add_argument(
+            '--backend',
+            choices=['fake', 'replay', 'gemini', 'record'],
+            default='fake',
+            help='Бэкенд LLM (по умолчанию: fake)'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.5,
+            help='Задержка ответа заглушки в секундах (по умолчанию: 0.5)'
+        )
+        parser.add_argument(
+            '--failure-rate',
+            type=float,
+            default=0.0,
+            help='Доля запросов к заглушке, завершающихся ошибкой (по умолчанию: 0)'
+        )
+        parser.add_argument(
+            '--invalid-rate',
+            type=float,
+            default=0.0,
+            help='Доля задач заглушки с неверным ответом (по умолчанию: 0)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed заглушки (по умолчанию: 0)'
+        )
+        parser.add_argument(
+            '--rate-limit',
+            action='store_true',
+            help='Соблюдать общий лимит GEMINI_RATE_PER_MINUTE (по умолчанию лимит снят)'
+        )
+        parser.add_argument(
+            '--allow-real-api',
+            action='store_true',
+            help='Разрешить бэкенды gemini и record (расходуют квоту Gemini)'
+        )
+        parser.add_argument(
+            '--keep-problems',
+            action='store_true',
+            help='Не удалять задачи, созданные во время замера'
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Не скрывать логи views'
+        )
+
+    def handle(self, *args, **options):
+        backend_name = options['backend']
+        if backend_name in ('gemini', 'record') and not options['allow_real_api']:
+            raise CommandError(f'Бэкенд {backend_name} расходует квоту Gemini: добавьте --allow-real-api')
+
+        backend = self.make_backend(options)
+        gemini_service._gemini_service = GeminiService(backend=backend)
+
+        guard = get_llm_guard()
+        if not options['rate_limit']:
+            # Лимит на минуту исказил бы замер самого пайплайна
+            guard.bucket = TokenBucket('bench', rate_per_second=1e6, burst=10 ** 6)
+        if backend_name in ('fake', 'replay'):
+            # Ошибки заглушки не должны размыкать общий предохранитель Gemini,
+            # а его состояние замер не трогает
+            guard.breaker = CircuitBreaker('bench', GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_RESET)
+            guard.breaker.record_success()
+        elif guard.is_open():
+            raise CommandError(
+                f'Предохранитель Gemini разомкнут еще {guard.breaker.retry_after():.0f} сек - повторите позже'
+            )
+
+        if 'testserver' not in settings.ALLOWED_HOSTS and '*' not in settings.ALLOWED_HOSTS:
+            settings.ALLOWED_HOSTS.append('testserver')
+        if not options['verbose']:
+            logging.disable(logging.ERROR)
+
+        users_count = max(1, options['users'])
+        rounds = max(1, options['rounds'])
+
+        self.stdout.write(self.style.SUCCESS('\n🚀 Замер пайплайна генерации и проверки задач'))
+        self.stdout.write(f'📊 Параметры:')
+        self.stdout.write(f'   - Бэкенд: {backend_name}')
+        if backend_name == 'fake':
+            self.stdout.write(f'   - Задержка заглушки: {options["latency"]} сек')
+            self.stdout.write(f'   - Ошибки / неверные задачи: {options["failure_rate"]} / {options["invalid_rate"]}')
+        self.stdout.write(f'   - Учеников: {users_count}, пар запросов на ученика: {rounds}')
+        self.stdout.write(f'   - Лимит запросов: {"включен" if options["rate_limit"] else "снят"}\n')
+
+        # Удаляем только задачи, созданные замером: по id > последнего
+        # удалились бы и задачи, которые параллельно сохранили другие процессы
+        created_problem_ids = []
+
+        def track_problem(sender, instance, created=False, **kwargs):
+            if created:
+                created_problem_ids.append(instance.id)
+
+        post_save.connect(track_problem, sender=Problem, weak=False)
+        users = self.create_users(users_count)
+        clients = []
+        for user in users:
+            client = AsyncClient()
+            client.force_login(user)
+            clients.append(client)
+
+        get_metrics().reset()
+        try:
+            started = time.monotonic()
+            samples = asyncio.run(self.run_load(clients, rounds))
+            elapsed = time.monotonic() - started
+        finally:
+            post_save.disconnect(track_problem, sender=Problem)
+            logging.disable(logging.NOTSET)
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+            if not options['keep_problems']:
+                # Записи пула генераций на удаленные задачи не выдаются: пул проверяет задачу в БД
+                Problem.objects.filter(id__in=created_problem_ids).delete()
+
+        self.report(samples, elapsed)
+
+    def make_backend(self, options):
+        backend_name = options['backend']
+        if backend_name == 'fake':
+            return FakeBackend(
+                latency=options['latency'],
+                failure_rate=options['failure_rate'],
+                invalid_rate=options['invalid_rate'],
+                seed=options['seed']
+            )
+        if backend_name == 'replay':
+            return RecordReplayBackend(LLM_RECORDINGS_DIR)
+        return create_llm_backend(GeminiService.MODEL_NAME, backend_name)
+
+    def create_users(self, count):
+        users = []
+        for index in range(count):
+            user = User.objects.create_user(username=f'{BENCH_USERNAME_PREFIX}{index}_{int(time.time())}')
+            profile = user.profile
+            profile.user_type = 'student'
+            profile.age = 13
+            profile.grade = 6 + index % 6
+            profile.country = 'UZ'
+            profile.save()
+            users.append(user)
+        return users
+
+    async def run_load(self, clients, rounds):
+        samples = []
+
+        async def timed(kind, request):
+            started = time.monotonic()
+            response = await request
+            samples.append((kind, response.status_code, time.monotonic() - started))
+            return response
+
+        async def student(client):
+            for _ in range(rounds):
+                response = await timed('generate', client.get('/api/problems/generate-ai/'))
+                if response.status_code != 200:
+                    continue
+                problem = response.json()['problem']
+                await timed('submit', client.post(
+                    '/api/problems/submit-ai/',
+                    {'problem_id': problem['id'], 'submitted_answer': '0'},
+                    content_type='application/json'
+                ))
+
+        await asyncio.gather(*(student(client) for client in clients))
+        return samples
+
+    def report(self, samples, elapsed):
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Запросов: {len(samples)} за {elapsed:.2f} сек '
+                                             f'({len(samples) / elapsed:.1f} запр/сек)'))
+
+        for kind in ('generate', 'submit'):
+            timings = sorted(seconds for sample_kind, _, seconds in samples if sample_kind == kind)
+            if not timings:
+                continue
+            statuses = Counter(code for sample_kind, code, _ in samples if sample_kind == kind)
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f'   {kind:<9} n={len(timings):<5} p50={statistics.median(timings) * 1000:.0f} мс '
+                f'p95={p95 * 1000:.0f} мс max={timings[-1] * 1000:.0f} мс | '
+                f'статусы: {dict(sorted(statuses.items()))}'
+            )
+
+        snapshot = get_metrics().snapshot()
+        self.stdout.write('\n📈 Метрики LLM:')
+        for counter in snapshot['counters']:
+            labels = ', '.join(f'{key}={value}' for key, value in counter['labels'].items())
+            self.stdout.write(f'   {counter["name"]}{{{labels}}} = {counter["value"]:g}')
+        for histogram in snapshot['histograms']:
+            if histogram['name'] != 'llm_call_seconds':
+                continue
+            labels = ', '.join(f'{key}={value}' for key, value in histogram['labels'].items())
+            self.stdout.write(f'   {histogram["name"]}{{{labels}}} count={histogram["count"]} '
+                              f'sum={histogram["sum"]:.2f}')
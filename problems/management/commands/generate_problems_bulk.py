@@ -4,7 +4,9 @@ Management command для массовой генерации задач чер
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from problems.models import Problem
+from problems.inventory import create_problem_from_ai
 from core.gemini_service import get_gemini_service
+from core.llm_guard import CircuitOpenError, get_llm_guard
 from core.math_topics_database import MATH_TOPICS_DATABASE
 import time
 import random
@@ -40,8 +42,15 @@ class Command(BaseCommand):
         parser.add_argument(
             '--delay',
             type=float,
-            default=2.0,
-            help='Задержка между запросами в секундах (по умолчанию: 2.0)'
+            default=0.0,
+            help='Дополнительная задержка между запросами в секундах (по умолчанию: 0, '
+                 'темп запросов задает общий лимит GEMINI_RATE_PER_MINUTE)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5,
+            help='Количество задач в одном запросе к Gemini (по умолчанию: 5)'
         )
     
     def handle(self, *args, **options):
@@ -50,14 +59,19 @@ class Command(BaseCommand):
         min_diff = options['difficulty_min']
         max_diff = options['difficulty_max']
         delay = options['delay']
+        batch_size = max(1, options['batch_size'])
         
         self.stdout.write(self.style.SUCCESS(f'\n🚀 Начало массовой генерации задач'))
         self.stdout.write(f'📊 Параметры:')
         self.stdout.write(f'   - Количество: {count}')
         self.stdout.write(f'   - Класс: {grade if grade else "Все классы"}')
         self.stdout.write(f'   - Сложность: {min_diff} - {max_diff}')
+        self.stdout.write(f'   - Задач в запросе: {batch_size}')
         self.stdout.write(f'   - Задержка: {delay} сек\n')
         
+        # Фоновая команда ждет свободный токен лимита сколько нужно, а не отказывает
+        get_llm_guard().max_wait = None
+        
         # Получаем сервис Gemini
         try:
             gemini = get_gemini_service()
@@ -69,74 +83,64 @@ class Command(BaseCommand):
         success_count = 0
         error_count = 0
         
-        # Генерируем задачи
-        for i in range(count):
-            self.stdout.write(f'\n📝 Генерация задачи {i+1}/{count}...')
+        # Генерируем задачи пакетами: инструкции промпта передаются один раз на пакет
+        for start in range(0, count, batch_size):
+            specs = [
+                self.make_spec(grade, min_diff, max_diff)
+                for _ in range(min(batch_size, count - start))
+            ]
+            self.stdout.write(f'\n📝 Генерация задач {start + 1}-{start + len(specs)}/{count}...')
+            for spec in specs:
+                self.stdout.write(f'   Тема: {spec["topic"]} | Класс: {spec["grade"]} | Сложность: {spec["difficulty"]}')
             
             try:
-                # Определяем параметры задачи
-                if grade:
-                    target_grade = grade
+                if len(specs) == 1:
+                    spec = specs[0]
+                    results = [gemini.generate_problem(
+                        topic=spec['topic'],
+                        difficulty=spec['difficulty'],
+                        user_level=spec['user_level'],
+                        user_grade=spec['grade'],
+                        user_age=spec['age']
+                    )]
                 else:
-                    target_grade = random.randint(1, 12)
-                
-                target_difficulty = random.randint(min_diff, max_diff)
-                
-                # Выбираем случайную тему из базы данных
-                suitable_topics = [
-                    topic for topic in MATH_TOPICS_DATABASE
-                    if (topic['grade_min'] <= target_grade <= topic['grade_max'] and
-                        topic['difficulty_min'] <= target_difficulty <= topic['difficulty_max'])
-                ]
-                
-                if suitable_topics:
-                    topic_obj = random.choice(suitable_topics)
-                    topic_name = f"{topic_obj['category']}: {topic_obj['topic']}"
-                else:
-                    topic_name = "Математика: Общие задачи"
-                
-                self.stdout.write(f'   Тема: {topic_name}')
-                self.stdout.write(f'   Класс: {target_grade}')
-                self.stdout.write(f'   Сложность: {target_difficulty}')
-                
-                # Генерируем задачу
-                problem_data = gemini.generate_problem(
-                    topic=topic_name,
-                    difficulty=target_difficulty,
-                    user_level=target_difficulty,
-                    user_grade=target_grade,
-                    user_age=target_grade + 6  # Примерный возраст
-                )
-                
-                # Сохраняем в БД
-                with transaction.atomic():
-                    problem = Problem.objects.create(
-                        topic=None,
-                        title=problem_data['title'],
-                        latex_formula=problem_data.get('equation_to_solve', ''),
-                        description=problem_data.get('problem_text', problem_data.get('description', '')),
-                        correct_answer=problem_data['correct_answer'],
-                        difficulty_score=problem_data['difficulty_score'],
-                        solution_steps=problem_data.get('solution_steps', []),
-                        hints=problem_data.get('hints', []),
-                        grade_level=target_grade,
-                        source='ai_generated',
-                        times_used=0,
-                        is_active=True
-                    )
-                
-                success_count += 1
-                self.stdout.write(self.style.SUCCESS(f'   ✅ Задача сохранена: ID={problem.id}'))
-                
-                # Задержка между запросами
-                if i < count - 1:  # Не ждем после последней задачи
-                    self.stdout.write(f'   ⏳ Ожидание {delay} сек...')
-                    time.sleep(delay)
-                
+                    results = gemini.generate_problems_batch(specs)
+            except CircuitOpenError as e:
+                # Gemini сбоит - ждем, пока предохранитель снова пропустит запрос
+                error_count += len(specs)
+                pause = max(1.0, e.retry_after)
+                self.stdout.write(self.style.WARNING(f'   🔌 Gemini недоступен, пауза {pause:.0f} сек'))
+                time.sleep(pause)
+                results = []
             except Exception as e:
-                error_count += 1
+                error_count += len(specs)
                 self.stdout.write(self.style.ERROR(f'   ❌ Ошибка: {str(e)}'))
-                continue
+                results = []
+            
+            for spec, problem_data in zip(specs, results):
+                if problem_data is None:
+                    error_count += 1
+                    self.stdout.write(self.style.ERROR(f'   ❌ Задача не получена: {spec["topic"]}'))
+                    continue
+                
+                try:
+                    # Сохраняем в БД
+                    with transaction.atomic():
+                        problem = create_problem_from_ai(
+                            problem_data,
+                            grade_level=spec['grade'],
+                            category=spec['category']
+                        )
+                    success_count += 1
+                    self.stdout.write(self.style.SUCCESS(f'   ✅ Задача сохранена: ID={problem.id}'))
+                except Exception as e:
+                    error_count += 1
+                    self.stdout.write(self.style.ERROR(f'   ❌ Ошибка сохранения: {str(e)}'))
+            
+            # Задержка между запросами
+            if delay and start + batch_size < count:  # Не ждем после последнего пакета
+                self.stdout.write(f'   ⏳ Ожидание {delay} сек...')
+                time.sleep(delay)
         
         # Итоговая статистика
         self.stdout.write('\n' + '='*50)
@@ -145,3 +149,37 @@ class Command(BaseCommand):
         self.stdout.write(f'❌ Ошибок: {error_count}')
         self.stdout.write(f'📊 Всего задач в БД: {Problem.objects.count()}')
         self.stdout.write('\n' + '='*50 + '\n')
+    
+    def make_spec(self, grade, min_diff, max_diff):
+        """Случайное задание на генерацию: класс, сложность и тема из каталога"""
+        # Определяем параметры задачи
+        if grade:
+            target_grade = grade
+        else:
+            target_grade = random.randint(1, 12)
+        
+        target_difficulty = random.randint(min_diff, max_diff)
+        
+        # Выбираем случайную тему из базы данных
+        suitable_topics = [
+            topic for topic in MATH_TOPICS_DATABASE
+            if (topic['grade_min'] <= target_grade <= topic['grade_max'] and
+                topic['difficulty_min'] <= target_difficulty <= topic['difficulty_max'])
+        ]
+        
+        if suitable_topics:
+            topic_obj = random.choice(suitable_topics)
+            topic_name = f"{topic_obj['category']}: {topic_obj['topic']}"
+            topic_category = topic_obj['category']
+        else:
+            topic_name = "Математика: Общие задачи"
+            topic_category = ''
+        
+        return {
+            'topic': topic_name,
+            'category': topic_category,
+            'difficulty': target_difficulty,
+            'user_level': target_difficulty,
+            'grade': target_grade,
+            'age': target_grade + 6,  # Примерный возраст
+        }
@@ -0,0 +1,216 @@
+"""
+Management command для поддержания запаса задач в БД
+Догенерирует задачи через Gemini API в ячейки (класс, сложность, категория),
+где неиспользованных задач меньше нижней границы, и показывает карту покрытия
+"""
+from django.core.management.base import BaseCommand
+from problems.inventory import (
+    build_inventory_cells, clamp_to_bucket, coverage_counts, create_problem_from_ai, pick_topic_for_cell
+)
+from problems.models import Problem
+from problems.problem_index import DIFFICULTY_BUCKET_SIZE
+from core.llm_guard import CircuitOpenError, get_llm_guard
+import time
+
+
+class Command(BaseCommand):
+    help = 'Поддержание запаса неиспользованных задач по ячейкам каталога тем'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--low-watermark',
+            type=int,
+            default=3,
+            help='Минимум неиспользованных задач в ячейке (по умолчанию: 3)'
+        )
+        parser.add_argument(
+            '--high-watermark',
+            type=int,
+            help='До скольки задач пополнять ячейку (по умолчанию: 2 × low-watermark)'
+        )
+        parser.add_argument(
+            '--max-times-used',
+            type=int,
+            default=0,
+            help='Задача считается неиспользованной, если показана не больше N раз (по умолчанию: 0)'
+        )
+        parser.add_argument(
+            '--grade',
+            type=int,
+            help='Только указанный класс (1-12)'
+        )
+        parser.add_argument(
+            '--category',
+            type=str,
+            help='Только указанная категория'
+        )
+        parser.add_argument(
+            '--max-per-pass',
+            type=int,
+            default=20,
+            help='Максимум генераций за один проход (по умолчанию: 20)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Работать постоянно, повторяя проход каждые --interval секунд'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=300,
+            help='Пауза между проходами в режиме --loop (по умолчанию: 300)'
+        )
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            help='Только показать карту покрытия, ничего не генерировать'
+        )
+
+    def handle(self, *args, **options):
+        self.low = options['low_watermark']
+        self.high = options['high_watermark'] or self.low * 2
+        self.max_times_used = options['max_times_used']
+
+        self.cells = {
+            cell: topics for cell, topics in build_inventory_cells().items()
+            if (options['grade'] is None or cell[0] == options['grade'])
+            and (options['category'] is None or cell[2] == options['category'])
+        }
+
+        if not self.cells:
+            self.stdout.write(self.style.ERROR('❌ Нет ячеек для указанных фильтров'))
+            return
+
+        # Задачи без категории не попадают ни в одну ячейку и не считаются запасом
+        uncategorized = Problem.objects.filter(
+            is_active=True, category='', grade_level__isnull=False
+        ).count()
+        if uncategorized:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ Задач без категории: {uncategorized} - они не учитываются в запасе. '
+                f'Запустите backfill_problem_categories'
+            ))
+
+        if options['report']:
+            self.print_heatmap(coverage_counts(self.max_times_used))
+            return
+
+        # Получаем сервис Gemini только когда действительно генерируем
+        from core.gemini_service import get_gemini_service
+        # Фоновая команда ждет свободный токен лимита сколько нужно, а не отказывает
+        get_llm_guard().max_wait = None
+        try:
+            self.gemini = get_gemini_service()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'❌ Ошибка инициализации Gemini: {e}'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n🚀 Пополнение запаса задач | Ячеек: {len(self.cells)} | '
+            f'Границы: {self.low}/{self.high}'
+        ))
+
+        try:
+            while True:
+                self.replenish_pass(options['max_per_pass'])
+                if not options['loop']:
+                    break
+                self.stdout.write(f'⏳ Следующий проход через {options["interval"]} сек...')
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\n⏹️ Остановлено пользователем'))
+
+    def replenish_pass(self, max_generations):
+        counts = coverage_counts(self.max_times_used)
+
+        # Сначала самые "сухие" ячейки
+        dry_cells = sorted(
+            (
+                (self.high - counts.get(cell, 0), cell)
+                for cell in self.cells
+                if counts.get(cell, 0) < self.low
+            ),
+            reverse=True
+        )
+
+        self.stdout.write(f'\n📊 Ячеек ниже границы: {len(dry_cells)}')
+
+        generated = 0
+        errors = 0
+        for deficit, cell in dry_cells:
+            grade, bucket, category = cell
+            for _ in range(deficit):
+                if generated + errors >= max_generations:
+                    break
+
+                topic_obj, difficulty = pick_topic_for_cell(cell, self.cells[cell])
+                topic_name = f"{topic_obj['category']}: {topic_obj['topic']}"
+
+                try:
+                    problem_data = self.gemini.generate_problem(
+                        topic=topic_name,
+                        difficulty=difficulty,
+                        user_level=difficulty,
+                        user_grade=grade,
+                        user_age=grade + 6  # Примерный возраст
+                    )
+                    # Сложность модели сохраняем, но в пределах ячейки, для которой генерировали
+                    problem_data['difficulty_score'] = clamp_to_bucket(
+                        problem_data.get('difficulty_score'), bucket, difficulty
+                    )
+                    problem = create_problem_from_ai(problem_data, grade_level=grade, category=category)
+                    generated += 1
+                    self.stdout.write(self.style.SUCCESS(
+                        f'   ✅ {grade} класс | {bucket * DIFFICULTY_BUCKET_SIZE}+ | {category}: ID={problem.id}'
+                    ))
+                except CircuitOpenError as e:
+                    # Gemini сбоит - заканчиваем проход, следующий начнется после паузы
+                    self.stdout.write(self.style.WARNING(
+                        f'   🔌 Gemini недоступен, проход прерван (повтор через {e.retry_after:.0f} сек)'
+                    ))
+                    self.stdout.write(f'✅ Сгенерировано: {generated} | ❌ Ошибок: {errors}')
+                    return
+                except Exception as e:
+                    errors += 1
+                    self.stdout.write(self.style.ERROR(f'   ❌ {grade} класс | {category}: {e}'))
+
+        self.stdout.write(f'✅ Сгенерировано: {generated} | ❌ Ошибок: {errors}')
+
+    def print_heatmap(self, counts):
+        """Карта покрытия: строки - классы, столбцы - корзины сложности"""
+        grades = sorted({cell[0] for cell in self.cells})
+        buckets = sorted({cell[1] for cell in self.cells})
+
+        # В клетке - число "сухих" категорий (ниже нижней границы)
+        self.stdout.write(self.style.SUCCESS(
+            f'\n🗺️ Карта покрытия: число категорий с запасом < {self.low}'
+        ))
+        self.stdout.write('     ' + ''.join(f'{b * DIFFICULTY_BUCKET_SIZE:>5}' for b in buckets))
+        for grade in grades:
+            row = []
+            for bucket in buckets:
+                cell_keys = [c for c in self.cells if c[0] == grade and c[1] == bucket]
+                if not cell_keys:
+                    row.append(f'{"·":>5}')
+                    continue
+                dry = sum(1 for c in cell_keys if counts.get(c, 0) < self.low)
+                row.append(f'{dry:>5}' if dry else f'{"ok":>5}')
+            self.stdout.write(f'{grade:>3}  ' + ''.join(row))
+
+        dry_cells = sorted(
+            (counts.get(cell, 0), cell) for cell in self.cells
+            if counts.get(cell, 0) < self.low
+        )
+        total = len(self.cells)
+        self.stdout.write(
+            f'\n📊 Ячеек: {total} | Ниже границы: {len(dry_cells)} '
+            f'({len(dry_cells) * 100 // total}%)'
+        )
+        for available, (grade, bucket, category) in dry_cells[:30]:
+            self.stdout.write(
+                f'   {grade:>2} класс | {bucket * DIFFICULTY_BUCKET_SIZE:>4}-'
+                f'{(bucket + 1) * DIFFICULTY_BUCKET_SIZE - 1:<4} | {category}: {available}'
+            )
+        if len(dry_cells) > 30:
+            self.stdout.write(f'   ... и еще {len(dry_cells) - 30}')
@@ -0,0 +1,195 @@
+"""
+Management command для проверки ответов задач в БД через SymPy
+Задачи читаются потоком (серверный курсор на PostgreSQL) и проверяются
+в пуле процессов на всех ядрах. Вердикт и время проверки сохраняются
+в задаче, поэтому прерванный запуск продолжается с непроверенных задач.
+Задачи с доказанно неверным ответом снимаются с показа (is_active=False).
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from problems.models import Problem
+from problems.problem_index import get_problem_index
+from core.math_validator import VERDICT_ERROR, VERDICT_FAIL
+from core.validation_pool import MATH_VALIDATION_TIMEOUT, ValidationPool
+import os
+import time
+
+# Вердикт для fail, когда ответ не удовлетворяет уравнению при подстановке
+VERDICT_WRONG = 'wrong'
+
+# Ошибок проверки сохраняется в задаче не больше
+MAX_STORED_ERRORS = 10
+
+VALIDATION_FIELDS = ['validation_status', 'validation_errors', 'validation_ms', 'validated_at']
+
+
+class Command(BaseCommand):
+    help = 'Проверка ответов задач через SymPy в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Процессов проверки (по умолчанию: число ядер; 0 - в текущем процессе)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=MATH_VALIDATION_TIMEOUT,
+            help=f'Лимит времени проверки одной задачи, сек (по умолчанию: {MATH_VALIDATION_TIMEOUT})'
+        )
+        parser.add_argument(
+            '--source',
+            action='append',
+            choices=['ai_generated', 'imported', 'manual'],
+            help='Источник задач, можно несколько (по умолчанию: ai_generated и imported)'
+        )
+        parser.add_argument(
+            '--revalidate-before',
+            type=str,
+            help='Проверить заново задачи, проверенные раньше указанного времени (ISO 8601)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Задач в одном чтении и сохранении результатов (по умолчанию: 200)'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Проверить не больше N задач'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать результаты, ничего не сохранять'
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = max(1, options['batch_size'])
+        self.dry_run = options['dry_run']
+        sources = options['source'] or ['ai_generated', 'imported']
+
+        queryset = Problem.objects.filter(source__in=sources).only(
+            'id', 'title', 'latex_formula', 'correct_answer', 'is_active'
+        ).order_by('id')
+
+        if options['revalidate_before']:
+            revalidate_before = parse_datetime(options['revalidate_before'])
+            if revalidate_before is None:
+                raise CommandError(f"Некорректная дата: {options['revalidate_before']}")
+            if timezone.is_naive(revalidate_before):
+                revalidate_before = timezone.make_aware(revalidate_before)
+            queryset = queryset.filter(Q(validated_at__isnull=True) | Q(validated_at__lt=revalidate_before))
+        else:
+            queryset = queryset.filter(validated_at__isnull=True)
+
+        total = queryset.count()
+        if options['limit'] is not None:
+            total = min(total, options['limit'])
+            queryset = queryset[:options['limit']]
+
+        workers = max(0, options['workers'])
+        self.stdout.write(f"🔍 Задач для проверки: {total} | Процессов: {workers or 'в текущем процессе'}")
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING('🧪 Пробный запуск: результаты не сохраняются'))
+        if not total:
+            return
+
+        self.total = total
+        self.done = 0
+        self.counts = Counter()
+        self.deactivated = 0
+        self.buffer = []
+        self.wrong_ids = []
+        self.started = time.monotonic()
+
+        pool = ValidationPool(size=workers, timeout=options['timeout'])
+        executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='validate-problems')
+        # В очереди держим несколько задач на процесс, а не всю выборку
+        window = max(1, workers) * 4
+        pending = {}
+        try:
+            for problem in queryset.iterator(chunk_size=self.batch_size):
+                pending[executor.submit(self._validate, pool, problem)] = problem
+                if len(pending) >= window:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        self._record(pending.pop(future), *future.result())
+
+            for future in list(pending):
+                self._record(pending.pop(future), *future.result())
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\n⚠️ Прервано: сохраняем готовые результаты'))
+            for future in pending:
+                future.cancel()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            pool.close()
+            self._flush()
+
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ Проверено {self.done}/{total} за {elapsed:.1f} сек ({rate:.1f} задач/сек)"
+        ))
+        for status, count in self.counts.most_common():
+            self.stdout.write(f"   {status}: {count}")
+        if self.deactivated:
+            self.stdout.write(self.style.WARNING(f"🚫 Снято с показа (неверный ответ): {self.deactivated}"))
+
+    def _validate(self, pool, problem):
+        """Проверяет одну задачу (выполняется в потоке, ждущем процесс пула)"""
+        started = time.perf_counter()
+        try:
+            result = pool.validate_problem({
+                'equation_to_solve': problem.latex_formula,
+                'correct_answer': problem.correct_answer,
+                'title': problem.title,
+            })
+        except Exception as e:
+            result = {'verdict': VERDICT_ERROR, 'errors': [str(e)]}
+        return result, int((time.perf_counter() - started) * 1000)
+
+    def _record(self, problem, result, elapsed_ms):
+        """Запоминает вердикт задачи и сохраняет накопленные результаты пачкой"""
+        status = result['verdict']
+        if status == VERDICT_FAIL and result.get('wrong_answers'):
+            status = VERDICT_WRONG
+
+        problem.validation_status = status
+        problem.validation_errors = [str(error) for error in result.get('errors', [])[:MAX_STORED_ERRORS]]
+        problem.validation_ms = elapsed_ms
+        problem.validated_at = timezone.now()
+        self.buffer.append(problem)
+        if status == VERDICT_WRONG and problem.is_active:
+            self.wrong_ids.append(problem.id)
+
+        self.done += 1
+        self.counts[status] += 1
+        if self.done % self.batch_size == 0:
+            self._flush()
+            elapsed = time.monotonic() - self.started
+            self.stdout.write(f"   ... {self.done}/{self.total} ({self.done / elapsed:.1f} задач/сек)")
+
+    def _flush(self):
+        """Сохраняет результаты проверки и снимает с показа неверные задачи"""
+        if not self.dry_run:
+            if self.buffer:
+                Problem.objects.bulk_update(self.buffer, VALIDATION_FIELDS)
+            if self.wrong_ids:
+                # is_active меняем отдельным запросом: флаг мог измениться после чтения задачи
+                self.deactivated += Problem.objects.filter(
+                    pk__in=self.wrong_ids, is_active=True
+                ).update(is_active=False)
+                get_problem_index().invalidate()
+        elif self.wrong_ids:
+            self.deactivated += len(self.wrong_ids)
+        self.buffer = []
+        self.wrong_ids = []
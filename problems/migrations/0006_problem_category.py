@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problems', '0005_alter_problem_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='category',
+            field=models.CharField(blank=True, default='', help_text='Категория темы из каталога тем (Арифметика, Уравнения, ...)', max_length=100, verbose_name='Категория'),
+        ),
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(fields=['grade_level', 'difficulty_score', 'category'], name='problems_pr_grade_l_b58b8b_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problems', '0006_problem_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerVerdict',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('problem_hash', models.CharField(max_length=40, verbose_name='Хеш задачи')),
+                ('canonical_answer', models.CharField(max_length=200, verbose_name='Канонический ответ')),
+                ('is_correct', models.BooleanField(verbose_name='Правильно')),
+                ('check_result', models.JSONField(help_text='Ответ GeminiService.check_solution', verbose_name='Результат проверки')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Вердикт проверки',
+                'verbose_name_plural': 'Вердикты проверки',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='answerverdict',
+            constraint=models.UniqueConstraint(fields=('problem_hash', 'canonical_answer'), name='unique_answer_verdict'),
+        ),
+    ]
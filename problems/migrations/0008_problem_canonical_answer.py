@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problems', '0007_answerverdict'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='canonical_answer',
+            field=models.CharField(blank=True, default='', help_text='Правильный ответ в канонической форме (вычисляется при сохранении)', max_length=200, verbose_name='Канонический ответ'),
+        ),
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(fields=['canonical_answer'], name='problems_pr_canonic_6373b4_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problems', '0008_problem_canonical_answer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='validated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата проверки'),
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='validation_errors',
+            field=models.JSONField(blank=True, default=list, help_text='Ошибки, найденные при проверке SymPy', verbose_name='Ошибки проверки'),
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='validation_ms',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Время проверки (мс)'),
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='validation_status',
+            field=models.CharField(blank=True, choices=[('', 'Не проверялась'), ('pass', 'Ответ подтвержден'), ('fail', 'Ответ не подтвержден'), ('wrong', 'Ответ неверен'), ('skipped', 'Не проверяется'), ('error', 'Ошибка проверки'), ('timeout', 'Превышено время'), ('memory', 'Превышена память')], default='', help_text='Вердикт команды validate_problems (пусто - не проверялась)', max_length=20, verbose_name='Проверка SymPy'),
+        ),
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(fields=['validation_status'], name='problems_pr_validat_6c98b1_idx'),
+        ),
+    ]
@@ -72,6 +72,14 @@ class Problem(models.Model):
         verbose_name='Правильный ответ'
     )
     
+    canonical_answer = models.CharField(
+        max_length=200,
+        blank=True,
+        default='',
+        verbose_name='Канонический ответ',
+        help_text='Правильный ответ в канонической форме (вычисляется при сохранении)'
+    )
+    
     difficulty_score = models.IntegerField(
         validators=[MinValueValidator(0), MaxValueValidator(3000)],
         verbose_name='Сложность',
@@ -99,6 +107,14 @@ class Problem(models.Model):
         help_text='Для какого класса предназначена задача (1-12)'
     )
     
+    category = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Категория',
+        help_text='Категория темы из каталога тем (Арифметика, Уравнения, ...)'
+    )
+    
     source = models.CharField(
         max_length=50,
         default='ai_generated',
@@ -123,6 +139,43 @@ class Problem(models.Model):
         help_text='Доступна ли задача для генерации'
     )
     
+    validation_status = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        verbose_name='Проверка SymPy',
+        help_text='Вердикт команды validate_problems (пусто - не проверялась)',
+        choices=[
+            ('', 'Не проверялась'),
+            ('pass', 'Ответ подтвержден'),
+            ('fail', 'Ответ не подтвержден'),
+            ('wrong', 'Ответ неверен'),
+            ('skipped', 'Не проверяется'),
+            ('error', 'Ошибка проверки'),
+            ('timeout', 'Превышено время'),
+            ('memory', 'Превышена память'),
+        ]
+    )
+    
+    validation_errors = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='Ошибки проверки',
+        help_text='Ошибки, найденные при проверке SymPy'
+    )
+    
+    validation_ms = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Время проверки (мс)'
+    )
+    
+    validated_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата проверки'
+    )
+    
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата создания'
@@ -143,10 +196,37 @@ class Problem(models.Model):
             models.Index(fields=['is_active']),
             models.Index(fields=['source']),
             models.Index(fields=['topic', 'difficulty_score']),
+            models.Index(fields=['grade_level', 'difficulty_score', 'category']),
+            models.Index(fields=['canonical_answer']),
+            models.Index(fields=['validation_status']),
         ]
     
     def __str__(self):
         return f"{self.title} (Сложность: {self.difficulty_score})"
+    
+    def save(self, *args, **kwargs):
+        """Пересчитывает канонический ответ, если сохраняется правильный ответ"""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'correct_answer' in update_fields:
+            self.canonical_answer = problem_canonical_answer(self.correct_answer)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'canonical_answer'}
+        super().save(*args, **kwargs)
+
+
+def problem_canonical_answer(correct_answer: str) -> str:
+    """
+    Каноническая форма правильного ответа для Problem.canonical_answer:
+    "0.5" и "1/2", "x = 2" и "2" дают одну строку (см. core.answer_checker)
+
+    Returns:
+        Каноническая форма или '', если она не помещается в поле
+    """
+    from core.answer_checker import canonical_answer
+    answer = canonical_answer(correct_answer)
+    if len(answer) > Problem._meta.get_field('canonical_answer').max_length:
+        return ''
+    return answer
 
 
 class UserAttempt(models.Model):
@@ -224,3 +304,48 @@ class UserAttempt(models.Model):
         status = "✓" if self.is_correct else "✗"
         problem_title = self.problem.title if self.problem else "AI-задача"
         return f"{status} {self.user.username} - {problem_title}"
+
+
+class AnswerVerdict(models.Model):
+    """
+    Вердикты ИИ по ответам на задачи.
+    Ключ - хеш содержимого задачи и каноническая форма ответа:
+    одинаковые ответы на одну задачу проверяются через Gemini один раз.
+    """
+    problem_hash = models.CharField(
+        max_length=40,
+        verbose_name='Хеш задачи'
+    )
+    
+    canonical_answer = models.CharField(
+        max_length=200,
+        verbose_name='Канонический ответ'
+    )
+    
+    is_correct = models.BooleanField(
+        verbose_name='Правильно'
+    )
+    
+    check_result = models.JSONField(
+        verbose_name='Результат проверки',
+        help_text='Ответ GeminiService.check_solution'
+    )
+    
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+    
+    class Meta:
+        verbose_name = 'Вердикт проверки'
+        verbose_name_plural = 'Вердикты проверки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['problem_hash', 'canonical_answer'],
+                name='unique_answer_verdict'
+            ),
+        ]
+    
+    def __str__(self):
+        status = "✓" if self.is_correct else "✗"
+        return f"{status} {self.canonical_answer} ({self.problem_hash[:8]})"
@@ -0,0 +1,115 @@
+"""
+Очередь следующих задач пользователя
+Заполняется после отправки ответа, чтобы запрос новой задачи был одним обращением к кешу
+"""
+
+import logging
+from typing import Container, List, Optional, Tuple
+
+from django.core.cache import cache
+
+from .problem_index import difficulty_bucket, get_problem_index
+from .solved_cache import get_solved_problem_ids
+
+logger = logging.getLogger(__name__)
+
+NEXT_QUEUE_SIZE = 5
+NEXT_QUEUE_TIMEOUT = 3600
+
+
+def get_difficulty_window(user_index: int) -> Tuple[int, int]:
+    """Диапазон сложности задач для индекса: [Index - 100, Index + 50]"""
+    return max(0, user_index - 100), min(3000, user_index + 50)
+
+
+class _Excluding:
+    """Объединение решенных задач и уже выбранных в очередь"""
+
+    __slots__ = ('solved', 'picked')
+
+    def __init__(self, solved: Container[int], picked: set):
+        self.solved = solved
+        self.picked = picked
+
+    def __contains__(self, problem_id) -> bool:
+        return problem_id in self.picked or problem_id in self.solved
+
+
+def _cache_key(user_id: int) -> str:
+    return f"next_problems_{user_id}"
+
+
+def fill_next_problems(user_id: int, user_index: int, size: int = NEXT_QUEUE_SIZE) -> List[int]:
+    """
+    Вычисляет следующие задачи для текущего диапазона сложности и кладет их в кеш
+
+    Args:
+        user_id: ID пользователя
+        user_index: Индекс Ал Хоразми пользователя
+        size: Размер очереди
+
+    Returns:
+        Список ID задач в очереди
+    """
+    min_difficulty, max_difficulty = get_difficulty_window(user_index)
+    solved = get_solved_problem_ids(user_id, correct_only=True)
+    index = get_problem_index()
+
+    picked = []
+    excluding = _Excluding(solved, set())
+    for _ in range(size):
+        problem_id = index.sample(min_difficulty, max_difficulty, exclude=excluding)
+        if problem_id is None:
+            break
+        picked.append(problem_id)
+        excluding.picked.add(problem_id)
+
+    cache.set(
+        _cache_key(user_id),
+        {'bucket': difficulty_bucket(user_index), 'ids': picked},
+        timeout=NEXT_QUEUE_TIMEOUT
+    )
+    return picked
+
+
+def refresh_next_problems(user_id: int, user_index: int):
+    """
+    Вызывается после обновления индекса пользователя.
+    Пересчитывает очередь, если индекс перешел в другую корзину сложности
+    или очередь пуста; иначе оставляет её как есть.
+    """
+    queued = cache.get(_cache_key(user_id))
+    if queued and queued['bucket'] == difficulty_bucket(user_index) and queued['ids']:
+        return
+    fill_next_problems(user_id, user_index)
+
+
+def pop_next_problem(user_id: int, user_index: int):
+    """
+    Берет следующую задачу из очереди пользователя (при необходимости заполняет её)
+
+    Returns:
+        Problem или None, если подходящих задач нет
+    """
+    from .models import Problem
+
+    queued = cache.get(_cache_key(user_id))
+    if not queued or queued['bucket'] != difficulty_bucket(user_index) or not queued['ids']:
+        ids = fill_next_problems(user_id, user_index)
+    else:
+        ids = queued['ids']
+
+    solved = get_solved_problem_ids(user_id, correct_only=True)
+    problem: Optional[Problem] = None
+    while ids and problem is None:
+        problem_id = ids.pop(0)
+        if problem_id in solved:
+            continue
+        problem = Problem.objects.filter(pk=problem_id, is_active=True).first()
+
+    cache.set(
+        _cache_key(user_id),
+        {'bucket': difficulty_bucket(user_index), 'ids': ids},
+        timeout=NEXT_QUEUE_TIMEOUT
+    )
+    return problem
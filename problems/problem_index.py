@@ -0,0 +1,244 @@
+"""
+Индекс активных задач в памяти процесса
+Быстрый выбор случайной задачи по диапазону сложности без загрузки строк из БД
+"""
+
+import bisect
+import logging
+import random
+import threading
+import time
+from array import array
+from typing import Container, Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Ширина корзины сложности (0-99, 100-199, ...)
+DIFFICULTY_BUCKET_SIZE = 100
+
+# Ключ версии индекса в общем кеше: при изменении задач версия меняется,
+# и каждый воркер перестраивает свой локальный индекс при следующем обращении
+INDEX_VERSION_KEY = 'problem_index_version'
+
+# Страховка на случай, если кеш не общий для воркеров (LocMemCache)
+INDEX_MAX_AGE = 300
+
+# Сколько случайных попыток делаем, прежде чем перебрать кандидатов целиком
+SAMPLE_ATTEMPTS = 16
+
+
+def difficulty_bucket(score: int) -> int:
+    """Номер корзины сложности для балла 0-3000"""
+    return max(0, int(score)) // DIFFICULTY_BUCKET_SIZE
+
+
+def current_index_version():
+    """Текущая версия набора задач (общая для всех воркеров)"""
+    version = cache.get(INDEX_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(INDEX_VERSION_KEY, version, timeout=None)
+        version = cache.get(INDEX_VERSION_KEY, version)
+    return version
+
+
+class _Group:
+    """Задачи одной группы (класс или тема), отсортированные по сложности"""
+
+    __slots__ = ('difficulties', 'ids')
+
+    def __init__(self, rows: List[Tuple[int, int]]):
+        rows.sort()
+        self.difficulties = array('i', (d for d, _ in rows))
+        self.ids = array('q', (pk for _, pk in rows))
+
+    def insert(self, difficulty: int, pk: int):
+        """Добавляет задачу, сохраняя порядок по сложности"""
+        position = bisect.bisect_right(self.difficulties, difficulty)
+        self.difficulties.insert(position, difficulty)
+        self.ids.insert(position, pk)
+
+    def span(self, lo: int, hi: int) -> Tuple[int, int]:
+        """Границы среза [start, end) для сложности в диапазоне [lo, hi]"""
+        start = bisect.bisect_left(self.difficulties, lo)
+        end = bisect.bisect_right(self.difficulties, hi)
+        return start, end
+
+
+class ProblemIndex:
+    """
+    Версионированный индекс ID активных задач.
+
+    Хранит только (сложность, id) в компактных массивах, сгруппированных
+    по классу и по теме. Выбор задачи - бинарный поиск границ диапазона
+    и случайный индекс внутри среза, т.е. O(log n) вместо загрузки всех строк.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._built_at = 0.0
+        self._all: Optional[_Group] = None
+        self._by_grade: Dict[Optional[int], _Group] = {}
+        self._by_topic: Dict[int, _Group] = {}
+
+    # ------------------------------------------------------------------
+    # Версионирование
+    # ------------------------------------------------------------------
+
+    def invalidate(self):
+        """Сбрасывает индекс во всех процессах (через общий кеш)"""
+        cache.set(INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+        self._version = None
+
+    def add(self, pk: int, difficulty: int, grade: Optional[int], topic_id: Optional[int]):
+        """
+        Добавляет новую задачу в индекс этого процесса без перестройки
+
+        Остальные процессы увидят задачу при плановой перестройке (INDEX_MAX_AGE):
+        сброс версии на каждую сгенерированную задачу заставлял бы все
+        воркеры заново читать все активные задачи
+        """
+        with self._lock:
+            if self._all is None:
+                return
+            self._all.insert(difficulty, pk)
+            self._by_grade.setdefault(grade, _Group([])).insert(difficulty, pk)
+            if topic_id is not None:
+                self._by_topic.setdefault(topic_id, _Group([])).insert(difficulty, pk)
+
+    def _ensure_fresh(self):
+        version = current_index_version()
+        expired = time.monotonic() - self._built_at > INDEX_MAX_AGE
+        if version == self._version and not expired:
+            return
+        with self._lock:
+            if version == self._version and time.monotonic() - self._built_at <= INDEX_MAX_AGE:
+                return
+            self._rebuild()
+            self._version = version
+
+    def _rebuild(self):
+        from .models import Problem
+
+        start_time = time.time()
+        rows = Problem.objects.filter(is_active=True).values_list(
+            'id', 'difficulty_score', 'grade_level', 'topic_id'
+        )
+
+        all_rows = []
+        by_grade: Dict[Optional[int], list] = {}
+        by_topic: Dict[int, list] = {}
+        for pk, difficulty, grade, topic_id in rows.iterator(chunk_size=5000):
+            item = (difficulty, pk)
+            all_rows.append(item)
+            by_grade.setdefault(grade, []).append(item)
+            if topic_id is not None:
+                by_topic.setdefault(topic_id, []).append(item)
+
+        self._all = _Group(all_rows)
+        self._by_grade = {grade: _Group(items) for grade, items in by_grade.items()}
+        self._by_topic = {topic_id: _Group(items) for topic_id, items in by_topic.items()}
+        self._built_at = time.monotonic()
+
+        logger.info(
+            f"🗂️ Индекс задач перестроен | Задач: {len(all_rows)} | "
+            f"Время: {time.time() - start_time:.3f} сек"
+        )
+
+    # ------------------------------------------------------------------
+    # Выбор задач
+    # ------------------------------------------------------------------
+
+    def _groups_for(self, grades: Optional[Iterable[Optional[int]]], topic_id: Optional[int]) -> List[_Group]:
+        if topic_id is not None:
+            group = self._by_topic.get(topic_id)
+            return [group] if group else []
+        if grades is not None:
+            return [self._by_grade[g] for g in grades if g in self._by_grade]
+        return [self._all] if self._all else []
+
+    def sample(
+        self,
+        min_difficulty: int = 0,
+        max_difficulty: int = 3000,
+        grades: Optional[Iterable[Optional[int]]] = None,
+        topic_id: Optional[int] = None,
+        exclude: Optional[Container[int]] = None,
+    ) -> Optional[int]:
+        """
+        Выбирает случайный ID задачи в диапазоне сложности
+
+        Args:
+            min_difficulty: Минимальная сложность (включительно)
+            max_difficulty: Максимальная сложность (включительно)
+            grades: Допустимые классы (None в списке - задачи без класса)
+            topic_id: ID темы (опционально)
+            exclude: ID задач, которые нельзя выбирать
+
+        Returns:
+            ID задачи или None, если подходящих нет
+        """
+        self._ensure_fresh()
+
+        spans = []
+        total = 0
+        for group in self._groups_for(grades, topic_id):
+            start, end = group.span(min_difficulty, max_difficulty)
+            if end > start:
+                spans.append((group, start, end))
+                total += end - start
+
+        if not total:
+            return None
+
+        def pick(position):
+            for group, start, end in spans:
+                size = end - start
+                if position < size:
+                    return group.ids[start + position]
+                position -= size
+
+        for _ in range(SAMPLE_ATTEMPTS):
+            problem_id = pick(random.randrange(total))
+            if not exclude or problem_id not in exclude:
+                return problem_id
+
+        # Почти все кандидаты исключены - перебираем срез целиком
+        candidates = [
+            problem_id
+            for group, start, end in spans
+            for problem_id in group.ids[start:end]
+            if problem_id not in exclude
+        ]
+        return random.choice(candidates) if candidates else None
+
+    def select(self, *args, **kwargs):
+        """
+        Выбирает задачу (как sample) и загружает её из БД одним запросом по ключу.
+        Если индекс устарел и задачи уже нет, перестраивает его и пробует снова.
+        """
+        from .models import Problem
+
+        for _ in range(2):
+            problem_id = self.sample(*args, **kwargs)
+            if problem_id is None:
+                return None
+            problem = Problem.objects.filter(pk=problem_id, is_active=True).first()
+            if problem:
+                return problem
+            self._version = None
+        return None
+
+
+# Singleton instance
+_problem_index = None
+
+def get_problem_index() -> ProblemIndex:
+    """Получить экземпляр ProblemIndex (Singleton на процесс)"""
+    global _problem_index
+    if _problem_index is None:
+        _problem_index = ProblemIndex()
+    return _problem_index
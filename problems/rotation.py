@@ -0,0 +1,222 @@
+"""
+Ротация задач из БД по принципу "наименее использованная - первой"
+Очереди по (класс, корзина сложности) и пакетная запись счетчиков показов
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Container, Dict, Optional, Tuple
+
+from django.db.models import F, Q
+
+from .problem_index import DIFFICULTY_BUCKET_SIZE, current_index_version, difficulty_bucket
+
+logger = logging.getLogger(__name__)
+
+# Ячейка очереди перестраивается при смене версии задач или по возрасту,
+# чтобы подтянуть счетчики показов, записанные другими воркерами
+CELL_MAX_AGE = 300
+
+# Когда сбрасывать накопленные показы в Problem.times_used (по окончании запроса)
+FLUSH_BATCH_SIZE = 50
+FLUSH_INTERVAL = 30
+
+
+class _Cell:
+    """Очередь задач одной корзины: в начале - наименее использованные"""
+
+    __slots__ = ('queue', 'version', 'built_at')
+
+    def __init__(self, queue: deque, version):
+        self.queue = queue
+        self.version = version
+        self.built_at = time.monotonic()
+
+
+class ProblemRotation:
+    """
+    Очереди ротации задач по (класс, корзина сложности).
+
+    Очередь строится один раз из БД: задачи отсортированы по times_used,
+    равные перемешаны. Выдается первая подходящая задача с головы очереди и уходит
+    в хвост, поэтому не повторяется, пока не будут показаны остальные;
+    пропущенные (решенные) задачи остаются на своих местах. Счетчики
+    показов копятся в памяти и пишутся в БД пакетно через F() по окончании
+    запроса (flush_if_due), без потерь при параллельных запросах.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cells: Dict[Tuple[Optional[int], int], _Cell] = {}
+        self._pending = Counter()
+        self._last_flush = time.monotonic()
+
+    def _load_rows(self, grade: Optional[int], bucket: int) -> list:
+        """Задачи корзины из БД: (id, сложность, times_used)"""
+        from .models import Problem
+
+        query = Problem.objects.filter(
+            is_active=True,
+            difficulty_score__gte=bucket * DIFFICULTY_BUCKET_SIZE,
+            difficulty_score__lt=(bucket + 1) * DIFFICULTY_BUCKET_SIZE
+        )
+        if grade:
+            query = query.filter(Q(grade_level=grade) | Q(grade_level__isnull=True))
+        return list(query.values_list('id', 'difficulty_score', 'times_used'))
+
+    @staticmethod
+    def _is_fresh(cell: Optional[_Cell], version) -> bool:
+        return (cell is not None and cell.version == version
+                and time.monotonic() - cell.built_at <= CELL_MAX_AGE)
+
+    def _get_cell(self, grade: Optional[int], bucket: int, version) -> _Cell:
+        key = (grade, bucket)
+        cell = self._cells.get(key)
+        if self._is_fresh(cell, version):
+            return cell
+
+        # Запрос к БД - без блокировки, чтобы не останавливать остальные потоки
+        rows = self._load_rows(grade, bucket)
+        random.shuffle(rows)
+        with self._lock:
+            cell = self._cells.get(key)
+            if not self._is_fresh(cell, version):
+                # Сортировка устойчивая - среди одинаково использованных порядок случайный
+                rows.sort(key=lambda row: row[2] + self._pending.get(row[0], 0))
+                cell = _Cell(deque((pk, difficulty) for pk, difficulty, _ in rows), version)
+                self._cells[key] = cell
+        return cell
+
+    def pop(
+        self,
+        difficulty: int,
+        grade: Optional[int] = None,
+        spread: int = 150,
+        exclude: Optional[Container[int]] = None,
+    ) -> Optional[int]:
+        """
+        Выдает наименее использованную задачу в диапазоне difficulty ± spread
+
+        Args:
+            difficulty: Целевая сложность
+            grade: Класс (задачи без класса тоже подходят)
+            spread: Допустимое отклонение сложности
+            exclude: ID задач, которые нельзя выдавать (уже решенные)
+
+        Returns:
+            ID задачи или None
+        """
+        min_diff = max(0, difficulty - spread)
+        max_diff = min(3000, difficulty + spread)
+        version = current_index_version()
+
+        # Сначала корзины, ближайшие к целевой сложности
+        buckets = sorted(
+            range(difficulty_bucket(min_diff), difficulty_bucket(max_diff) + 1),
+            key=lambda b: abs((b + 0.5) * DIFFICULTY_BUCKET_SIZE - difficulty)
+        )
+
+        for bucket in buckets:
+            cell = self._get_cell(grade, bucket, version)
+            with self._lock:
+                queue = cell.queue
+                # Снимаем задачи с головы; пропущенные возвращаются на свои места,
+                # в хвост уходит только выданная
+                skipped = []
+                served = None
+                while queue:
+                    pk, score = queue.popleft()
+                    if min_diff <= score <= max_diff and not (exclude and pk in exclude):
+                        served = (pk, score)
+                        break
+                    skipped.append((pk, score))
+                queue.extendleft(reversed(skipped))
+                if served is not None:
+                    queue.append(served)
+                    self._pending[served[0]] += 1
+                    return served[0]
+        return None
+
+    def record(self, pk: int):
+        """Учитывает показ задачи, выданной не из очереди (например, из пула генераций)"""
+        with self._lock:
+            self._pending[pk] += 1
+
+    def add(self, pk: int, difficulty: int, grade: Optional[int]):
+        """Добавляет новую задачу (еще не показанную) в начало уже построенных очередей без перестройки"""
+        bucket = difficulty_bucket(difficulty)
+        with self._lock:
+            for (cell_grade, cell_bucket), cell in self._cells.items():
+                if cell_bucket == bucket and (not cell_grade or grade is None or cell_grade == grade):
+                    cell.queue.appendleft((pk, difficulty))
+
+    def flush_if_due(self) -> int:
+        """Записывает показы, если накопился пакет или прошел FLUSH_INTERVAL"""
+        if not self._pending:
+            return 0
+        if (sum(self._pending.values()) >= FLUSH_BATCH_SIZE
+                or time.monotonic() - self._last_flush >= FLUSH_INTERVAL):
+            return self.flush()
+        return 0
+
+    def flush(self) -> int:
+        """
+        Записывает накопленные показы в Problem.times_used
+
+        Returns:
+            Количество обновленных задач
+        """
+        from .models import Problem
+
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        # Группируем по величине прироста - один UPDATE на группу
+        by_increment: Dict[int, list] = {}
+        for problem_id, increment in pending.items():
+            by_increment.setdefault(increment, []).append(problem_id)
+
+        try:
+            for increment, problem_ids in by_increment.items():
+                Problem.objects.filter(pk__in=problem_ids).update(
+                    times_used=F('times_used') + increment
+                )
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи счетчиков показов: {e}")
+            with self._lock:
+                self._pending.update(pending)
+            return 0
+
+        logger.info(f"💾 Счетчики показов записаны | Задач: {len(pending)}")
+        return len(pending)
+
+
+# Singleton instance
+_problem_rotation = None
+
+def get_problem_rotation() -> ProblemRotation:
+    """Получить экземпляр ProblemRotation (Singleton на процесс)"""
+    global _problem_rotation
+    if _problem_rotation is None:
+        _problem_rotation = ProblemRotation()
+    return _problem_rotation
+
+
+def add_to_problem_rotation(pk: int, difficulty: int, grade: Optional[int]):
+    """Добавляет новую задачу в очереди процесса, если они уже построены"""
+    if _problem_rotation is not None:
+        _problem_rotation.add(pk, difficulty, grade)
+
+
+def flush_problem_rotation() -> int:
+    """Записывает накопленные показы процесса, если пора (граница запроса)"""
+    if _problem_rotation is None:
+        return 0
+    return _problem_rotation.flush_if_due()
@@ -0,0 +1,43 @@
+from django.core.signals import request_finished
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Problem, UserAttempt
+from .problem_index import get_problem_index
+from .rotation import add_to_problem_rotation, flush_problem_rotation
+from .solved_cache import invalidate_user
+
+
+@receiver(post_save, sender=Problem)
+def invalidate_index_on_save(sender, instance, created=False, update_fields=None, **kwargs):
+    """Сбрасывает индекс задач при изменении задачи, новую задачу добавляет в индекс"""
+    # Счетчик показов не влияет на индекс - не перестраиваем его на каждый показ
+    if update_fields and set(update_fields) <= {'times_used'}:
+        return
+    if created:
+        # Каждая сгенерированная задача - вставка: добавляем её в индекс и очереди
+        # этого процесса, остальные воркеры подхватят её при плановой перестройке
+        if instance.is_active:
+            get_problem_index().add(
+                instance.id, instance.difficulty_score, instance.grade_level, instance.topic_id
+            )
+            add_to_problem_rotation(instance.id, instance.difficulty_score, instance.grade_level)
+        return
+    get_problem_index().invalidate()
+
+
+@receiver(post_delete, sender=Problem)
+def invalidate_index_on_delete(sender, instance, **kwargs):
+    """Сбрасывает индекс задач при удалении задачи"""
+    get_problem_index().invalidate()
+
+
+@receiver(post_delete, sender=UserAttempt)
+def invalidate_solved_on_attempt_delete(sender, instance, **kwargs):
+    """Сбрасывает кеш решенных задач пользователя при удалении попытки"""
+    invalidate_user(instance.user_id)
+
+
+@receiver(request_finished)
+def flush_rotation_on_request_finished(sender, **kwargs):
+    """Пишет накопленные показы задач после ответа, а не при выходе процесса"""
+    flush_problem_rotation()
@@ -0,0 +1,152 @@
+"""
+Кеш множеств решенных задач пользователей
+Компактное представление (отсортированный массив ID) для фильтрации кандидатов в памяти.
+Ключи версионированы по пользователю: попытка увеличивает версию и кладет под
+новым ключом дополненное множество, поэтому параллельные ответы не теряют друг друга
+"""
+
+import bisect
+import logging
+import time
+import zlib
+from array import array
+from typing import Iterable, Optional
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+SOLVED_CACHE_TIMEOUT = 24 * 3600
+
+
+class SolvedIdSet:
+    """
+    Отсортированный массив ID задач.
+
+    Проверка принадлежности - бинарный поиск, хранение в кеше - дельты
+    между соседними ID, сжатые zlib (несколько байт на задачу).
+    """
+
+    __slots__ = ('_ids',)
+
+    def __init__(self, ids: Iterable[int] = ()):
+        self._ids = array('q', sorted(set(ids)))
+
+    def __contains__(self, problem_id) -> bool:
+        position = bisect.bisect_left(self._ids, problem_id)
+        return position < len(self._ids) and self._ids[position] == problem_id
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def to_bytes(self) -> bytes:
+        deltas = array('q', self._ids)
+        for i in range(len(deltas) - 1, 0, -1):
+            deltas[i] -= deltas[i - 1]
+        return zlib.compress(deltas.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'SolvedIdSet':
+        instance = cls()
+        ids = array('q')
+        ids.frombytes(zlib.decompress(data))
+        for i in range(1, len(ids)):
+            ids[i] += ids[i - 1]
+        instance._ids = ids
+        return instance
+
+
+def _version_key(user_id: int) -> str:
+    return f"solved_ids_version_{user_id}"
+
+
+def _current_version(user_id: int) -> int:
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), 0, timeout=None)
+        version = cache.get(_version_key(user_id), 0)
+    return version
+
+
+def _cache_key(user_id: int, correct_only: bool, version: int) -> str:
+    kind = 'correct' if correct_only else 'attempted'
+    return f"solved_ids_{kind}_{user_id}_v{version}"
+
+
+def get_solved_problem_ids(user_id: int, correct_only: bool = True) -> SolvedIdSet:
+    """
+    Получить множество задач пользователя
+
+    Args:
+        user_id: ID пользователя
+        correct_only: True - только правильно решенные, False - все попытки
+
+    Returns:
+        SolvedIdSet с ID задач
+    """
+    from .models import UserAttempt
+
+    key = _cache_key(user_id, correct_only, _current_version(user_id))
+    data = cache.get(key)
+    if data is not None:
+        return SolvedIdSet.from_bytes(data)
+
+    attempts = UserAttempt.objects.filter(user_id=user_id, problem__isnull=False)
+    if correct_only:
+        attempts = attempts.filter(is_correct=True)
+    solved = SolvedIdSet(attempts.values_list('problem_id', flat=True))
+
+    # Если за время запроса версия сменилась, множество ляжет под старый ключ и не будет прочитано
+    cache.add(key, solved.to_bytes(), timeout=SOLVED_CACHE_TIMEOUT)
+    logger.debug(f"Множество задач пользователя {user_id} загружено из БД: {len(solved)}")
+    return solved
+
+
+def record_attempt(user_id: int, problem_id: int, is_correct: bool):
+    """
+    Дополняет закешированные множества задачей после попытки (попытка уже сохранена в БД)
+
+    Множества не меняются на месте: чтение-изменение-запись в кеше теряло бы
+    задачи при параллельных ответах одного пользователя. Новая версия строится
+    из множеств текущей версии и задачи (is_correct - и в множестве правильно
+    решенных) и кладется через cache.add. Если версию одновременно сменила
+    другая попытка, множества не пишутся и следующее чтение строит их из БД.
+    """
+    if not problem_id:
+        return
+    version = _current_version(user_id)
+    cached = {
+        correct_only: cache.get(_cache_key(user_id, correct_only, version))
+        for correct_only in (True, False)
+    }
+    new_version = _bump_version(user_id)
+    if new_version != version + 1:
+        return
+
+    for correct_only, data in cached.items():
+        if data is None:
+            continue
+        solved = SolvedIdSet.from_bytes(data)
+        if is_correct or not correct_only:
+            solved = SolvedIdSet((*solved, problem_id))
+        cache.add(_cache_key(user_id, correct_only, new_version), solved.to_bytes(), timeout=SOLVED_CACHE_TIMEOUT)
+
+
+def _bump_version(user_id: int) -> Optional[int]:
+    """Атомарно увеличивает версию пользователя; None - версия заменена целиком"""
+    key = _version_key(user_id)
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключ вытеснен между add и incr - новая версия все равно отличается от прежней
+        cache.set(key, time.time_ns(), timeout=None)
+        return None
+
+
+def invalidate_user(user_id: int):
+    """Сбрасывает закешированные множества пользователя (старые ключи истекут по таймауту)"""
+    _bump_version(user_id)
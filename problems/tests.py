@@ -1,6 +1,21 @@
+import asyncio
+import json
+from unittest import mock
 from django.test import TestCase
 from django.contrib.auth.models import User
-from .models import Topic, Problem, UserAttempt
+from django.core.cache import cache
+from django.core.management import call_command
+from .models import Topic, Problem, UserAttempt, AnswerVerdict
+from .inventory import build_inventory_cells, clamp_to_bucket, coverage_counts, pick_topic_for_cell
+from .next_queue import fill_next_problems, pop_next_problem, refresh_next_problems
+from .problem_index import current_index_version, get_problem_index
+from .rotation import ProblemRotation, get_problem_rotation
+from .solved_cache import SolvedIdSet, get_solved_problem_ids, record_attempt
+from .verdicts import get_cached_verdict, store_verdict
+from core import generation_cache
+from core.generation_cache import GenerationCache, generation_key
+from core.llm_guard import CircuitBreaker, CircuitOpenError, LLMGuard, TokenBucket, get_llm_guard
+from core.metrics import get_metrics
 
 
 class ProblemModelTest(TestCase):
@@ -57,3 +72,806 @@ class ProblemModelTest(TestCase):
         self.assertEqual(attempt.problem, self.problem)
         self.assertTrue(attempt.is_correct)
         self.assertEqual(attempt.points_awarded, 150)
+
+
+class CanonicalAnswerTest(TestCase):
+    """Тесты для канонического ответа задачи"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='solver', password='testpass123')
+        self.client.force_login(self.user)
+        self.problem = Problem.objects.create(
+            title='Дробь',
+            latex_formula=r'2x = 1',
+            description='Решите уравнение',
+            correct_answer='1/2',
+            difficulty_score=800
+        )
+    
+    def _submit(self, answer):
+        response = self.client.post('/api/problems/submit/', {
+            'problem_id': self.problem.id,
+            'submitted_answer': answer,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['is_correct']
+    
+    def test_computed_on_save(self):
+        """Канонический ответ пересчитывается при сохранении правильного ответа"""
+        self.assertEqual(self.problem.canonical_answer, '1/2')
+        
+        self.problem.correct_answer = 'x1 = 3; x2 = 0,5'
+        self.problem.save(update_fields=['correct_answer'])
+        self.problem.refresh_from_db()
+        self.assertEqual(self.problem.canonical_answer, '1/2;3')
+    
+    def test_submit_compares_canonical_forms(self):
+        """Эквивалентная запись ответа засчитывается без разбора ответа задачи"""
+        with mock.patch('problems.views.problem_canonical_answer') as recompute:
+            self.assertTrue(self._submit('0.5'))
+            self.assertTrue(self._submit('x = 1/2'))
+            self.assertFalse(self._submit('2'))
+        recompute.assert_not_called()
+    
+    def test_submit_system_and_unbounded_answers(self):
+        """Переставленные значения системы неверны, башня степеней не вычисляется"""
+        self.problem.correct_answer = 'x = 2, y = 3'
+        self.problem.save()
+        self.assertTrue(self._submit('y=3; x=2'))
+        self.assertFalse(self._submit('x = 3, y = 2'))
+        self.assertFalse(self._submit('9^9^9'))
+    
+    def test_backfill_command(self):
+        """Команда заполняет пустые канонические ответы"""
+        Problem.objects.filter(pk=self.problem.pk).update(canonical_answer='')
+        call_command('backfill_canonical_answers', stdout=mock.Mock())
+        self.problem.refresh_from_db()
+        self.assertEqual(self.problem.canonical_answer, '1/2')
+        self.assertTrue(self._submit('0,5'))
+
+
+class ValidateProblemsCommandTest(TestCase):
+    """Тесты для команды validate_problems"""
+    
+    def _problem(self, equation, answer, source='ai_generated'):
+        return Problem.objects.create(
+            title='Уравнение',
+            latex_formula=equation,
+            description='Решите уравнение',
+            correct_answer=answer,
+            difficulty_score=900,
+            source=source
+        )
+    
+    def test_validates_and_deactivates_wrong_answers(self):
+        """Неверный ответ снимается с показа, неполный - только помечается, повторный запуск продолжает"""
+        correct = self._problem('x + 5 = 12', '7')
+        wrong = self._problem('x + 5 = 12', '10')
+        missing = self._problem('x^2 - 5*x + 6 = 0', '2', source='imported')
+        manual = self._problem('x + 5 = 12', '10', source='manual')
+        
+        call_command('validate_problems', '--workers', '0', '--limit', '2', stdout=mock.Mock())
+        self.assertEqual(Problem.objects.filter(validated_at__isnull=False).count(), 2)
+        call_command('validate_problems', '--workers', '0', stdout=mock.Mock())
+        
+        for problem in (correct, wrong, missing, manual):
+            problem.refresh_from_db()
+        self.assertEqual(
+            [p.validation_status for p in (correct, wrong, missing, manual)],
+            ['pass', 'wrong', 'fail', '']
+        )
+        self.assertEqual([p.is_active for p in (correct, wrong, missing, manual)], [True, False, True, True])
+        self.assertIsNotNone(wrong.validation_ms)
+        self.assertTrue(wrong.validation_errors)
+    
+    def test_rounded_answers_are_not_wrong(self):
+        """Округленный десятичный ответ не снимает задачу с показа"""
+        thirds = self._problem('3*x = 10', '3.33')
+        roots = self._problem('x^2 = 2', '1.41, -1.41')
+        
+        call_command('validate_problems', '--workers', '0', stdout=mock.Mock())
+        
+        for problem in (thirds, roots):
+            problem.refresh_from_db()
+            self.assertEqual(problem.validation_status, 'fail')
+            self.assertTrue(problem.is_active)
+
+
+class ProblemIndexTest(TestCase):
+    """Тесты для индекса задач в памяти"""
+    
+    def setUp(self):
+        """Создаем задачи разной сложности"""
+        self.index = get_problem_index()
+        self.index.invalidate()
+        
+        self.easy = Problem.objects.create(
+            title='Легкая', latex_formula='x + 1 = 2', description='Решите',
+            correct_answer='1', difficulty_score=300, grade_level=5
+        )
+        self.medium = Problem.objects.create(
+            title='Средняя', latex_formula='x + 2 = 4', description='Решите',
+            correct_answer='2', difficulty_score=1000, grade_level=7
+        )
+        self.hard = Problem.objects.create(
+            title='Сложная', latex_formula='x^2 = 9', description='Решите',
+            correct_answer='3, -3', difficulty_score=2000
+        )
+    
+    def test_sample_respects_difficulty_range(self):
+        """Выбираются только задачи из диапазона сложности"""
+        for _ in range(20):
+            self.assertEqual(self.index.sample(900, 1100), self.medium.id)
+        self.assertIsNone(self.index.sample(1200, 1800))
+    
+    def test_sample_excludes_ids(self):
+        """Исключенные задачи не выбираются"""
+        self.assertIsNone(self.index.sample(900, 1100, exclude={self.medium.id}))
+        for _ in range(20):
+            self.assertNotEqual(self.index.sample(exclude={self.medium.id}), self.medium.id)
+    
+    def test_sample_by_grade(self):
+        """Фильтр по классу учитывает задачи без класса"""
+        for _ in range(20):
+            self.assertIn(
+                self.index.sample(grades=[7, None]),
+                {self.medium.id, self.hard.id}
+            )
+    
+    def test_index_invalidated_on_save_and_delete(self):
+        """Новая задача добавляется в индекс, изменение и удаление перестраивают его"""
+        self.assertIsNone(self.index.sample(1400, 1600))
+        version = current_index_version()
+        
+        extra = Problem.objects.create(
+            title='Новая', latex_formula='x = 5', description='Решите',
+            correct_answer='5', difficulty_score=1500
+        )
+        # Вставка не сбрасывает индексы остальных процессов
+        self.assertEqual(current_index_version(), version)
+        self.assertEqual(self.index.sample(1400, 1600), extra.id)
+        
+        extra.is_active = False
+        extra.save()
+        self.assertIsNone(self.index.sample(1400, 1600))
+        
+        self.medium.delete()
+        self.assertIsNone(self.index.sample(900, 1100))
+    
+    def test_select_returns_problem(self):
+        """select загружает задачу по выбранному ID"""
+        problem = self.index.select(0, 500)
+        self.assertEqual(problem, self.easy)
+
+
+class SolvedCacheTest(TestCase):
+    """Тесты для кеша решенных задач"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='solver', password='testpass123')
+        self.problems = [
+            Problem.objects.create(
+                title=f'Задача {i}', latex_formula='x = 1', description='Решите',
+                correct_answer='1', difficulty_score=1000
+            )
+            for i in range(3)
+        ]
+    
+    def test_roundtrip_bytes(self):
+        """Сериализация сохраняет множество"""
+        solved = SolvedIdSet([42, 7, 100500, 7])
+        restored = SolvedIdSet.from_bytes(solved.to_bytes())
+        self.assertEqual(list(restored), [7, 42, 100500])
+        self.assertIn(42, restored)
+        self.assertNotIn(43, restored)
+    
+    def test_built_from_db_and_refreshed_after_attempt(self):
+        """Множество строится из БД и перестраивается после попытки"""
+        first, second, third = self.problems
+        UserAttempt.objects.create(
+            user=self.user, problem=first, submitted_answer='1', is_correct=True
+        )
+        UserAttempt.objects.create(
+            user=self.user, problem=second, submitted_answer='2', is_correct=False
+        )
+        
+        self.assertEqual(list(get_solved_problem_ids(self.user.id)), [first.id])
+        self.assertEqual(
+            list(get_solved_problem_ids(self.user.id, correct_only=False)),
+            [first.id, second.id]
+        )
+        
+        UserAttempt.objects.create(
+            user=self.user, problem=third, submitted_answer='1', is_correct=True
+        )
+        record_attempt(self.user.id, third.id, True)
+        self.assertIn(third.id, get_solved_problem_ids(self.user.id))
+        self.assertIn(third.id, get_solved_problem_ids(self.user.id, correct_only=False))
+    
+    def test_attempt_extends_cached_sets_without_db(self):
+        """После попытки множества дополняются из кеша, без запроса к БД"""
+        first, second, _ = self.problems
+        get_solved_problem_ids(self.user.id)
+        get_solved_problem_ids(self.user.id, correct_only=False)
+        
+        UserAttempt.objects.create(
+            user=self.user, problem=first, submitted_answer='2', is_correct=False
+        )
+        record_attempt(self.user.id, first.id, False)
+        with self.assertNumQueries(0):
+            self.assertNotIn(first.id, get_solved_problem_ids(self.user.id))
+            self.assertIn(first.id, get_solved_problem_ids(self.user.id, correct_only=False))
+    
+    def test_concurrent_attempts_not_lost(self):
+        """Чтение, начатое до попытки, не перезаписывает множество после нее"""
+        first, second, _ = self.problems
+        get_solved_problem_ids(self.user.id, correct_only=False)
+        
+        # Устаревшее чтение: множество без новых попыток сохраняется уже после них
+        stale = SolvedIdSet()
+        stale_key = f"solved_ids_attempted_{self.user.id}_v{cache.get(f'solved_ids_version_{self.user.id}')}"
+        for problem in (first, second):
+            UserAttempt.objects.create(
+                user=self.user, problem=problem, submitted_answer='1', is_correct=True
+            )
+            record_attempt(self.user.id, problem.id, True)
+        cache.set(stale_key, stale.to_bytes())
+        
+        self.assertEqual(
+            list(get_solved_problem_ids(self.user.id, correct_only=False)),
+            [first.id, second.id]
+        )
+
+
+class ProblemRotationTest(TestCase):
+    """Тесты для очереди ротации задач"""
+    
+    def setUp(self):
+        get_problem_index().invalidate()
+        self.rotation = ProblemRotation()
+        self.used = Problem.objects.create(
+            title='Показанная', latex_formula='x = 1', description='Решите',
+            correct_answer='1', difficulty_score=1010, grade_level=7, times_used=5
+        )
+        self.fresh = Problem.objects.create(
+            title='Новая', latex_formula='x = 2', description='Решите',
+            correct_answer='2', difficulty_score=1020, grade_level=7, times_used=0
+        )
+        self.other_grade = Problem.objects.create(
+            title='Другой класс', latex_formula='x = 3', description='Решите',
+            correct_answer='3', difficulty_score=1000, grade_level=9
+        )
+    
+    def test_least_used_first_then_rotates(self):
+        """Сначала выдается наименее использованная задача, затем следующая"""
+        self.assertEqual(self.rotation.pop(1000, grade=7), self.fresh.id)
+        self.assertEqual(self.rotation.pop(1000, grade=7), self.used.id)
+        self.assertEqual(self.rotation.pop(1000, grade=7), self.fresh.id)
+    
+    def test_pop_skips_excluded(self):
+        """Решенные задачи пропускаются"""
+        self.assertEqual(
+            self.rotation.pop(1000, grade=7, exclude={self.fresh.id}),
+            self.used.id
+        )
+        self.assertIsNone(
+            self.rotation.pop(1000, grade=7, exclude={self.fresh.id, self.used.id})
+        )
+    
+    def test_excluded_keep_their_place(self):
+        """Пропущенная задача не уходит в хвост очереди"""
+        stale = Problem.objects.create(
+            title='Частая', latex_formula='x = 4', description='Решите',
+            correct_answer='4', difficulty_score=1030, grade_level=7, times_used=10
+        )
+        self.assertEqual(self.rotation.pop(1000, grade=7, exclude={self.fresh.id}), self.used.id)
+        self.assertEqual(self.rotation.pop(1000, grade=7), self.fresh.id)
+        self.assertEqual(self.rotation.pop(1000, grade=7), stale.id)
+    
+    def test_added_problem_served_first(self):
+        """Новая задача встает в начало построенной очереди"""
+        self.assertEqual(self.rotation.pop(1000, grade=7), self.fresh.id)
+        added = Problem.objects.create(
+            title='Добавленная', latex_formula='x = 5', description='Решите',
+            correct_answer='5', difficulty_score=1040, grade_level=7
+        )
+        self.rotation.add(added.id, added.difficulty_score, 7)
+        self.assertEqual(self.rotation.pop(1000, grade=7), added.id)
+    
+    def test_flush_increments_times_used(self):
+        """Показы пишутся в БД пакетно"""
+        for _ in range(3):
+            self.rotation.pop(1000, grade=7)
+        self.assertEqual(self.rotation.flush(), 2)
+        
+        self.fresh.refresh_from_db()
+        self.used.refresh_from_db()
+        self.assertEqual(self.fresh.times_used, 2)
+        self.assertEqual(self.used.times_used, 6)
+
+
+class NextProblemQueueTest(TestCase):
+    """Тесты для очереди следующих задач пользователя"""
+    
+    def setUp(self):
+        cache.clear()
+        get_problem_index().invalidate()
+        self.user = User.objects.create_user(username='queued', password='testpass123')
+        self.low = [
+            Problem.objects.create(
+                title=f'Низкая {i}', latex_formula='x = 1', description='Решите',
+                correct_answer='1', difficulty_score=950 + i
+            )
+            for i in range(3)
+        ]
+        self.high = Problem.objects.create(
+            title='Высокая', latex_formula='x = 2', description='Решите',
+            correct_answer='2', difficulty_score=1500
+        )
+    
+    def test_pop_serves_queued_problems_once(self):
+        """Задачи из очереди выдаются без повторов в пределах очереди"""
+        served = {pop_next_problem(self.user.id, 1000).id for _ in range(3)}
+        self.assertEqual(served, {p.id for p in self.low})
+    
+    def test_queue_refilled_when_bucket_changes(self):
+        """Очередь пересчитывается при переходе индекса в другую корзину"""
+        fill_next_problems(self.user.id, 1000)
+        refresh_next_problems(self.user.id, 1500)
+        self.assertEqual(pop_next_problem(self.user.id, 1500), self.high)
+    
+    def test_solved_problems_are_skipped(self):
+        """Решенные задачи не выдаются из очереди"""
+        fill_next_problems(self.user.id, 1500)
+        UserAttempt.objects.create(
+            user=self.user, problem=self.high, submitted_answer='2', is_correct=True
+        )
+        record_attempt(self.user.id, self.high.id, True)
+        self.assertIsNone(pop_next_problem(self.user.id, 1500))
+
+
+class GenerationCacheTest(TestCase):
+    """Тесты для пула сгенерированных задач"""
+    
+    def setUp(self):
+        cache.clear()
+        self.pool = GenerationCache()
+    
+    def _problem(self, problem_id):
+        return {'title': f'Задача {problem_id}', 'correct_answer': '2', 'problem_id': problem_id}
+    
+    def test_key_normalizes_topic_and_buckets_difficulty(self):
+        """Регистр, пробелы и сложность внутри корзины не меняют ключ"""
+        self.assertEqual(
+            generation_key('Алгебра:  Уравнения', 1510, 7),
+            generation_key(' алгебра: уравнения', 1590, 7)
+        )
+        self.assertNotEqual(generation_key('Алгебра', 1510, 7), generation_key('Алгебра', 1610, 7))
+        self.assertNotEqual(generation_key('Алгебра', 1510, 7), generation_key('Алгебра', 1510, 8))
+        self.assertNotEqual(
+            generation_key('Алгебра', 1510, 7, prompt_version=1),
+            generation_key('Алгебра', 1510, 7, prompt_version=2)
+        )
+    
+    def test_get_excludes_solved(self):
+        """Решенные пользователем задачи из пула не выдаются"""
+        self.pool.put('Алгебра', 1500, 7, self._problem(1))
+        self.pool.put('Алгебра', 1500, 7, self._problem(2))
+        
+        self.assertEqual(self.pool.get('алгебра', 1550, 7)['problem_id'], 2)
+        self.assertEqual(self.pool.get('Алгебра', 1500, 7, exclude={2})['problem_id'], 1)
+        self.assertIsNone(self.pool.get('Алгебра', 1500, 7, exclude={1, 2}))
+        self.assertIsNone(self.pool.get('Геометрия', 1500, 7))
+    
+    def test_pool_size_and_ttl(self):
+        """Пул ограничен по размеру, устаревшие задачи отбрасываются"""
+        with mock.patch.object(generation_cache, 'GENERATION_POOL_SIZE', 2):
+            for problem_id in (1, 2, 3):
+                self.pool.put('Алгебра', 1500, 7, self._problem(problem_id))
+        self.assertIsNone(self.pool.get('Алгебра', 1500, 7, exclude={2, 3}))
+        
+        with mock.patch.object(generation_cache, 'GENERATION_CACHE_TTL', -1):
+            self.assertIsNone(self.pool.get('Алгебра', 1500, 7))
+
+
+class VerdictCacheTest(TestCase):
+    """Тесты для кеша вердиктов проверки"""
+    
+    def setUp(self):
+        cache.clear()
+        self.problem_data = {'title': 'Задача', 'description': 'Найдите x', 'correct_answer': 'x > 3'}
+        self.check_result = {'is_correct': False, 'feedback': 'Неверно', 'confidence': 0.9}
+    
+    def test_equivalent_answers_share_verdict(self):
+        """'x=5', '5.0' и '5' - один ответ"""
+        store_verdict(self.problem_data, 'x = 5', self.check_result)
+        self.assertEqual(get_cached_verdict(self.problem_data, '5.0'), self.check_result)
+        self.assertIsNone(get_cached_verdict(self.problem_data, '6'))
+        self.assertIsNone(get_cached_verdict(dict(self.problem_data, title='Другая'), '5'))
+    
+    def test_swapped_system_values_not_shared(self):
+        """Ответы системы с переставленными значениями - разные ответы"""
+        store_verdict(self.problem_data, 'x = 3, y = 2', self.check_result)
+        self.assertEqual(get_cached_verdict(self.problem_data, 'y=2; x=3'), self.check_result)
+        self.assertIsNone(get_cached_verdict(self.problem_data, 'x = 2, y = 3'))
+    
+    def test_db_fallback(self):
+        """После очистки кеша вердикт берется из БД"""
+        store_verdict(self.problem_data, '5', self.check_result)
+        store_verdict(self.problem_data, '5', self.check_result)
+        self.assertEqual(AnswerVerdict.objects.count(), 1)
+        
+        cache.clear()
+        self.assertEqual(get_cached_verdict(self.problem_data, '5'), self.check_result)
+
+
+class LLMGuardTest(TestCase):
+    """Тесты для лимита запросов и предохранителя вызовов LLM"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_bucket_allows_burst_then_waits(self):
+        """Сверх burst токенов - ожидание одного токена, затем пополнение по rate"""
+        bucket = TokenBucket('test', rate_per_second=1.0, burst=3)
+        with mock.patch('core.llm_guard.time.time', return_value=1000.0):
+            self.assertEqual([bucket.try_acquire() for _ in range(3)], [0.0, 0.0, 0.0])
+            self.assertAlmostEqual(bucket.try_acquire(), 1.0)
+        # Через полсекунды - полтокена, до целого еще полсекунды
+        with mock.patch('core.llm_guard.time.time', return_value=1000.5):
+            self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+        # Через секунду пополнился ровно один токен, а не вся корзина
+        with mock.patch('core.llm_guard.time.time', return_value=1001.5):
+            self.assertEqual(bucket.try_acquire(), 0.0)
+            self.assertGreater(bucket.try_acquire(), 0)
+    
+    def test_breaker_opens_and_half_opens(self):
+        """После threshold ошибок запросы отклоняются, после паузы - один пробный"""
+        breaker = CircuitBreaker('test', threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open())
+        self.assertFalse(breaker.allow())
+        
+        cache.delete('llm_breaker_test_open_until')
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        # Пока идет пробный запрос, отказ сообщает, сколько ждать
+        self.assertGreater(breaker.retry_after(), 0)
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+    
+    def test_open_breaker_rejects_without_calling(self):
+        """Разомкнутый предохранитель не пропускает вызов"""
+        guard = LLMGuard('test')
+        for _ in range(guard.breaker.threshold):
+            guard.record_failure(TimeoutError())
+        
+        func = mock.Mock()
+        with self.assertRaises(CircuitOpenError):
+            guard.call(func)
+        func.assert_not_called()
+    
+    def test_only_transient_errors_open_breaker(self):
+        """Ошибки запроса (400, разбор ответа) не размыкают предохранитель, 429 и 5xx - размыкают"""
+        guard = LLMGuard('test')
+        for _ in range(guard.breaker.threshold):
+            guard.record_failure(ValueError('Некорректный JSON'))
+            guard.record_failure(mock.Mock(spec=Exception, code=400))
+        self.assertFalse(guard.is_open())
+        
+        for _ in range(guard.breaker.threshold):
+            guard.record_failure(mock.Mock(spec=Exception, code=429))
+        self.assertTrue(guard.is_open())
+
+    
+    def test_call_records_latency_and_tokens(self):
+        """Время запроса и токены из usage_metadata попадают в метрики"""
+        get_metrics().reset()
+        usage = mock.Mock(prompt_token_count=120, candidates_token_count=30)
+        guard = LLMGuard('test')
+        guard.call(mock.Mock(return_value=mock.Mock(usage_metadata=usage)), operation='check')
+        with self.assertRaises(RuntimeError):
+            guard.call(mock.Mock(side_effect=RuntimeError('500')), operation='check')
+        
+        metrics = get_metrics()
+        self.assertEqual(metrics.get_counter('llm_tokens_total', service='test', operation='check', kind='prompt'), 120)
+        self.assertEqual(metrics.get_counter('llm_tokens_total', service='test', operation='check', kind='response'), 30)
+        calls = {
+            histogram['labels']['outcome']: histogram['count']
+            for histogram in metrics.snapshot()['histograms']
+            if histogram['name'] == 'llm_call_seconds'
+        }
+        self.assertEqual(calls, {'ok': 1, 'error': 1})
+
+
+class MetricsViewTest(TestCase):
+    """Тесты для endpoint метрик"""
+    
+    def test_metrics_only_for_admins(self):
+        get_metrics().increment('gemini_generation_total', outcome='ok')
+        student = User.objects.create_user(username='student', password='testpass123')
+        self.client.force_login(student)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        
+        admin = User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        names = {counter['name'] for counter in response.json()['counters']}
+        self.assertIn('gemini_generation_total', names)
+
+
+class InventoryTest(TestCase):
+    """Тесты для учета запаса задач"""
+    
+    def test_coverage_counts_groups_unused_problems(self):
+        """Покрытие считается по (класс, корзина, категория) только для неиспользованных"""
+        for score, times_used in [(510, 0), (590, 0), (650, 0), (520, 3)]:
+            Problem.objects.create(
+                title='Задача', latex_formula='x = 1', description='Решите',
+                correct_answer='1', difficulty_score=score, grade_level=5,
+                category='Дроби', times_used=times_used
+            )
+        
+        counts = coverage_counts()
+        self.assertEqual(counts[(5, 5, 'Дроби')], 2)
+        self.assertEqual(counts[(5, 6, 'Дроби')], 1)
+        self.assertEqual(coverage_counts(max_times_used=3)[(5, 5, 'Дроби')], 3)
+    
+    def test_cells_cover_catalog(self):
+        """Каждая тема каталога попадает в свои ячейки"""
+        cells = build_inventory_cells()
+        topic, difficulty = pick_topic_for_cell((5, 5, 'Дроби'), cells[(5, 5, 'Дроби')])
+        self.assertEqual(topic['category'], 'Дроби')
+        self.assertTrue(500 <= difficulty <= 599)
+
+    
+    def test_backfill_categories_from_catalog(self):
+        """Категория старых задач определяется по теме, тексту и ячейке каталога"""
+        topic = Topic.objects.create(name='Уравнения: Линейные уравнения')
+        by_topic = Problem.objects.create(
+            title='Задача', latex_formula='x = 1', description='Решите',
+            correct_answer='1', difficulty_score=900, grade_level=7, topic=topic
+        )
+        by_text = Problem.objects.create(
+            title='Сложение дробей', latex_formula='', description='Найдите сумму дробей 1/2 и 1/3',
+            correct_answer='5/6', difficulty_score=550, grade_level=5
+        )
+        unknown = Problem.objects.create(
+            title='Задача', latex_formula='', description='Решите',
+            correct_answer='1', difficulty_score=1500, grade_level=9
+        )
+        
+        call_command('backfill_problem_categories', stdout=mock.Mock())
+        
+        for problem in (by_topic, by_text, unknown):
+            problem.refresh_from_db()
+        self.assertEqual([p.category for p in (by_topic, by_text, unknown)], ['Уравнения', 'Дроби', ''])
+    
+    def test_generated_score_clamped_to_bucket(self):
+        """Сложность модели сохраняется, но не выходит за корзину ячейки"""
+        self.assertEqual(clamp_to_bucket(540, 5, 550), 540)
+        self.assertEqual(clamp_to_bucket(800, 5, 550), 599)
+        self.assertEqual(clamp_to_bucket(None, 5, 550), 550)
+
+class _FakeGemini:
+    """Заглушка GeminiService для тестов асинхронных views"""
+    
+    def __init__(self, delay=0, is_correct=True):
+        self.delay = delay
+        self.is_correct = is_correct
+    
+    async def agenerate_problem(self, topic, difficulty, user_level, user_grade=None, user_age=None):
+        await asyncio.sleep(self.delay)
+        return {
+            'title': 'Сгенерированная задача',
+            'problem_text': 'Решите уравнение x + 1 = 3',
+            'description': 'Решите уравнение x + 1 = 3',
+            'equation_to_solve': 'x + 1 = 3',
+            'correct_answer': '2',
+            'solution_steps': ['x = 3 - 1', 'x = 2'],
+            'hints': ['Перенесите 1 вправо'],
+            'difficulty_score': difficulty,
+        }
+    
+    async def astream_problem(self, topic, difficulty, user_level, user_grade=None, user_age=None):
+        problem_data = await self.agenerate_problem(topic, difficulty, user_level, user_grade, user_age)
+        for field in ('title', 'problem_text', 'equation_to_solve'):
+            yield 'field', (field, problem_data[field])
+        yield 'problem', problem_data
+    
+    async def acheck_solution(self, problem_data, user_answer, solution_photo=None):
+        await asyncio.sleep(self.delay)
+        return {'is_correct': self.is_correct, 'feedback': 'Проверено', 'confidence': 0.99}
+
+
+class GeminiViewsTest(TestCase):
+    """Тесты для асинхронных views генерации и проверки через ИИ"""
+    
+    def setUp(self):
+        cache.clear()
+        get_problem_index().invalidate()
+        self.user = User.objects.create_user(username='student', password='testpass123')
+        profile = self.user.profile
+        profile.user_type = 'student'
+        profile.age = 13
+        profile.grade = 7
+        profile.country = 'UZ'
+        profile.save()
+        self.client.force_login(self.user)
+    
+    def test_requires_authentication(self):
+        """Без входа - 403, как у IsAuthenticated"""
+        self.client.logout()
+        response = self.client.get('/api/problems/generate-ai/')
+        self.assertEqual(response.status_code, 403)
+    
+    def test_generate_and_submit_ai_problem(self):
+        """Задача генерируется, сохраняется в БД и проверяется"""
+        with mock.patch('problems.views_gemini.get_gemini_service', return_value=_FakeGemini()):
+            response = self.client.get('/api/problems/generate-ai/')
+            self.assertEqual(response.status_code, 200)
+            problem = response.json()['problem']
+            self.assertTrue(problem['generated_by_ai'])
+            self.assertEqual(Problem.objects.filter(source='ai_generated').count(), 1)
+            
+            response = self.client.post('/api/problems/submit-ai/', {
+                'problem_id': problem['id'],
+                'submitted_answer': '2',
+            })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_correct'])
+        attempt = UserAttempt.objects.get(user=self.user)
+        self.assertEqual(attempt.problem, Problem.objects.get(source='ai_generated'))
+    
+    def test_generated_problem_served_from_pool(self):
+        """Повторный спрос на ту же тему обслуживается из пула без вызова Gemini"""
+        with mock.patch('problems.views_gemini.get_gemini_service', return_value=_FakeGemini()):
+            self.client.get('/api/problems/generate-ai/', {'topic': 'Линейные уравнения'})
+        
+        other = User.objects.create_user(username='student2', password='testpass123')
+        profile = other.profile
+        profile.user_type = 'student'
+        profile.age = 13
+        profile.grade = 7
+        profile.country = 'UZ'
+        profile.save()
+        self.client.force_login(other)
+        get_problem_rotation().flush()
+        times_used = Problem.objects.get(source='ai_generated').times_used
+        
+        with mock.patch('problems.views_gemini.get_gemini_service') as service, \
+                mock.patch('problems.views_gemini._find_unused_problem') as find_unused:
+            response = self.client.get('/api/problems/generate-ai/', {'topic': 'Линейные уравнения'})
+        
+        self.assertEqual(response.status_code, 200)
+        service.assert_not_called()
+        # Пул проверяется раньше очереди ротации
+        find_unused.assert_not_called()
+        self.assertTrue(response.json()['problem']['from_database'])
+        self.assertEqual(Problem.objects.filter(source='ai_generated').count(), 1)
+        # Показ из пула учитывается в счетчике показов
+        get_problem_rotation().flush()
+        self.assertEqual(Problem.objects.get(source='ai_generated').times_used, times_used + 1)
+        
+        # Снятая с показа задача из пула не выдается
+        Problem.objects.filter(source='ai_generated').update(is_active=False)
+        self.client.force_login(self.user)
+        with mock.patch('problems.views_gemini.get_gemini_service', return_value=_FakeGemini()), \
+                mock.patch('problems.views_gemini._find_unused_problem', return_value=None):
+            response = self.client.get('/api/problems/generate-ai/', {'topic': 'Линейные уравнения'})
+        self.assertTrue(response.json()['problem']['generated_by_ai'])
+        self.assertEqual(Problem.objects.filter(source='ai_generated').count(), 2)
+    
+    def test_submit_checked_locally_before_gemini(self):
+        """Числовой ответ проверяется локально, текстовый - через Gemini"""
+        with mock.patch('problems.views_gemini.get_gemini_service', return_value=_FakeGemini()):
+            response = self.client.get('/api/problems/generate-ai/')
+        problem_id = response.json()['problem']['id']
+        
+        with mock.patch('problems.views_gemini.get_gemini_service') as service:
+            response = self.client.post('/api/problems/submit-ai/', {
+                'problem_id': problem_id,
+                'submitted_answer': 'x = 2',
+            })
+        service.assert_not_called()
+        self.assertTrue(response.json()['is_correct'])
+        
+        with mock.patch('problems.views_gemini.get_gemini_service', return_value=_FakeGemini(is_correct=False)):
+            self.client.post('/api/problems/submit-ai/', {
+                'problem_id': problem_id,
+                'submitted_answer': 'два',
+            })
+        
+        tiers = list(
+            UserAttempt.objects.filter(user=self.user)
+            .order_by('id')
+            .values_list('ai_analysis__check_tier', flat=True)
+        )
+        self.assertEqual(tiers, ['exact', 'gemini'])
+    
+    def test_repeated_answer_uses_verdict_cache(self):
+        """Повторный такой же ответ не отправляется в Gemini"""
+        with mock.patch('problems.views_gemini.get_gemini_service', return_value=_FakeGemini()):
+            response = self.client.get('/api/problems/generate-ai/')
+        problem_id = response.json()['problem']['id']
+        
+        fake = _FakeGemini(is_correct=False)
+        with mock.patch.object(fake, 'acheck_solution', wraps=fake.acheck_solution) as check, \
+                mock.patch('problems.views_gemini.get_gemini_service', return_value=fake):
+            for answer in ('Два', 'два'):
+                response = self.client.post('/api/problems/submit-ai/', {
+                    'problem_id': problem_id,
+                    'submitted_answer': answer,
+                })
+                self.assertFalse(response.json()['is_correct'])
+        
+        self.assertEqual(check.call_count, 1)
+        tiers = list(
+            UserAttempt.objects.filter(user=self.user)
+            .order_by('id')
+            .values_list('ai_analysis__check_tier', flat=True)
+        )
+        self.assertEqual(tiers, ['gemini', 'cache'])
+    
+    def _read_events(self, response):
+        """Разбирает ответ text/event-stream в список (событие, данные)"""
+        body = b''.join(response).decode('utf-8')
+        events = []
+        for block in body.strip().split('\n\n'):
+            lines = dict(line.split(': ', 1) for line in block.split('\n'))
+            events.append((lines['event'], json.loads(lines['data'])))
+        return events
+    
+    def test_stream_generation_events(self):
+        """Поля задачи приходят событиями, последним - validated с id"""
+        with mock.patch('problems.views_gemini.get_gemini_service', return_value=_FakeGemini()):
+            response = self.client.get('/api/problems/generate-ai/stream/')
+            self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+            events = self._read_events(response)
+        
+        self.assertEqual([event for event, _ in events], ['title', 'problem_text', 'latex_formula', 'validated'])
+        self.assertEqual(events[2][1]['value'], 'x + 1 = 3')
+        problem = events[-1][1]['problem']
+        self.assertIsNotNone(cache.get(problem['id']))
+        self.assertEqual(Problem.objects.filter(source='ai_generated').count(), 1)
+    
+    def test_stream_generation_timeout(self):
+        """По таймауту поток завершается событием error"""
+        with mock.patch('problems.views_gemini.get_gemini_service', return_value=_FakeGemini(delay=5)), \
+                mock.patch('problems.views_gemini.AI_REQUEST_TIMEOUT', 0.05):
+            events = self._read_events(self.client.get('/api/problems/generate-ai/stream/'))
+        self.assertEqual([event for event, _ in events], ['error'])
+    
+    def test_open_breaker_serves_widened_db_problem(self):
+        """Предохранитель разомкнут - задача из БД в расширенном диапазоне, без вызова Gemini"""
+        guard = get_llm_guard()
+        for _ in range(guard.breaker.threshold):
+            guard.record_failure(TimeoutError())
+        
+        with mock.patch('problems.views_gemini._choose_topic', return_value=('Алгебра: Уравнения', 'Алгебра', 1000)), \
+                mock.patch('problems.views_gemini.get_gemini_service') as service:
+            response = self.client.get('/api/problems/generate-ai/')
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('Retry-After', response)
+            
+            problem = Problem.objects.create(
+                title='Запасная', latex_formula='x = 1', description='Решите',
+                correct_answer='1', difficulty_score=1400, grade_level=11
+            )
+            get_problem_index().invalidate()
+            response = self.client.get('/api/problems/generate-ai/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['problem']['id'], f'problem_{self.user.id}_{problem.id}')
+        service.assert_not_called()
+    
+    def test_generation_timeout_returns_408(self):
+        """По таймауту генерация отменяется и возвращается 408"""
+        with mock.patch('problems.views_gemini.get_gemini_service', return_value=_FakeGemini(delay=5)), \
+                mock.patch('problems.views_gemini.AI_REQUEST_TIMEOUT', 0.05):
+            response = self.client.get('/api/problems/generate-ai/')
+        self.assertEqual(response.status_code, 408)
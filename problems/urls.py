@@ -4,7 +4,7 @@ from .views import (
     user_attempts, topics_list
 )
 from .views_gemini import (
-    generate_problem_ai, submit_answer_ai,
+    generate_problem_ai, generate_problem_ai_stream, submit_answer_ai,
     available_topics
 )
 from .views_book_import import (
@@ -21,6 +21,7 @@ urlpatterns = [
     
     # Новые endpoints с Gemini AI
     path('generate-ai/', generate_problem_ai, name='generate_problem_ai'),
+    path('generate-ai/stream/', generate_problem_ai_stream, name='generate_problem_ai_stream'),
     path('submit-ai/', submit_answer_ai, name='submit_answer_ai'),
     path('topics-ai/', available_topics, name='available_topics'),
     
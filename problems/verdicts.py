@@ -0,0 +1,77 @@
+"""
+Кеш вердиктов проверки ответов через ИИ
+Ключ - (хеш задачи, канонический ответ); общий кеш, при промахе - таблица AnswerVerdict
+"""
+
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from django.core.cache import cache
+
+from core.answer_checker import canonical_answer, problem_fingerprint
+from .models import AnswerVerdict
+
+logger = logging.getLogger(__name__)
+
+VERDICT_CACHE_TIMEOUT = 7 * 24 * 3600
+
+# Длиннее не храним: такие ответы практически не повторяются
+MAX_CANONICAL_LENGTH = 200
+
+
+def _verdict_key(problem_hash: str, answer: str) -> str:
+    answer_hash = hashlib.sha1(answer.encode('utf-8')).hexdigest()[:16]
+    return f"verdict_{problem_hash[:16]}_{answer_hash}"
+
+
+def get_cached_verdict(problem_data: Dict[str, Any], user_answer: str) -> Optional[Dict[str, Any]]:
+    """
+    Ищет готовый вердикт для такого же ответа на эту задачу
+
+    Args:
+        problem_data: Данные задачи
+        user_answer: Ответ пользователя
+
+    Returns:
+        Результат проверки или None
+    """
+    answer = canonical_answer(user_answer)
+    if not answer or len(answer) > MAX_CANONICAL_LENGTH:
+        return None
+
+    problem_hash = problem_fingerprint(problem_data)
+    key = _verdict_key(problem_hash, answer)
+    check_result = cache.get(key)
+
+    if check_result is None:
+        verdict = AnswerVerdict.objects.filter(
+            problem_hash=problem_hash, canonical_answer=answer
+        ).only('check_result').first()
+        if verdict is None:
+            return None
+        check_result = verdict.check_result
+        cache.set(key, check_result, timeout=VERDICT_CACHE_TIMEOUT)
+
+    logger.info(f"♻️ Вердикт из кеша | Ответ: {answer} | Правильно: {check_result['is_correct']}")
+    return dict(check_result)
+
+
+def store_verdict(problem_data: Dict[str, Any], user_answer: str, check_result: Dict[str, Any]):
+    """Сохраняет вердикт ИИ в кеш и в БД"""
+    answer = canonical_answer(user_answer)
+    if not answer or len(answer) > MAX_CANONICAL_LENGTH:
+        return
+
+    problem_hash = problem_fingerprint(problem_data)
+    # Если параллельный запрос уже сохранил вердикт - вставка пропускается
+    AnswerVerdict.objects.bulk_create([
+        AnswerVerdict(
+            problem_hash=problem_hash,
+            canonical_answer=answer,
+            is_correct=bool(check_result['is_correct']),
+            check_result=check_result
+        )
+    ], ignore_conflicts=True)
+
+    cache.set(_verdict_key(problem_hash, answer), check_result, timeout=VERDICT_CACHE_TIMEOUT)
@@ -3,9 +3,11 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
-import random
-from .models import Problem, UserAttempt, Topic
+from core.answer_checker import canonical_answer
+from .models import Problem, UserAttempt, Topic, problem_canonical_answer
+from .next_queue import get_difficulty_window, pop_next_problem, refresh_next_problems
+from .problem_index import get_problem_index
+from .solved_cache import get_solved_problem_ids, record_attempt
 from .serializers import (
     ProblemSerializer, ProblemDetailSerializer,
     SubmitAnswerSerializer, UserAttemptSerializer
@@ -36,59 +38,48 @@ def generate_problem(request):
     user_index = profile.al_khwarizmi_index
     
     # Диапазон сложности: [Index - 100, Index + 50]
-    min_difficulty = max(0, user_index - 100)
-    max_difficulty = min(3000, user_index + 50)
+    min_difficulty, max_difficulty = get_difficulty_window(user_index)
     
     # Фильтр по теме (опционально)
     topic_id = request.query_params.get('topic_id')
+    if topic_id:
+        try:
+            topic_id = int(topic_id)
+        except ValueError:
+            return Response({
+                'error': 'Некорректный topic_id'
+            }, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        topic_id = None
     
     # Получаем ID задач, которые пользователь уже ПРАВИЛЬНО решил
     # Не показываем повторно только правильно решенные задачи
-    solved_problem_ids = UserAttempt.objects.filter(
-        user=user,
-        is_correct=True  # Только правильно решенные
-    ).values_list('problem_id', flat=True).distinct()
-    
-    # Базовый запрос - исключаем уже решенные задачи
-    problems_query = Problem.objects.filter(
-        is_active=True,
-        difficulty_score__gte=min_difficulty,
-        difficulty_score__lte=max_difficulty
-    ).exclude(id__in=solved_problem_ids)
+    solved_problem_ids = get_solved_problem_ids(user.id, correct_only=True)
+    
+    # Без фильтра по теме берем задачу из заранее подготовленной очереди
+    problem = None
+    if topic_id is None:
+        problem = pop_next_problem(user.id, user_index)
+    
+    # Выбираем случайную задачу через индекс в памяти: в БД идет только
+    # один запрос по первичному ключу за выбранной задачей
+    index = get_problem_index()
+    problem = problem or (
+        # Новые задачи в диапазоне сложности
+        index.select(min_difficulty, max_difficulty, topic_id=topic_id, exclude=solved_problem_ids)
+        # Если нет новых задач, показываем все подходящие (включая решенные)
+        or index.select(min_difficulty, max_difficulty, topic_id=topic_id)
+        # Если все еще нет задач, расширяем диапазон
+        or index.select(exclude=solved_problem_ids)
+        # Если и это не помогло, показываем любые задачи
+        or index.select()
+    )
     
-    if topic_id:
-        problems_query = problems_query.filter(topic_id=topic_id)
-    
-    # Получаем список задач
-    problems = list(problems_query)
-    
-    # Если нет новых задач, показываем все подходящие (включая решенные)
-    if not problems:
-        problems_query = Problem.objects.filter(
-            is_active=True,
-            difficulty_score__gte=min_difficulty,
-            difficulty_score__lte=max_difficulty
-        )
-        if topic_id:
-            problems_query = problems_query.filter(topic_id=topic_id)
-        problems = list(problems_query)
-    
-    # Если все еще нет задач, расширяем диапазон
-    if not problems:
-        problems = list(Problem.objects.filter(is_active=True).exclude(id__in=solved_problem_ids))
-    
-    # Если и это не помогло, показываем любые задачи
-    if not problems:
-        problems = list(Problem.objects.filter(is_active=True))
-    
-    if not problems:
+    if not problem:
         return Response({
             'error': 'Нет доступных задач'
         }, status=status.HTTP_404_NOT_FOUND)
     
-    # Выбираем случайную задачу
-    problem = random.choice(problems)
-    
     # Возвращаем задачу без правильного ответа и решения
     serializer = ProblemSerializer(problem)
     
@@ -137,7 +128,12 @@ def submit_answer(request):
         # Нормализуем ответы для сравнения
         correct_normalized = problem.correct_answer.strip().lower().replace(' ', '')
         submitted_normalized = submitted_answer.lower().replace(' ', '')
+        # Затем сравниваем канонические формы ("0.5" и "1/2", "x = 2" и "2"):
+        # ответ задачи канонизирован при сохранении, разбирается только ответ пользователя
         is_correct = correct_normalized == submitted_normalized
+        if not is_correct:
+            expected = problem.canonical_answer or problem_canonical_answer(problem.correct_answer)
+            is_correct = bool(expected) and canonical_answer(submitted_answer) == expected
     
     # Если есть фото, симулируем анализ ИИ
     ai_analysis = None
@@ -173,12 +169,17 @@ def submit_answer(request):
         ai_analysis=ai_analysis
     )
     
+    record_attempt(user.id, problem.id, is_correct)
+    
     # Обновляем индекс пользователя
     index_change = user.profile.update_index(
         problem.difficulty_score,
         is_correct
     )
     
+    # Готовим следующие задачи для нового диапазона сложности
+    refresh_next_problems(user.id, user.profile.al_khwarizmi_index)
+    
     # Формируем ответ
     response_data = {
         'is_correct': is_correct,
@@ -1,27 +1,44 @@
 """
 Views для работы с задачами через Gemini API
 Генерация задач и проверка решений с помощью ИИ
+
+generate_problem_ai и submit_answer_ai - асинхронные: запрос к Gemini
+не занимает поток воркера (при запуске через al_khwarizmi/asgi.py),
+а работа с БД выполняется через sync_to_async.
 """
 
+import asyncio
+import hashlib
+import json
 import logging
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+import math
+from asgiref.sync import sync_to_async
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.core.cache import cache
-import random
+from django.http import JsonResponse, StreamingHttpResponse
 from .models import UserAttempt, Topic, Problem
+from .inventory import create_problem_from_ai
+from .next_queue import refresh_next_problems
+from .rotation import get_problem_rotation
+from .solved_cache import get_solved_problem_ids, record_attempt
+from .verdicts import get_cached_verdict, store_verdict
+from core.answer_checker import TIER_CACHE, TIER_GEMINI, check_answer_locally
 from core.gemini_service import get_gemini_service
+from core.generation_cache import GENERATION_POOL_SIZE, get_generation_cache
+from core.llm_guard import LLMUnavailableError, get_llm_guard
 from core.math_topics_database import get_random_topic_for_grade, get_topic_by_difficulty
-from django.db.models import Q
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-# Thread pool для параллельной генерации задач
-# max_workers=5 означает максимум 5 одновременных генераций
-executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix="GeminiGen")
+# Максимальное время ожидания ответа Gemini в запросе (сек)
+AI_REQUEST_TIMEOUT = 30
+
+# Отклонение сложности задачи из БД, когда ИИ недоступен
+FALLBACK_SPREAD = 500
 
 
 def _get_difficulty_level(score):
@@ -60,7 +77,7 @@ def _get_estimated_time(score):
         return "20+ минут"
 
 
-def _find_unused_problem(user, difficulty, grade_level=None):
+def _find_unused_problem(user, difficulty, grade_level=None, spread=150):
     """
     Ищет неиспользованную задачу из БД для пользователя
     
@@ -68,84 +85,145 @@ def _find_unused_problem(user, difficulty, grade_level=None):
         user: Пользователь
         difficulty: Целевая сложность
         grade_level: Класс пользователя (опционально)
+        spread: Допустимое отклонение сложности
     
     Returns:
         Problem или None если подходящих задач нет
     """
-    # Получаем ID задач, которые пользователь уже решал
-    solved_problem_ids = UserAttempt.objects.filter(
-        user=user,
-        problem__isnull=False
-    ).values_list('problem_id', flat=True).distinct()
-    
-    # Диапазон сложности ±150 от целевой
-    min_diff = max(0, difficulty - 150)
-    max_diff = min(3000, difficulty + 150)
-    
-    # Базовый запрос - активные задачи в диапазоне сложности, которые пользователь не решал
-    query = Problem.objects.filter(
-        is_active=True,
-        difficulty_score__gte=min_diff,
-        difficulty_score__lte=max_diff
-    ).exclude(
-        id__in=solved_problem_ids
-    )
+    # Получаем ID задач, которые пользователь уже решал (из кеша)
+    solved_problem_ids = get_solved_problem_ids(user.id, correct_only=False)
     
-    # Если указан класс, фильтруем по нему
-    if grade_level:
-        query = query.filter(
-            Q(grade_level=grade_level) | Q(grade_level__isnull=True)
-        )
-    
-    # Сортируем: сначала менее использованные, потом ближе к целевой сложности
-    query = query.order_by('times_used', '?')  # ? для случайности среди одинаково использованных
+    # Очередь ротации: сначала менее использованные задачи в диапазоне ±spread,
+    # счетчик использования увеличивается там же и пишется в БД пакетами
+    problem_id = get_problem_rotation().pop(
+        difficulty, grade_level, spread=spread, exclude=solved_problem_ids
+    )
+    if problem_id is None:
+        return None
     
-    # Получаем первую подходящую задачу
-    problem = query.first()
+    problem = Problem.objects.filter(pk=problem_id, is_active=True).first()
     
     if problem:
-        # Увеличиваем счетчик использования
-        problem.times_used += 1
-        problem.save(update_fields=['times_used'])
-        logger.info(f"📚 Найдена задача из БД: {problem.title} | Использована: {problem.times_used} раз")
+        logger.info(f"📚 Найдена задача из БД: {problem.title} | Использована: {problem.times_used + 1} раз")
     
     return problem
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def generate_problem_ai(request):
+def _find_pooled_problem(user, topic_name, difficulty, grade_level=None):
     """
-    Генерация новой задачи через Gemini API
-    GET /api/problems/generate-ai/
-    
-    Параметры:
-    - topic (optional): Название темы
+    Ищет в пуле генераций задачу той же темы, сложности и класса,
+    которую пользователь не решал и которая не снята с показа
+
+    Returns:
+        Problem или None
     """
-    user = request.user
-    # Получаем профиль пользователя
-    profile = user.profile
-    
-    # Проверяем заполненность профиля
-    if not profile.is_profile_complete:
-        return Response({
-            'error': 'Профиль не заполнен',
-            'message': 'Пожалуйста, заполните профиль перед решением задач',
-            'profile_incomplete': True
-        }, status=status.HTTP_403_FORBIDDEN)
+    pool = get_generation_cache()
+    exclude = get_solved_problem_ids(user.id, correct_only=False)
+    # Пул небольшой: снятые с показа задачи пропускаем, пока он не кончится
+    for _ in range(GENERATION_POOL_SIZE):
+        pooled_data = pool.get(topic_name, difficulty, grade_level, exclude=exclude)
+        if pooled_data is None:
+            return None
+        problem = Problem.objects.filter(pk=pooled_data['problem_id'], is_active=True).first()
+        if problem is not None:
+            # Показ из пула учитывается так же, как показ из очереди ротации
+            get_problem_rotation().record(problem.id)
+            return problem
+        exclude = set(exclude) | {pooled_data['problem_id']}
+    return None
+
+
+def _use_db_problem(user, context, db_problem):
+    """Подставляет задачу из БД в контекст генерации и кладет её в кеш для проверки"""
+    # Формируем данные задачи из БД
+    problem_data = {
+        'title': db_problem.title,
+        'problem_text': db_problem.description,
+        'description': db_problem.description,
+        'equation_to_solve': db_problem.latex_formula,
+        'correct_answer': db_problem.correct_answer,
+        'solution_steps': db_problem.solution_steps,
+        'hints': db_problem.hints,
+        'difficulty_score': db_problem.difficulty_score,
+        'from_database': True,
+        'problem_id': db_problem.id
+    }
     
-    user_index = profile.al_khwarizmi_index
+    # Сохраняем в кеше
+    cache_key = f"problem_{user.id}_{db_problem.id}"
+    cache.set(cache_key, problem_data, timeout=3600)
     
-    # Используем рекомендуемую сложность на основе класса/возраста
-    recommended_diff = profile.recommended_difficulty
+    context['problem_data'] = problem_data
+    context['cache_key'] = cache_key
+
+
+def _use_fallback_problem(user, context):
+    """
+    ИИ недоступен: задача из БД в расширенном диапазоне сложности и без учета класса
     
-    # Определяем диапазон сложности задач
-    min_difficulty = max(0, recommended_diff - 150)
-    max_difficulty = min(3000, recommended_diff + 150)
-    target_difficulty = recommended_diff
+    Returns:
+        True, если задача найдена и подставлена в контекст
+    """
+    db_problem = _find_unused_problem(user, context['target_difficulty'], spread=FALLBACK_SPREAD)
+    if db_problem is None:
+        return False
+    logger.info(f"🛟 ИИ недоступен, используем задачу из БД: {db_problem.title}")
+    _use_db_problem(user, context, db_problem)
+    return True
+
+
+def _llm_unavailable_response(retry_after):
+    """503 с Retry-After, когда ИИ недоступен и замены из БД нет"""
+    response = _json_response({
+        'error': 'Сервис ИИ временно перегружен. Попробуйте через минуту.',
+        'retry_after': round(retry_after, 1)
+    }, status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _unauthorized_response():
+    """Ответ для неаутентифицированного запроса (как у IsAuthenticated в DRF)"""
+    return JsonResponse({
+        'detail': 'Учетные данные не были предоставлены.'
+    }, status=status.HTTP_403_FORBIDDEN)
+
+
+def _json_response(data, status_code=status.HTTP_200_OK):
+    return JsonResponse(data, status=status_code, json_dumps_params={'ensure_ascii': False})
+
+
+def _method_not_allowed(request):
+    # require_GET/require_POST в Django 4.2 не поддерживают async views
+    return _json_response({
+        'detail': f'Метод "{request.method}" не разрешен.'
+    }, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+def _get_authenticated_user(request):
+    """Пользователь сессии или None (выполняется в sync-контексте - обращается к БД)"""
+    user = request.user
+    return user if user.is_authenticated else None
+
+
+def _get_request_data(request):
+    """Тело запроса: JSON или multipart/form-data"""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            return {}
+    return request.POST
+
+
+def _choose_topic(profile, topic_param, target_difficulty):
+    """
+    Выбирает тему задачи из каталога тем
     
-    # Получаем тему из базы данных 1010+ тем
-    topic_param = request.query_params.get('topic')
+    Returns:
+        (название темы, категория, целевая сложность)
+    """
+    topic_category = ''
     
     if topic_param:
         topic_name = topic_param
@@ -156,6 +234,7 @@ def generate_problem_ai(request):
             topic_obj = get_random_topic_for_grade(profile.grade)
             if topic_obj:
                 topic_name = f"{topic_obj['category']}: {topic_obj['topic']}"
+                topic_category = topic_obj['category']
                 # Корректируем сложность на основе темы
                 target_difficulty = (topic_obj['difficulty_min'] + topic_obj['difficulty_max']) // 2
                 logger.info(f"📚 Выбрана тема из базы: {topic_name} | Сложность: {target_difficulty}")
@@ -167,152 +246,438 @@ def generate_problem_ai(request):
             topic_obj = get_topic_by_difficulty(target_difficulty)
             if topic_obj:
                 topic_name = f"{topic_obj['category']}: {topic_obj['topic']}"
+                topic_category = topic_obj['category']
                 logger.info(f"📚 Выбрана тема по сложности: {topic_name}")
             else:
                 topic_name = "Математика: Общие задачи"
     
+    return topic_name, topic_category, target_difficulty
+
+
+def _prepare_generation(user, topic_param):
+    """
+    Синхронная часть генерации: профиль, выбор темы и поиск задачи в БД
+    
+    Returns:
+        Dict с контекстом генерации; при ошибке - с ключом 'error_response'
+    """
+    # Получаем профиль пользователя
+    profile = user.profile
+    
+    # Проверяем заполненность профиля
+    if not profile.is_profile_complete:
+        return {'error_response': _json_response({
+            'error': 'Профиль не заполнен',
+            'message': 'Пожалуйста, заполните профиль перед решением задач',
+            'profile_incomplete': True
+        }, status.HTTP_403_FORBIDDEN)}
+    
+    # Используем рекомендуемую сложность на основе класса/возраста
+    recommended_diff = profile.recommended_difficulty
+    
+    topic_name, topic_category, target_difficulty = _choose_topic(
+        profile, topic_param, recommended_diff
+    )
+    
+    context = {
+        'profile': profile,
+        'user_index': profile.al_khwarizmi_index,
+        # Определяем диапазон сложности задач
+        'min_difficulty': max(0, recommended_diff - 150),
+        'max_difficulty': min(3000, recommended_diff + 150),
+        'target_difficulty': target_difficulty,
+        'topic_name': topic_name,
+        'topic_category': topic_category,
+        'problem_data': None,
+    }
+    
     # Логируем запрос
     logger.info(f"📝 Запрос генерации задачи | Пользователь: {user.username} (ID: {user.id}) | Тема: {topic_name} | Сложность: {target_difficulty}")
     
-    # ШАГ 1: Пытаемся найти задачу в БД
+    # ШАГ 1: Задача, недавно сгенерированная для такой же темы, сложности и класса
+    pooled_problem = _find_pooled_problem(user, topic_name, target_difficulty, profile.grade)
+    
+    if pooled_problem:
+        logger.info(f"♻️ Используем задачу из пула генераций: {pooled_problem.title}")
+        _use_db_problem(user, context, pooled_problem)
+        return context
+    
+    # ШАГ 2: Пытаемся найти задачу в БД
     db_problem = _find_unused_problem(user, target_difficulty, profile.grade)
     
     if db_problem:
         # Задача найдена в БД - используем её
         logger.info(f"✅ Используем задачу из БД: {db_problem.title}")
+        _use_db_problem(user, context, db_problem)
+        return context
+    
+    # ШАГ 3: Предохранитель разомкнут - не ждем таймаута Gemini,
+    # а сразу берем задачу из БД в расширенном диапазоне
+    guard = get_llm_guard()
+    if guard.is_open() and not _use_fallback_problem(user, context):
+        context['error_response'] = _llm_unavailable_response(guard.breaker.retry_after())
+    
+    return context
+
+
+def _store_generated_problem(user, context, problem_data):
+    """
+    Сохраняет сгенерированную задачу в БД для повторного использования и в кеш
+    
+    Returns:
+        cache_key задачи
+    """
+    try:
+        saved_problem = create_problem_from_ai(
+            problem_data,
+            grade_level=context['profile'].grade,
+            category=context['topic_category'],
+            times_used=1
+        )
+        problem_data['problem_id'] = saved_problem.id
+        problem_data['from_database'] = False
+        logger.info(f"💾 Задача сохранена в БД: ID={saved_problem.id}")
         
-        # Формируем данные задачи из БД
-        problem_data = {
-            'title': db_problem.title,
-            'problem_text': db_problem.description,
-            'description': db_problem.description,
-            'equation_to_solve': db_problem.latex_formula,
-            'correct_answer': db_problem.correct_answer,
-            'solution_steps': db_problem.solution_steps,
-            'hints': db_problem.hints,
-            'difficulty_score': db_problem.difficulty_score,
-            'from_database': True,
-            'problem_id': db_problem.id
+        # Пул генераций: следующий такой же запрос обойдется без Gemini
+        get_generation_cache().put(
+            context['topic_name'], context['target_difficulty'],
+            context['profile'].grade, problem_data
+        )
+    except Exception as e:
+        logger.error(f"❌ Ошибка сохранения задачи в БД: {e}")
+        problem_data['from_database'] = False
+    
+    # Сохраняем задачу в кеше для последующей проверки
+    title_hash = hashlib.md5(problem_data.get('title', 'temp').encode()).hexdigest()[:8]
+    cache_key = f"problem_{user.id}_{title_hash}"
+    cache.set(cache_key, problem_data, timeout=3600)
+    return cache_key
+
+
+def _build_problem_response(context, cache_key, problem_data):
+    """Задача для клиента БЕЗ правильного ответа и БЕЗ формулы решения"""
+    problem_text = problem_data.get('problem_text') or problem_data.get('description') or problem_data.get('title', 'Задача генерируется...')
+    
+    # Получаем уравнение, если есть
+    equation = problem_data.get('equation_to_solve', '') or ''
+    
+    problem_response = {
+        'id': cache_key,
+        'topic_name': context['topic_name'],
+        'title': problem_data['title'],
+        'description': problem_text,
+        'difficulty_score': problem_data['difficulty_score'],
+        'hints': problem_data.get('hints', []),
+        'generated_by_ai': not problem_data.get('from_database', False),
+        'from_database': problem_data.get('from_database', False)
+    }
+    
+    # Добавляем latex_formula только если есть уравнение
+    if equation and equation.strip():
+        problem_response['latex_formula'] = equation
+    
+    return {
+        'problem': problem_response,
+        'user_index': context['user_index'],
+        'difficulty_range': {
+            'min': context['min_difficulty'],
+            'max': context['max_difficulty']
         }
-        
-        # Сохраняем в кеше
-        import hashlib
-        cache_key = f"problem_{user.id}_{db_problem.id}"
-        cache.set(cache_key, problem_data, timeout=3600)
-        
-    else:
-        # ШАГ 2: Задач в БД нет - генерируем через AI
+    }
+
+
+async def generate_problem_ai(request):
+    """
+    Генерация новой задачи через Gemini API
+    GET /api/problems/generate-ai/
+    
+    Параметры:
+    - topic (optional): Название темы
+    """
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    
+    user = await sync_to_async(_get_authenticated_user)(request)
+    if user is None:
+        return _unauthorized_response()
+    
+    context = await sync_to_async(_prepare_generation)(user, request.GET.get('topic'))
+    if 'error_response' in context:
+        return context['error_response']
+    
+    problem_data = context['problem_data']
+    cache_key = context.get('cache_key')
+    
+    if problem_data is None:
+        # ШАГ 4: Задач в БД и в пуле генераций нет - генерируем через AI
         logger.info(f"🤖 Задач в БД не найдено, генерируем через AI")
+        profile = context['profile']
         
         try:
             # Получаем сервис Gemini
             gemini = get_gemini_service()
             
-            # Функция для генерации в отдельном потоке
-            def generate_task():
-                return gemini.generate_problem(
-                    topic=topic_name,
-                    difficulty=target_difficulty,
-                    user_level=user_index,
-                    user_grade=profile.grade,
-                    user_age=profile.age
-                )
-            
-            # Запускаем генерацию в thread pool с таймаутом 30 секунд
-            logger.info(f"🔄 Отправка задачи в thread pool | Активных потоков: {executor._threads.__len__() if hasattr(executor, '_threads') else 'N/A'}")
-            future = executor.submit(generate_task)
-            
             try:
-                # Ждем результат максимум 30 секунд
-                problem_data = future.result(timeout=30)
-                logger.info(f"✅ Задача получена из thread pool | Пользователь: {user.username}")
-                
-                # Сохраняем сгенерированную задачу в БД для повторного использования
-                try:
-                    saved_problem = Problem.objects.create(
-                        topic=None,  # Можно добавить связь с темой позже
-                        title=problem_data['title'],
-                        latex_formula=problem_data.get('equation_to_solve', ''),
-                        description=problem_data.get('problem_text', problem_data.get('description', '')),
-                        correct_answer=problem_data['correct_answer'],
-                        difficulty_score=problem_data['difficulty_score'],
-                        solution_steps=problem_data.get('solution_steps', []),
-                        hints=problem_data.get('hints', []),
-                        grade_level=profile.grade,
-                        source='ai_generated',
-                        times_used=1,
-                        is_active=True
-                    )
-                    problem_data['problem_id'] = saved_problem.id
-                    problem_data['from_database'] = False
-                    logger.info(f"💾 Задача сохранена в БД: ID={saved_problem.id}")
-                except Exception as e:
-                    logger.error(f"❌ Ошибка сохранения задачи в БД: {e}")
-                    problem_data['from_database'] = False
-                
-            except FuturesTimeoutError:
-                logger.error(f"⏰ Таймаут генерации задачи (30 сек) | Пользователь: {user.username}")
-                return Response({
+                # Ждем результат максимум AI_REQUEST_TIMEOUT секунд;
+                # по таймауту запрос к Gemini отменяется, а не висит в пуле потоков
+                problem_data = await asyncio.wait_for(
+                    gemini.agenerate_problem(
+                        topic=context['topic_name'],
+                        difficulty=context['target_difficulty'],
+                        user_level=context['user_index'],
+                        user_grade=profile.grade,
+                        user_age=profile.age
+                    ),
+                    timeout=AI_REQUEST_TIMEOUT
+                )
+                logger.info(f"✅ Задача получена от Gemini | Пользователь: {user.username}")
+            except asyncio.TimeoutError:
+                logger.error(f"⏰ Таймаут генерации задачи ({AI_REQUEST_TIMEOUT} сек) | Пользователь: {user.username}")
+                return _json_response({
                     'error': 'Генерация задачи заняла слишком много времени. Попробуйте еще раз.'
-                }, status=status.HTTP_408_REQUEST_TIMEOUT)
+                }, status.HTTP_408_REQUEST_TIMEOUT)
             
-            # Сохраняем задачу в кеше для последующей проверки
-            import hashlib
-            title_hash = hashlib.md5(problem_data.get('title', 'temp').encode()).hexdigest()[:8]
-            cache_key = f"problem_{user.id}_{title_hash}"
-            cache.set(cache_key, problem_data, timeout=3600)
+            cache_key = await sync_to_async(_store_generated_problem)(user, context, problem_data)
             
+        except LLMUnavailableError as e:
+            # Лимит запросов или предохранитель - замена из БД вместо ошибки
+            logger.warning(f"🔌 Gemini недоступен: {e} | Пользователь: {user.username}")
+            if not await sync_to_async(_use_fallback_problem)(user, context):
+                return _llm_unavailable_response(e.retry_after)
+            problem_data = context['problem_data']
+            cache_key = context['cache_key']
         except ValueError as e:
             logger.error(f"❌ ValueError при генерации | Пользователь: {user.username} | Ошибка: {str(e)}")
-            return Response({
+            return _json_response({
                 'error': f'Ошибка генерации задачи: {str(e)}',
                 'detail': 'Проверьте настройки GEMINI_API_KEY'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            }, status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
             logger.error(f"❌ Неожиданная ошибка при генерации | Пользователь: {user.username} | Ошибка: {str(e)}")
-            return Response({
+            return _json_response({
                 'error': 'Произошла ошибка при генерации задачи',
                 'detail': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            }, status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    # Возвращаем задачу БЕЗ правильного ответа и БЕЗ формулы решения
-    problem_text = problem_data.get('problem_text') or problem_data.get('description') or problem_data.get('title', 'Задача генерируется...')
+    return _json_response(_build_problem_response(context, cache_key, problem_data))
+
+
+# Поля задачи -> события SSE потоковой генерации
+_STREAM_EVENTS = {
+    'title': 'title',
+    'problem_text': 'problem_text',
+    'equation_to_solve': 'latex_formula',
+}
+
+
+def _sse_event(event, data):
+    """Событие в формате text/event-stream"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+
+
+async def _stream_generation(user, context):
+    """
+    События SSE: поля задачи по мере генерации, затем 'validated' с id задачи.
+    При ошибке - событие 'error'.
+    """
+    problem_data = context['problem_data']
+    cache_key = context.get('cache_key')
+    
+    if problem_data is not None:
+        # Задача из БД или пула генераций - отдаем поля сразу
+        for field, event in _STREAM_EVENTS.items():
+            if problem_data.get(field):
+                yield _sse_event(event, {'value': problem_data[field]})
+    else:
+        profile = context['profile']
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + AI_REQUEST_TIMEOUT
+        generation_args = dict(
+            topic=context['topic_name'],
+            difficulty=context['target_difficulty'],
+            user_level=context['user_index'],
+            user_grade=profile.grade,
+            user_age=profile.age
+        )
+        
+        try:
+            gemini = get_gemini_service()
+            stream = gemini.astream_problem(**generation_args)
+            try:
+                while True:
+                    try:
+                        kind, payload = await asyncio.wait_for(stream.__anext__(), deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    if kind == 'field':
+                        field, value = payload
+                        yield _sse_event(_STREAM_EVENTS[field], {'value': value})
+                    else:
+                        problem_data = payload
+            finally:
+                await stream.aclose()
+            
+            if problem_data is None:
+                # Потоковый ответ не прошел проверку - генерируем заново с повторными попытками
+                logger.warning(f"⚠️ Потоковая задача отклонена, повторная генерация | Пользователь: {user.username}")
+                yield _sse_event('retry', {'message': 'Задача не прошла проверку, генерируем новую'})
+                problem_data = await asyncio.wait_for(
+                    gemini.agenerate_problem(**generation_args),
+                    timeout=max(0.0, deadline - loop.time())
+                )
+            
+            cache_key = await sync_to_async(_store_generated_problem)(user, context, problem_data)
+            
+        except LLMUnavailableError as e:
+            logger.warning(f"🔌 Gemini недоступен: {e} | Пользователь: {user.username}")
+            if not await sync_to_async(_use_fallback_problem)(user, context):
+                yield _sse_event('error', {
+                    'error': 'Сервис ИИ временно перегружен. Попробуйте через минуту.',
+                    'retry_after': round(e.retry_after, 1)
+                })
+                return
+            problem_data = context['problem_data']
+            cache_key = context['cache_key']
+            for field, event in _STREAM_EVENTS.items():
+                if problem_data.get(field):
+                    yield _sse_event(event, {'value': problem_data[field]})
+        except asyncio.TimeoutError:
+            logger.error(f"⏰ Таймаут потоковой генерации ({AI_REQUEST_TIMEOUT} сек) | Пользователь: {user.username}")
+            yield _sse_event('error', {
+                'error': 'Генерация задачи заняла слишком много времени. Попробуйте еще раз.'
+            })
+            return
+        except Exception as e:
+            logger.error(f"❌ Ошибка потоковой генерации | Пользователь: {user.username} | Ошибка: {str(e)}")
+            yield _sse_event('error', {
+                'error': 'Произошла ошибка при генерации задачи',
+                'detail': str(e)
+            })
+            return
     
-    # Получаем уравнение, если есть
-    equation = problem_data.get('equation_to_solve', '') or ''
+    yield _sse_event('validated', _build_problem_response(context, cache_key, problem_data))
+
+
+async def generate_problem_ai_stream(request):
+    """
+    Потоковая генерация задачи (Server-Sent Events)
+    GET /api/problems/generate-ai/stream/
     
-    problem_response = {
-        'id': cache_key,
-        'topic_name': topic_name,
-        'title': problem_data['title'],
-        'description': problem_text,
-        'difficulty_score': problem_data['difficulty_score'],
-        'hints': problem_data.get('hints', []),
-        'generated_by_ai': not problem_data.get('from_database', False),
-        'from_database': problem_data.get('from_database', False)
-    }
+    Параметры:
+    - topic (optional): Название темы
     
-    # Добавляем latex_formula только если есть уравнение
-    if equation and equation.strip():
-        problem_response['latex_formula'] = equation
+    События: title, problem_text, latex_formula - по мере генерации;
+    retry - если задача не прошла проверку и генерируется заново;
+    validated - задача проверена и сохранена (данные как у generate-ai, с id);
+    error - ошибка генерации
+    """
+    if request.method != 'GET':
+        return _method_not_allowed(request)
     
-    response_data = {
-        'problem': problem_response,
-        'user_index': user_index,
-        'difficulty_range': {
-            'min': min_difficulty,
-            'max': max_difficulty
+    user = await sync_to_async(_get_authenticated_user)(request)
+    if user is None:
+        return _unauthorized_response()
+    
+    context = await sync_to_async(_prepare_generation)(user, request.GET.get('topic'))
+    if 'error_response' in context:
+        return context['error_response']
+    
+    response = StreamingHttpResponse(
+        _stream_generation(user, context),
+        content_type='text/event-stream; charset=utf-8'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Отключаем буферизацию в nginx, иначе события придут одним куском
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _record_ai_attempt(user, problem_data, submitted_answer, solution_photo, check_result):
+    """
+    Синхронная часть проверки: попытка, индекс пользователя и арена
+    
+    Returns:
+        Dict с ответом для клиента
+    """
+    is_correct = check_result['is_correct']
+    confidence = check_result.get('confidence', 0.9)
+    
+    # Определяем очки
+    if solution_photo:
+        points_awarded = 250 if is_correct else 50
+    else:
+        points_awarded = 150 if is_correct else 0
+    
+    # Создаем запись о попытке (задача из БД или сохраненная после генерации)
+    attempt = UserAttempt.objects.create(
+        user=user,
+        problem_id=problem_data.get('problem_id'),
+        submitted_answer=submitted_answer or 'Фото решения',
+        is_correct=is_correct,
+        points_awarded=points_awarded,
+        solution_photo=solution_photo,
+        ai_analysis={
+            'gemini_check': check_result,
+            # Кто принял решение: exact / sympy / gemini
+            'check_tier': check_result.get('tier', TIER_GEMINI),
+            'problem_data': {
+                'title': problem_data['title'],
+                'difficulty': problem_data['difficulty_score']
+            }
         }
-    }
+    )
     
-    return Response(response_data, status=status.HTTP_200_OK)
+    record_attempt(user.id, problem_data.get('problem_id'), is_correct)
+    
+    # Обновляем индекс пользователя
+    index_change = user.profile.update_index(
+        problem_data['difficulty_score'],
+        is_correct
+    )
+    
+    # Готовим следующие задачи для нового диапазона сложности
+    refresh_next_problems(user.id, user.profile.al_khwarizmi_index)
+    
+    # Обновляем weekly_score в арене
+    from arena.models import ArenaRank
+    arena_rank, created = ArenaRank.objects.get_or_create(
+        user=user,
+        defaults={
+            'current_index': user.profile.al_khwarizmi_index,
+            'current_division': ArenaRank.get_division_from_index(
+                user.profile.al_khwarizmi_index
+            )
+        }
+    )
+    if is_correct:
+        arena_rank.weekly_score += points_awarded
+        arena_rank.current_index = user.profile.al_khwarizmi_index
+        arena_rank.current_division = ArenaRank.get_division_from_index(
+            user.profile.al_khwarizmi_index
+        )
+        arena_rank.save()
+        arena_rank.update_rank()  # Обновляем место в рейтинге
+    
+    logger.info(f"💾 Сохранение результата | Пользователь: {user.username} | Очки: {points_awarded} | Изменение индекса: {index_change}")
+    
+    # Формируем ответ
+    return {
+        'is_correct': is_correct,
+        'points_awarded': points_awarded,
+        'index_change': index_change,
+        'new_index': user.profile.al_khwarizmi_index,
+        'correct_answer': problem_data['correct_answer'],
+        'solution_steps': problem_data.get('solution_steps', []),
+        'ai_feedback': check_result.get('feedback', ''),
+        'confidence': confidence,
+        'attempt_id': attempt.id
+    }
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def submit_answer_ai(request):
+async def submit_answer_ai(request):
     """
-    Отправка ответа на задачу с проверкой через Gemini API
+    Отправка ответа на задачу с проверкой: локально (точное совпадение, SymPy),
+    затем по кешу вердиктов, и только для новых ответов - через Gemini API
     POST /api/problems/submit-ai/
     
     Body:
@@ -320,134 +685,105 @@ def submit_answer_ai(request):
     - submitted_answer: Ответ пользователя
     - solution_photo: Фото решения (опционально)
     """
-    user = request.user
+    if request.method != 'POST':
+        return _method_not_allowed(request)
+    
+    user = await sync_to_async(_get_authenticated_user)(request)
+    if user is None:
+        return _unauthorized_response()
     
     # Логируем начало проверки
     logger.info(f"📤 Запрос проверки ответа | Пользователь: {user.username} (ID: {user.id})")
-    logger.debug(f"Request data: {request.data}")
-    logger.debug(f"Request FILES: {request.FILES}")
     
-    problem_id = request.data.get('problem_id')
-    submitted_answer = request.data.get('submitted_answer', '').strip()
+    data = _get_request_data(request)
+    problem_id = data.get('problem_id')
+    submitted_answer = (data.get('submitted_answer') or '').strip()
     solution_photo = request.FILES.get('solution_photo')
     
     logger.info(f"📋 Данные запроса | problem_id: {problem_id} | answer: '{submitted_answer}' | has_photo: {bool(solution_photo)}")
     
     if not problem_id:
         logger.warning(f"⚠️  Отсутствует problem_id | Пользователь: {user.username}")
-        return Response({
+        return _json_response({
             'error': 'Требуется problem_id'
-        }, status=status.HTTP_400_BAD_REQUEST)
+        }, status.HTTP_400_BAD_REQUEST)
     
     if not submitted_answer and not solution_photo:
         logger.warning(f"⚠️  Нет ответа и фото | Пользователь: {user.username}")
-        return Response({
+        return _json_response({
             'error': 'Требуется ответ или фото решения'
-        }, status=status.HTTP_400_BAD_REQUEST)
+        }, status.HTTP_400_BAD_REQUEST)
     
     # Получаем задачу из кеша
     logger.info(f"🔍 Поиск задачи в кеше | cache_key: {problem_id}")
-    problem_data = cache.get(problem_id)
+    problem_data = await cache.aget(problem_id)
     
     if not problem_data:
         logger.error(f"❌ Задача не найдена в кеше | cache_key: {problem_id} | Пользователь: {user.username}")
-        return Response({
+        return _json_response({
             'error': 'Задача не найдена или истекло время',
             'detail': 'Пожалуйста, сгенерируйте новую задачу'
-        }, status=status.HTTP_404_NOT_FOUND)
+        }, status.HTTP_404_NOT_FOUND)
     
     logger.info(f"✅ Задача найдена | Название: '{problem_data.get('title')}' | Правильный ответ: {problem_data.get('correct_answer')}")
     
     try:
-        # Получаем сервис Gemini
-        logger.info(f"🤖 Запуск проверки через Gemini AI")
-        gemini = get_gemini_service()
-        
-        # Проверяем решение через ИИ
-        logger.info(f"🔄 Отправка на проверку | Ответ пользователя: '{submitted_answer}' | Правильный: '{problem_data.get('correct_answer')}'")
-        check_result = gemini.check_solution(
-            problem_data=problem_data,
-            user_answer=submitted_answer,
-            solution_photo=solution_photo.path if solution_photo else None
-        )
-        
-        is_correct = check_result['is_correct']
-        confidence = check_result.get('confidence', 0.9)
-        
-        logger.info(f"✅ Результат проверки | Правильно: {is_correct} | Уверенность: {confidence}")
-        
-        # Определяем очки
-        if solution_photo:
-            points_awarded = 250 if is_correct else 50
-        else:
-            points_awarded = 150 if is_correct else 0
-        
-        # Создаем запись о попытке
-        attempt = UserAttempt.objects.create(
-            user=user,
-            problem=None,  # Нет связи с Problem из БД
-            submitted_answer=submitted_answer or 'Фото решения',
-            is_correct=is_correct,
-            points_awarded=points_awarded,
-            solution_photo=solution_photo,
-            ai_analysis={
-                'gemini_check': check_result,
-                'problem_data': {
-                    'title': problem_data['title'],
-                    'difficulty': problem_data['difficulty_score']
-                }
-            }
-        )
+        check_result = None
         
-        # Обновляем индекс пользователя
-        index_change = user.profile.update_index(
-            problem_data['difficulty_score'],
-            is_correct
-        )
+        # Сначала проверяем локально: точное совпадение, затем SymPy
+        if submitted_answer:
+            check_result = await asyncio.to_thread(
+                check_answer_locally, submitted_answer, problem_data.get('correct_answer', '')
+            )
+            
+            if check_result is None:
+                # Такой же ответ на эту задачу уже проверялся через ИИ
+                check_result = await sync_to_async(get_cached_verdict)(problem_data, submitted_answer)
+                if check_result is not None:
+                    check_result['tier'] = TIER_CACHE
         
-        # Обновляем weekly_score в арене
-        from arena.models import ArenaRank
-        arena_rank, created = ArenaRank.objects.get_or_create(
-            user=user,
-            defaults={
-                'current_index': user.profile.al_khwarizmi_index,
-                'current_division': ArenaRank.get_division_from_index(
-                    user.profile.al_khwarizmi_index
-                )
-            }
-        )
-        if is_correct:
-            arena_rank.weekly_score += points_awarded
-            arena_rank.current_index = user.profile.al_khwarizmi_index
-            arena_rank.current_division = ArenaRank.get_division_from_index(
-                user.profile.al_khwarizmi_index
+        if check_result is None:
+            # Локально не решить (текстовый или символьный ответ) - проверяем через ИИ
+            logger.info(f"🤖 Запуск проверки через Gemini AI")
+            gemini = get_gemini_service()
+            
+            logger.info(f"🔄 Отправка на проверку | Ответ пользователя: '{submitted_answer}' | Правильный: '{problem_data.get('correct_answer')}'")
+            check_result = await asyncio.wait_for(
+                gemini.acheck_solution(
+                    problem_data=problem_data,
+                    user_answer=submitted_answer,
+                    solution_photo=solution_photo.name if solution_photo else None
+                ),
+                timeout=AI_REQUEST_TIMEOUT
             )
-            arena_rank.save()
-            arena_rank.update_rank()  # Обновляем место в рейтинге
+            
+            # Запоминаем вердикт для следующих таких же ответов
+            if submitted_answer:
+                await sync_to_async(store_verdict)(problem_data, submitted_answer, check_result)
+            check_result['tier'] = TIER_GEMINI
         
-        # Формируем ответ
-        response_data = {
-            'is_correct': is_correct,
-            'points_awarded': points_awarded,
-            'index_change': index_change,
-            'new_index': user.profile.al_khwarizmi_index,
-            'correct_answer': problem_data['correct_answer'],
-            'solution_steps': problem_data.get('solution_steps', []),
-            'ai_feedback': check_result.get('feedback', ''),
-            'confidence': confidence,
-            'attempt_id': attempt.id
-        }
+        logger.info(f"✅ Результат проверки | Уровень: {check_result['tier']} | Правильно: {check_result['is_correct']} | Уверенность: {check_result.get('confidence', 0.9)}")
         
-        logger.info(f"💾 Сохранение результата | Пользователь: {user.username} | Очки: {points_awarded} | Изменение индекса: {index_change}")
+        response_data = await sync_to_async(_record_ai_attempt)(
+            user, problem_data, submitted_answer, solution_photo, check_result
+        )
         
-        return Response(response_data, status=status.HTTP_200_OK)
+        return _json_response(response_data)
         
+    except LLMUnavailableError as e:
+        logger.warning(f"🔌 Gemini недоступен для проверки: {e} | Пользователь: {user.username}")
+        return _llm_unavailable_response(e.retry_after)
+    except asyncio.TimeoutError:
+        logger.error(f"⏰ Таймаут проверки решения ({AI_REQUEST_TIMEOUT} сек) | Пользователь: {user.username}")
+        return _json_response({
+            'error': 'Проверка решения заняла слишком много времени. Попробуйте еще раз.'
+        }, status.HTTP_408_REQUEST_TIMEOUT)
     except Exception as e:
         logger.error(f"❌ Ошибка при проверке решения | Пользователь: {user.username} | Ошибка: {str(e)}")
         logger.exception("Полный traceback:")
-        return Response({
+        return _json_response({
             'error': f'Ошибка проверки решения: {str(e)}'
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        }, status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @api_view(['GET'])